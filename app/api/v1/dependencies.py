@@ -1,23 +1,72 @@
-from fastapi import Depends
-from sqlalchemy.ext.asyncio import AsyncSession
+from aiobotocore.client import AioBaseClient
+from fastapi import Request
 
-from app.repository.repository import FileRepository
-from app.repository.session import get_session
+from app.repository.repository import (
+    DerivativeRepository, FileRepository, UploadRepository
+)
+from app.repository.session import async_session
 from app.service.cloud_service import CloudService
+from app.service.derivative_service import DerivativeService
 from app.service.file_service import FileService
+from app.service.presign_service import PresignService
+from app.service.upload_service import UploadService
 
 
 class ServiceTools:
     def __init__(
             self, file_service: FileService,
-            cloud_service: CloudService
+            cloud_service: CloudService,
+            presign_service: PresignService,
+            upload_service: UploadService,
+            derivative_service: DerivativeService
     ):
         self.file_service = file_service
         self.cloud_service = cloud_service
+        self.presign_service = presign_service
+        self.upload_service = upload_service
+        self.derivative_service = derivative_service
 
 
-async def get_tools(session: AsyncSession = Depends(get_session)):
+def build_tools(client: AioBaseClient | None) -> ServiceTools:
+    """
+    Функция создания сервисов приложения
+
+    Аргументы:
+        - client(AioBaseClient | None): клиент S3 приложения
+
+    Возвращает:
+        - ServiceTools: сервисы, общие для всех запросов
+
+    Логика:
+        - Сервисы и репозитории не хранят состояние запроса, поэтому
+            создаются один раз при запуске приложения
+        - Репозитории получают фабрику сессий и берут соединение из пула
+            только на время запроса к БД
+    """
+    file_repository = FileRepository(async_session)
+    cloud_service = CloudService(client)
+    file_service = FileService(file_repository)
     return ServiceTools(
-        file_service=FileService(FileRepository(session)),
-        cloud_service=CloudService(),
+        file_service=file_service,
+        cloud_service=cloud_service,
+        presign_service=PresignService(file_repository, cloud_service),
+        upload_service=UploadService(
+            UploadRepository(async_session), file_service
+        ),
+        derivative_service=DerivativeService(
+            file_repository, DerivativeRepository(async_session)
+        ),
     )
+
+
+async def get_tools(request: Request) -> ServiceTools:
+    """
+    Зависимость для получения сервисов приложения.
+    Без lifespan (например, в тестах) сервисы создаются при первом запросе
+    и пересоздаются, если сменился клиент S3 приложения.
+    """
+    client = getattr(request.app.state, "s3_client", None)
+    tools = getattr(request.app.state, "tools", None)
+    if tools is None or tools.cloud_service.ctx is not client:
+        tools = request.app.state.tools = build_tools(client)
+    return tools
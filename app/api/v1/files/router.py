@@ -1,16 +1,31 @@
 import logging
-from typing import Union
+import mimetypes
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Literal, Union
 from uuid import UUID
 
 from fastapi import (
-    APIRouter, BackgroundTasks, Depends, UploadFile, HTTPException
+    APIRouter, Depends, Query, UploadFile, HTTPException
 )
-from fastapi.responses import JSONResponse, RedirectResponse, FileResponse
+from fastapi.responses import JSONResponse, RedirectResponse, Response
 from starlette.requests import Request
 
 from app.api.v1.dependencies import ServiceTools, get_tools
-from app.service.exceptions import FileNotFound, FileNotFoundLocal
+from app.api.v1.responses import (
+    IMMUTABLE_CACHE_CONTROL, blob_response, negotiate_encoding
+)
+from app.dtos.dto import (
+    FilesBatchIn, PresignedCompleteIn, PresignedUploadIn
+)
+from app.service import codec
+from app.service.exceptions import (
+    CloudObjectNotFound, CloudUnavailable, DerivativeUnsupported,
+    ExtractorBusy, FileNotFound, FileNotFoundLocal, UploadRejected
+)
 from app.settings import settings
+from app.utils.metrics import DOWNLOAD_SECONDS
 
 router = APIRouter(
     prefix="/files"
@@ -24,7 +39,6 @@ logger = logging.getLogger("FileRouter")
 )
 async def create_file(
         file: UploadFile,
-        bg_tasks: BackgroundTasks,
         tools: ServiceTools = Depends(get_tools)
 ):
     """
@@ -32,13 +46,12 @@ async def create_file(
 
     Аргументы:
         *file(UploadFile)*: Файл для загрузки;
-        *bg_tasks(BackgroundTasks)*: Класс для фоновых задач;
         *tools(ServiceTools)*: Класс с сервисами;
 
     Логика:
         - Передаем файл сервису
-        - Получаем от него UID и бинарную строку
-        - Добавляем асинхронную задачу загрузки в S3
+        - Получаем от него UID, задача репликации в S3 ставится
+            в очередь вместе с метаданными
 
     Возвращает:
         - JSONResponse(201): Файл успешно сохранен.
@@ -47,16 +60,9 @@ async def create_file(
         - HTTPException(500): Баг
     """
     try:
-        result: dict[str, Union[str, UUID, bytes]] = (
+        result: dict[str, Union[str, UUID]] = (
             await tools.file_service.create_new_file(file)
         )
-        await tools.cloud_service.session()
-        bg_tasks.add_task(
-            tools.cloud_service.save_file,
-            binary_file=result["binary_file"],
-            key=result["file_key"],
-            mock=settings.DEBUG
-        )
         return JSONResponse(
             {
                 "success": True,
@@ -72,13 +78,61 @@ async def create_file(
         )
 
 
+@router.post(
+    "/bulk", status_code=201,
+    summary="Пакетное добавление новых файлов"
+)
+async def create_files(
+        files: list[UploadFile],
+        tools: ServiceTools = Depends(get_tools)
+):
+    """
+    Функция обработчик запроса на добавление нескольких файлов
+
+    Аргументы:
+        *files(list[UploadFile])*: Файлы для загрузки;
+        *tools(ServiceTools)*: Класс с сервисами;
+
+    Логика:
+        - Передаем файлы сервису, он пишет их на диск параллельно
+        - Метаданные всех файлов сохраняются одной транзакцией
+        - Получаем от него UID в порядке переданных файлов
+
+    Возвращает:
+        - JSONResponse(201): Файлы успешно сохранены.
+
+    Ошибки:
+        - HTTPException(500): Баг
+    """
+    try:
+        results = await tools.file_service.create_new_files(files)
+        return JSONResponse(
+            {
+                "success": True,
+                "files": [
+                    {
+                        "filename": file.filename,
+                        "fileUID": result["file_uid"],
+                    }
+                    for file, result in zip(files, results)
+                ]
+            },
+            status_code=201
+        )
+    except Exception as e:
+        logger.error(str(e))
+        raise HTTPException(
+            status_code=500,
+            detail=str(e)
+        )
+
+
 @router.post(
     "/stream", status_code=201,
     summary="Потоковое добавление нового файла"
 )
 async def stream_file(
         request: Request,
-        bg_tasks: BackgroundTasks,
         tools: ServiceTools = Depends(get_tools)
 ):
     """
@@ -86,33 +140,23 @@ async def stream_file(
 
         Аргументы:
             *request(Request)*: Объект запроса;
-            *bg_tasks(BackgroundTasks)*: Класс для фоновых задач;
             *tools(ServiceTools)*: Класс с сервисами;
 
         Логика:
-            - итерируемся по стриму и собираем бинарную строку
-            - Передаем стоку сервису
-            - Получаем от него UID и бинарную строку
-            - Добавляем асинхронную задачу загрузки в S3
+            - Передаем стрим сервису, он пишет чанки сразу на диск
+            - Получаем от него UID, задача репликации в S3 ставится
+                в очередь вместе с метаданными
 
         Возвращает:
             - JSONResponse(201): Файл успешно сохранен.
 
         Ошибки:
+            - HTTPException(503): Очередь обработки файлов заполнена
             - HTTPException(500): Баг
         """
-    file = b""
-    async for chunk in request.stream():
-        file += chunk
-
     try:
-        result = await tools.file_service.create_new_file_chunk(file)
-        await tools.cloud_service.session()
-        bg_tasks.add_task(
-            tools.cloud_service.save_file,
-            binary_file=result["binary_file"],
-            key=result["file_key"],
-            mock=settings.DEBUG
+        result = await tools.file_service.create_new_file_stream(
+            request.stream()
         )
         return JSONResponse(
             {
@@ -121,12 +165,255 @@ async def stream_file(
             },
             status_code=201
         )
+    except ExtractorBusy as e:
+        logger.warning(str(e))
+        raise HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(str(e))
+        raise HTTPException(
+            status_code=500,
+            detail=str(e)
+        )
+
+
+@router.post(
+    "/batch", status_code=200,
+    summary="Пакетное получение метаданных файлов"
+)
+async def get_files_batch(
+        batch: FilesBatchIn,
+        tools: ServiceTools = Depends(get_tools),
+):
+    """
+    Функция обработчик запроса на получение метаданных нескольких файлов.
+
+    Аргументы:
+        *batch(FilesBatchIn)*: Список UID;
+        *tools(ServiceTools)*: Объект с сервисами;
+
+    Логика:
+        - Получаем метаданные всех файлов одним запросом к БД
+
+    Возвращает:
+        - JSONResponse(200): метаданные, наличие локально, ссылка в облаке
+            и список ненайденных UID
+
+    Ошибки:
+        HTTPException(500): Баг
+    """
+    try:
+        files, not_found = await tools.file_service.get_files_metadata(
+            batch.uids
+        )
+        return JSONResponse(
+            {
+                "files": files,
+                "notFound": [str(uid) for uid in not_found],
+            },
+            status_code=200
+        )
+    except Exception as e:
+        logger.error(str(e))
+        raise HTTPException(
+            status_code=500,
+            detail=str(e)
+        )
+
+
+@router.post(
+    "/presigned", status_code=201,
+    summary="Ссылка для загрузки файла напрямую в облако"
+)
+async def create_presigned_upload(
+        upload: PresignedUploadIn,
+        tools: ServiceTools = Depends(get_tools),
+):
+    """
+    Функция обработчик запроса ссылки для загрузки файла в облако.
+
+    Аргументы:
+        *upload(PresignedUploadIn)*: Имя, размер, тип и способ загрузки
+            (put, post или multipart);
+        *tools(ServiceTools)*: Объект с сервисами;
+
+    Логика:
+        - Выдаем UID и подписанные ссылки, клиент загружает файл
+            в облако сам, после чего вызывает /files/presigned/complete
+
+    Возвращает:
+        - JSONResponse(201): UID, ключ и ссылки для загрузки
+
+    Ошибки:
+        HTTPException(400, 503, 500): Загрузка отклонена,
+            Облако не настроено, Баг
+    """
+    try:
+        result = await tools.presign_service.create_upload(upload)
+    except UploadRejected as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except CloudUnavailable as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(str(e))
+        raise HTTPException(
+            status_code=500,
+            detail=str(e)
+        )
+    response = {
+        "fileUID": result["file_uid"],
+        "key": result["key"],
+        "method": result["method"],
+        "expiresIn": result["expires_in"],
+    }
+    if "url" in result:
+        response["url"] = result["url"]
+    if "fields" in result:
+        response["fields"] = result["fields"]
+    if "upload_id" in result:
+        response["uploadId"] = result["upload_id"]
+        response["partSize"] = result["part_size"]
+        response["parts"] = [
+            {"partNumber": part["part_number"], "url": part["url"]}
+            for part in result["parts"]
+        ]
+    return JSONResponse(response, status_code=201)
+
+
+@router.post(
+    "/presigned/complete", status_code=201,
+    summary="Завершение загрузки файла напрямую в облако"
+)
+async def complete_presigned_upload(
+        upload: PresignedCompleteIn,
+        tools: ServiceTools = Depends(get_tools),
+):
+    """
+    Функция обработчик завершения загрузки файла в облако.
+
+    Аргументы:
+        *upload(PresignedCompleteIn)*: UID, ключ, имя файла
+            и части multipart загрузки;
+        *tools(ServiceTools)*: Объект с сервисами;
+
+    Логика:
+        - Завершаем multipart загрузку, читаем размер объекта из облака
+            и сохраняем файл в БД. Повторный вызов безопасен
+
+    Возвращает:
+        - JSONResponse(201): Файл сохранен
+
+    Ошибки:
+        HTTPException(400, 404, 503, 500): Неверный ключ или части,
+            Объекта нет в облаке, Облако не настроено, Баг
+    """
+    try:
+        result = await tools.presign_service.complete_upload(upload)
+        return JSONResponse(
+            {
+                "success": True,
+                "fileUID": result["file_uid"],
+                "size": result["size"],
+            },
+            status_code=201
+        )
+    except UploadRejected as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except CloudObjectNotFound as e:
+        raise HTTPException(
+            status_code=404,
+            detail=str(e)
+        )
+    except CloudUnavailable as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(str(e))
+        raise HTTPException(
+            status_code=500,
+            detail=str(e)
+        )
+
+
+@router.head(
+    "/{uid}", status_code=200,
+    summary="Метаданные файла в заголовках"
+)
+async def head_file(
+        uid: UUID,
+        request: Request,
+        tools: ServiceTools = Depends(get_tools),
+):
+    """
+    Функция обработчик HEAD запроса к файлу.
+
+    Аргументы:
+        *uid(UUID)*: Уникальный UID файла;
+        *request(Request)*: Объект запроса;
+        *tools(ServiceTools)*: Объект с сервисами;
+
+    Логика:
+        - Отвечаем по метаданным из БД, файл не открывается
+        - ETag, Vary и Content-Encoding выбираются по Accept-Encoding
+            так же, как при GET. Для сжатого ответа Content-Length -
+            размер файла на диске
+
+    Возвращает:
+        - Response(200): Content-Length, Content-Type, Last-Modified,
+            ETag, Cache-Control и X-File-Location (local или cloud)
+
+    Ошибки:
+        HTTPException(500, 404): Баг, Файл не найден
+    """
+    try:
+        meta = await tools.file_service.get_file_metadata(uid)
+    except FileNotFound as e:
+        raise HTTPException(
+            status_code=404,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(str(e))
         raise HTTPException(
             status_code=500,
             detail=str(e)
         )
+    media_type, _ = mimetypes.guess_type(f"file.{meta['extension']}")
+    created_at = datetime.fromisoformat(meta["createdAt"])
+    headers = {
+        "content-length": str(meta["size"] or 0),
+        "content-type": media_type or "application/octet-stream",
+        "last-modified": format_datetime(
+            created_at.astimezone(timezone.utc), usegmt=True
+        ),
+        "cache-control": IMMUTABLE_CACHE_CONTROL,
+        "x-file-location": "local" if meta["local"] else "cloud",
+    }
+    if meta["local"]:
+        headers["accept-ranges"] = "bytes"
+    negotiated, decode = negotiate_encoding(
+        meta["contentHash"] or meta["uid"],
+        meta["encoding"] or codec.IDENTITY, request.headers
+    )
+    headers.update(negotiated)
+    if "content-encoding" in negotiated and meta["local"]:
+        headers["content-length"] = str(meta["storedSize"])
+    elif decode and meta["local"]:
+        headers["accept-ranges"] = "none"
+    return Response(status_code=200, headers=headers)
 
 
 @router.get(
@@ -135,6 +422,7 @@ async def stream_file(
 )
 async def get_file(
         uid: UUID,
+        request: Request,
         download: bool = False,
         tools: ServiceTools = Depends(get_tools),
 ):
@@ -143,15 +431,22 @@ async def get_file(
 
     Аргументы:
         *uid(UUID)*: Уникальный UID файла;
+        *request(Request)*: Объект запроса;
         *download(bool)*: Флаг нужно ли загружать файл;
         *tools(ServiceTools)*: Объект с сервисами;
 
     Логика:
         - Получаем путь до файла и его название
+        - Если файла нет локально, перенаправляем в облако: на подписанную
+            ссылку при S3_PRESIGN_DOWNLOADS, иначе на S3_PUBLIC_URL
+        - Файл по UID не меняется, поэтому отдаем его с сильным ETag
+            и неизменяемым Cache-Control, поддерживаем Range
+            и If-None-Match/If-Modified-Since
 
     Возвращает:
-        - FileResponse(200): файл
-        - RedirectResponse(308): из облака
+        - BlobResponse(200, 206, 304, 416): файл, его часть,
+            не изменился, диапазон за пределами файла
+        - RedirectResponse(307, 308): из облака
 
     Ошибки:
         HTTPException(500, 404): Баг, Файл не найден локально илл в облаке
@@ -159,28 +454,42 @@ async def get_file(
     PS. В обработку исключения, что файл не найден добавлена
     логика получения файла из облака.
     """
+    started = time.perf_counter()
     try:
         path: dict[str, str] = await tools.file_service.get_file_by_uid_local(
             uid
         )
         logger.info("Файл найден")
-        # if download
-        return FileResponse(
+        response = await blob_response(
             path["path"],
+            request.headers,
             filename=path["filename"] if download else None,
             media_type="application/octet-stream" if download else None,
         )
-    except FileNotFoundLocal:
+        DOWNLOAD_SECONDS.observe(time.perf_counter() - started, path="local")
+        return response
+    except (FileNotFoundLocal, FileNotFoundError):
         logger.warning(
             "Файл не найден локально. Попытка получить копию из облака"
         )
         try:
-            link = await tools.file_service.get_file_by_uid_cloud(
-                uid
+            if settings.S3_PRESIGN_DOWNLOADS:
+                # Ссылка временная, поэтому редирект не постоянный
+                link = await tools.presign_service.get_download_url(
+                    uid, download
+                )
+                status_code = 307
+            else:
+                link = await tools.file_service.get_file_by_uid_cloud(
+                    uid
+                )
+                status_code = 308
+            DOWNLOAD_SECONDS.observe(
+                time.perf_counter() - started, path="cloud"
             )
             return RedirectResponse(
                 link,
-                status_code=308,
+                status_code=status_code,
                 headers={
                     "content_type": "application/octet-stream"
                 } if download else None
@@ -196,3 +505,179 @@ async def get_file(
             status_code=500,
             detail=str(e)
         )
+
+
+@router.get(
+    "/{uid}/url", status_code=200,
+    summary="Подписанная ссылка на файл в облаке"
+)
+async def get_file_url(
+        uid: UUID,
+        download: bool = False,
+        tools: ServiceTools = Depends(get_tools),
+):
+    """
+    Функция обработчик запроса подписанной ссылки на файл.
+
+    Аргументы:
+        *uid(UUID)*: Уникальный UID файла;
+        *download(bool)*: Флаг нужно ли загружать файл;
+        *tools(ServiceTools)*: Объект с сервисами;
+
+    Возвращает:
+        - JSONResponse(200): ссылка и время ее жизни в секундах
+
+    Ошибки:
+        HTTPException(404, 503, 500): Файл не найден, Облако не настроено,
+            Баг
+    """
+    try:
+        url = await tools.presign_service.get_download_url(uid, download)
+        return JSONResponse(
+            {
+                "fileUID": str(uid),
+                "url": url,
+                "expiresIn": settings.S3_PRESIGN_EXPIRES,
+            },
+            status_code=200
+        )
+    except FileNotFound as e:
+        raise HTTPException(
+            status_code=404,
+            detail=str(e)
+        )
+    except CloudUnavailable as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(str(e))
+        raise HTTPException(
+            status_code=500,
+            detail=str(e)
+        )
+
+
+@router.get(
+    "/{uid}/derivative", status_code=200,
+    summary="Уменьшенная копия изображения"
+)
+async def get_derivative(
+        uid: UUID,
+        request: Request,
+        width: int | None = Query(None, ge=1, le=settings.DERIVATIVE_MAX_SIZE),
+        height: int | None = Query(None, ge=1, le=settings.DERIVATIVE_MAX_SIZE),
+        format: Literal["jpeg", "png", "webp"] = "webp",
+        quality: int | None = Query(None, ge=1, le=100),
+        tools: ServiceTools = Depends(get_tools),
+):
+    """
+    Функция обработчик запроса уменьшенной копии изображения.
+
+    Аргументы:
+        *uid(UUID)*: Уникальный UID исходного файла;
+        *request(Request)*: Объект запроса;
+        *width(int | None)*: Максимальная ширина;
+        *height(int | None)*: Максимальная высота;
+        *format(str)*: Формат копии: jpeg, png или webp;
+        *quality(int | None)*: Качество jpeg и webp;
+        *tools(ServiceTools)*: Объект с сервисами;
+
+    Логика:
+        - Копия вписывается в width x height с сохранением пропорций
+        - Копия создается при первом запросе в пуле воркеров, хранится
+            на диске и реплицируется в облако. Дальше отдается как обычный
+            файл: с ETag, Range и неизменяемым Cache-Control
+
+    Возвращает:
+        - BlobResponse(200, 206, 304): копия
+        - RedirectResponse(308): копия в облаке
+
+    Ошибки:
+        HTTPException(400, 404, 503, 500): Не указан размер или файл
+            не изображение, Файл не найден, Пул занят, Баг
+    """
+    started = time.perf_counter()
+    try:
+        derivative = await tools.derivative_service.get_derivative(
+            uid, width, height, format, quality
+        )
+        if "cloud_url" in derivative:
+            response = RedirectResponse(
+                derivative["cloud_url"], status_code=308
+            )
+        else:
+            response = await blob_response(derivative["path"], request.headers)
+        DOWNLOAD_SECONDS.observe(
+            time.perf_counter() - started, path="derivative"
+        )
+        return response
+    except DerivativeUnsupported as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except (FileNotFound, FileNotFoundLocal) as e:
+        raise HTTPException(
+            status_code=404,
+            detail=str(e)
+        )
+    except ExtractorBusy as e:
+        logger.warning(str(e))
+        raise HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(str(e))
+        raise HTTPException(
+            status_code=500,
+            detail=str(e)
+        )
+
+
+@router.get(
+    "/{uid}/replication", status_code=200,
+    summary="Состояние репликации файла в облако"
+)
+async def get_replication_state(
+        uid: UUID,
+        tools: ServiceTools = Depends(get_tools),
+):
+    """
+    Функция обработчик запроса на получение состояния репликации.
+
+    Аргументы:
+        *uid(UUID)*: Уникальный UID файла;
+        *tools(ServiceTools)*: Объект с сервисами;
+
+    Возвращает:
+        - JSONResponse(200): состояние (pending, in_progress, done, failed),
+            кол-во попыток и последняя ошибка
+
+    Ошибки:
+        HTTPException(500, 404): Баг, Файл не найден
+    """
+    try:
+        state = await tools.file_service.get_replication_state(uid)
+        return JSONResponse(
+            {
+                "fileUID": str(uid),
+                "state": state["state"],
+                "attempts": state["attempts"],
+                "lastError": state["last_error"],
+            },
+            status_code=200
+        )
+    except FileNotFound as e:
+        raise HTTPException(
+            status_code=404,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(str(e))
+        raise HTTPException(
+            status_code=500,
+            detail=str(e)
+        )
@@ -0,0 +1,389 @@
+import asyncio
+import mimetypes
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import AsyncIterator, Mapping
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Message, Receive, Scope, Send
+
+from app.service import codec
+from app.service.blob_cache import blob_cache
+from app.utils.metrics import BYTES_SENT
+
+# Файлы адресуются UID или хэшем содержимого и не меняются
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def strong_etag(value: str) -> str:
+    """Сильный ETag из хэша содержимого или UID"""
+    return f'"{value}"'
+
+
+def blob_etag(path: str, encoding: str = codec.IDENTITY) -> str:
+    """
+    ETag файла хранилища
+
+    Аргументы:
+        - path(str): путь до файла
+        - encoding(str): кодек, которым сжат ответ
+
+    Логика:
+        - Имя файла - хэш содержимого (или UID для файлов до
+            дедупликации), поэтому ETag берется из имени без чтения файла
+        - Сжатый ответ - другое представление, и у него свой ETag
+    """
+    name = os.path.basename(path).split(".", 1)[0]
+    if encoding != codec.IDENTITY:
+        name = f"{name}-{encoding}"
+    return strong_etag(name)
+
+
+def negotiate_encoding(
+        path: str, encoding: str, request_headers: Mapping[str, str]
+) -> tuple[dict[str, str], bool]:
+    """
+    Выбор представления файла по Accept-Encoding
+
+    Аргументы:
+        - path(str): путь до файла или его имя без расширения
+        - encoding(str): кодек, которым сжат файл
+        - request_headers(Mapping[str, str]): заголовки запроса
+
+    Возвращает:
+        - tuple[dict[str, str], bool]: заголовки ETag, Vary
+            и Content-Encoding и нужно ли распаковать файл для клиента
+
+    Логика:
+        - Сжатый файл отдается как есть, если клиент принимает кодек,
+            иначе распаковывается. Ответ зависит от Accept-Encoding,
+            поэтому добавляется Vary
+    """
+    if encoding == codec.IDENTITY:
+        return {"etag": blob_etag(path)}, False
+    headers = {"vary": "accept-encoding"}
+    if codec.accepts(request_headers.get("accept-encoding"), encoding):
+        headers["etag"] = blob_etag(path, encoding)
+        headers["content-encoding"] = encoding
+        return headers, False
+    headers["etag"] = blob_etag(path)
+    return headers, True
+
+
+def is_not_modified(
+        request_headers: Mapping[str, str], etag: str, last_modified: datetime
+) -> bool:
+    """
+    Проверка условного запроса
+
+    Аргументы:
+        - request_headers(Mapping[str, str]): заголовки запроса
+        - etag(str): ETag файла
+        - last_modified(datetime): время изменения файла
+
+    Возвращает:
+        - bool: можно ли ответить 304
+
+    Логика:
+        - If-None-Match важнее If-Modified-Since (RFC 9110)
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+        ]
+        return "*" in tags or etag in tags
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def parse_range(
+        request_headers: Mapping[str, str], etag: str, size: int
+) -> tuple[int, int] | None:
+    """
+    Разбор заголовка Range
+
+    Аргументы:
+        - request_headers(Mapping[str, str]): заголовки запроса
+        - etag(str): ETag файла для проверки If-Range
+        - size(int): размер файла
+
+    Возвращает:
+        - tuple[int, int] | None: первый и последний байт диапазона
+            или None, если нужно отдать файл целиком
+
+    Логика:
+        - Поддерживается один диапазон: bytes=a-b, bytes=a-, bytes=-n.
+            Несколько диапазонов и неизвестные единицы игнорируются,
+            отдается весь файл
+        - Если If-Range не совпадает с ETag, отдается весь файл
+
+    Ошибки:
+        - ValueError: диапазон за пределами файла (416)
+    """
+    header = request_headers.get("range")
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    if_range = request_headers.get("if-range")
+    if if_range is not None and if_range.strip() != etag:
+        return None
+
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            start = max(0, size - int(last))
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise ValueError(f"Диапазон {header} за пределами файла {size}")
+    if start < 0 or start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+class BlobResponse(Response):
+    """
+    Ответ файлом или его диапазоном
+
+    Отдает файл с ETag, Last-Modified и неизменяемым Cache-Control,
+    отвечает 304 на условные запросы, 206 на Range и 416 на
+    диапазон за пределами файла.
+
+    Сжатый файл отдается как есть с Content-Encoding, если клиент
+    принимает кодек, иначе распаковывается на лету без Range.
+    """
+    chunk_size = 64 * 1024
+    media_type = None
+
+    def __init__(
+            self,
+            path: str,
+            stat_result: os.stat_result,
+            request_headers: Mapping[str, str],
+            filename: str | None = None,
+            media_type: str | None = None,
+            data: bytes | None = None,
+    ):
+        """
+        Инициализация
+
+        Аргументы:
+            - path(str): путь до файла
+            - stat_result(os.stat_result): результат stat файла
+            - request_headers(Mapping[str, str]): заголовки запроса
+            - filename(str | None): имя для Content-Disposition
+            - media_type(str | None): тип, по умолчанию по расширению
+            - data(bytes | None): содержимое файла из кэша, тогда файл
+                не открывается
+        """
+        self.path = path
+        self.data = data
+        self.decoder = None
+        self.background = None
+        self.start, self.length = 0, 0
+        size = stat_result.st_size
+        last_modified = datetime.fromtimestamp(
+            stat_result.st_mtime, tz=timezone.utc
+        )
+        if media_type is None:
+            media_type = (
+                mimetypes.guess_type(filename or codec.strip_encoding(path))[0]
+                or "application/octet-stream"
+            )
+        headers = {
+            "last-modified": format_datetime(last_modified, usegmt=True),
+            "cache-control": IMMUTABLE_CACHE_CONTROL,
+            "accept-ranges": "bytes",
+        }
+        encoding = codec.encoding_of(path)
+        negotiated, decode = negotiate_encoding(
+            path, encoding, request_headers
+        )
+        headers.update(negotiated)
+        etag = headers["etag"]
+        if decode:
+            self.decoder = codec.decoder(encoding)
+            headers["accept-ranges"] = "none"
+        if filename is not None:
+            headers["content-disposition"] = (
+                f'attachment; filename="{filename}"'
+            )
+
+        if is_not_modified(request_headers, etag, last_modified):
+            self.status_code = 304
+            self.init_headers(headers)
+            return
+        if self.decoder is not None:
+            # Размер после распаковки заранее неизвестен
+            self.status_code = 200
+            self.length = size
+            headers["content-type"] = media_type
+            self.init_headers(headers)
+            return
+        try:
+            byte_range = parse_range(request_headers, etag, size)
+        except ValueError:
+            self.status_code = 416
+            headers["content-range"] = f"bytes */{size}"
+            headers["content-length"] = "0"
+            self.init_headers(headers)
+            return
+
+        if byte_range is None:
+            self.status_code = 200
+            self.length = size
+        else:
+            self.status_code = 206
+            self.start = byte_range[0]
+            self.length = byte_range[1] - byte_range[0] + 1
+            headers["content-range"] = (
+                f"bytes {byte_range[0]}-{byte_range[1]}/{size}"
+            )
+        headers["content-type"] = media_type
+        headers["content-length"] = str(self.length)
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        send = self.__counting(send)
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if scope["method"].upper() == "HEAD" or not self.length:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        if self.decoder is not None:
+            await self.__send_decoded(send)
+            return
+        if self.data is not None:
+            await send({
+                "type": "http.response.body",
+                "body": self.data[self.start:self.start + self.length],
+            })
+            return
+        remaining = self.length
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": remaining > 0,
+                })
+        if remaining > 0:
+            # Файл стал короче, чем при stat. Закрываем ответ
+            await send({"type": "http.response.body", "body": b""})
+
+    def __counting(self, send: Send) -> Send:
+        """Обертка send, считающая отданные байты для метрик"""
+        source = "cache" if self.data is not None else "disk"
+
+        async def wrapper(message: Message) -> None:
+            if message["type"] == "http.response.body" and message["body"]:
+                BYTES_SENT.inc(len(message["body"]), source=source)
+            await send(message)
+        return wrapper
+
+    async def __send_decoded(self, send: Send) -> None:
+        """Отправка распакованного файла по мере чтения чанков"""
+        async def read() -> AsyncIterator[bytes]:
+            if self.data is not None:
+                for offset in range(0, len(self.data), self.chunk_size):
+                    yield self.data[offset:offset + self.chunk_size]
+                return
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                while chunk := await file.read(self.chunk_size):
+                    yield chunk
+
+        async for chunk in read():
+            body = self.decoder.decompress(chunk)
+            if body:
+                await send({
+                    "type": "http.response.body",
+                    "body": body,
+                    "more_body": True,
+                })
+        await send({"type": "http.response.body", "body": self.decoder.flush()})
+
+
+async def blob_response(
+        path: str,
+        request_headers: Mapping[str, str],
+        filename: str | None = None,
+        media_type: str | None = None,
+) -> BlobResponse:
+    """
+    Ответ файлом хранилища с поддержкой Range и условных запросов
+
+    Аргументы:
+        - path(str): путь до файла
+        - request_headers(Mapping[str, str]): заголовки запроса
+        - filename(str | None): имя для Content-Disposition
+        - media_type(str | None): тип, по умолчанию по расширению
+
+    Логика:
+        - Небольшие популярные файлы отдаются из blob_cache без
+            обращения к диску
+
+    Ошибки:
+        - FileNotFoundError: файла нет на диске
+    """
+    cached = blob_cache.get(path)
+    if cached is not None:
+        stat_result, data = cached
+    else:
+        stat_result = await asyncio.to_thread(os.stat, path)
+        data = await blob_cache.load(path, stat_result)
+    return BlobResponse(
+        path, stat_result, request_headers,
+        filename=filename, media_type=media_type, data=data,
+    )
+
+
+class BlobStaticFiles(StaticFiles):
+    """
+    StaticFiles с Range, сильным ETag и неизменяемым Cache-Control.
+    Скрытые файлы и папки (имя с точки) не отдаются.
+    """
+    def lookup_path(self, path: str) -> tuple[str, os.stat_result | None]:
+        if any(part.startswith(".") for part in path.split(os.sep)):
+            return "", None
+        return super().lookup_path(path)
+
+    def file_response(
+            self,
+            full_path: str,
+            stat_result: os.stat_result,
+            scope: Scope,
+            status_code: int = 200,
+    ) -> Response:
+        if status_code != 200:
+            return super().file_response(
+                full_path, stat_result, scope, status_code
+            )
+        cached = blob_cache.get(str(full_path))
+        return BlobResponse(
+            str(full_path), stat_result, Headers(scope=scope),
+            data=cached[1] if cached is not None else None,
+        )
@@ -0,0 +1,221 @@
+import logging
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse, Response
+from starlette.requests import Request
+
+from app.api.v1.dependencies import ServiceTools, get_tools
+from app.dtos.dto import UploadSessionIn
+from app.service.exceptions import (
+    UploadConflict, UploadNotFound, UploadRejected
+)
+
+router = APIRouter(
+    prefix="/uploads"
+)
+logger = logging.getLogger("UploadRouter")
+
+
+def upload_json(upload: dict) -> dict:
+    """Состояние сессии загрузки в формате ответа"""
+    return {
+        "uploadId": upload["upload_id"],
+        "filename": upload["filename"],
+        "size": upload["size"],
+        "partSize": upload["part_size"],
+        "partsCount": upload["parts_count"],
+        "state": upload["state"],
+        "fileUID": upload["file_uid"],
+        "receivedParts": upload["received_parts"],
+        "receivedRanges": upload["received_ranges"],
+        "receivedBytes": upload["received_bytes"],
+        "expiresAt": upload["expires_at"],
+    }
+
+
+def upload_error(e: Exception) -> HTTPException:
+    """Ошибка сервиса загрузки в HTTPException"""
+    if isinstance(e, UploadNotFound):
+        return HTTPException(status_code=404, detail=str(e))
+    if isinstance(e, UploadConflict):
+        return HTTPException(status_code=409, detail=str(e))
+    if isinstance(e, UploadRejected):
+        return HTTPException(status_code=400, detail=str(e))
+    logger.error(str(e))
+    return HTTPException(status_code=500, detail=str(e))
+
+
+@router.post(
+    "/", status_code=201,
+    summary="Создание сессии загрузки файла по частям"
+)
+async def create_upload(
+        upload: UploadSessionIn,
+        tools: ServiceTools = Depends(get_tools),
+):
+    """
+    Функция обработчик запроса на создание сессии загрузки.
+
+    Аргументы:
+        *upload(UploadSessionIn)*: Имя, размер файла и размер части;
+        *tools(ServiceTools)*: Объект с сервисами;
+
+    Логика:
+        - Создаем сессию и временный файл нужного размера
+        - Клиент загружает части PUT /uploads/{id}/parts/{n} в любом
+            порядке и параллельно, затем вызывает POST /uploads/{id}/complete
+
+    Возвращает:
+        - JSONResponse(201): ID сессии, размер и кол-во частей
+
+    Ошибки:
+        HTTPException(400, 500): Слишком много частей, Баг
+    """
+    try:
+        result = await tools.upload_service.create_upload(upload)
+        return JSONResponse(upload_json(result), status_code=201)
+    except Exception as e:
+        raise upload_error(e)
+
+
+@router.get(
+    "/{upload_id}", status_code=200,
+    summary="Состояние сессии загрузки"
+)
+async def get_upload(
+        upload_id: UUID,
+        tools: ServiceTools = Depends(get_tools),
+):
+    """
+    Функция обработчик запроса состояния сессии загрузки.
+
+    Аргументы:
+        *upload_id(UUID)*: ID сессии;
+        *tools(ServiceTools)*: Объект с сервисами;
+
+    Возвращает:
+        - JSONResponse(200): полученные части и диапазоны байт,
+            по ним клиент возобновляет загрузку
+
+    Ошибки:
+        HTTPException(404, 500): Сессия не найдена, Баг
+    """
+    try:
+        result = await tools.upload_service.get_upload(upload_id)
+        return JSONResponse(upload_json(result), status_code=200)
+    except Exception as e:
+        raise upload_error(e)
+
+
+@router.put(
+    "/{upload_id}/parts/{part_number}", status_code=200,
+    summary="Загрузка части файла"
+)
+async def upload_part(
+        upload_id: UUID,
+        part_number: int,
+        request: Request,
+        tools: ServiceTools = Depends(get_tools),
+):
+    """
+    Функция обработчик загрузки части файла.
+
+    Аргументы:
+        *upload_id(UUID)*: ID сессии;
+        *part_number(int)*: Номер части с 1;
+        *request(Request)*: Объект запроса, тело - байты части;
+        *tools(ServiceTools)*: Объект с сервисами;
+
+    Логика:
+        - Пишем тело запроса сразу на место части во временном файле
+
+    Возвращает:
+        - JSONResponse(200): номер и размер части
+
+    Ошибки:
+        HTTPException(400, 404, 409, 500): Неверный номер или размер части,
+            Сессия не найдена, Сессия завершена, Баг
+    """
+    try:
+        result = await tools.upload_service.write_part(
+            upload_id, part_number, request.stream()
+        )
+        return JSONResponse(
+            {
+                "partNumber": result["part_number"],
+                "size": result["size"],
+            },
+            status_code=200
+        )
+    except Exception as e:
+        raise upload_error(e)
+
+
+@router.post(
+    "/{upload_id}/complete", status_code=201,
+    summary="Завершение загрузки по частям"
+)
+async def complete_upload(
+        upload_id: UUID,
+        tools: ServiceTools = Depends(get_tools),
+):
+    """
+    Функция обработчик завершения загрузки.
+
+    Аргументы:
+        *upload_id(UUID)*: ID сессии;
+        *tools(ServiceTools)*: Объект с сервисами;
+
+    Логика:
+        - Когда все начатые части записаны, файл сессии на месте, без
+            копирования, становится обычным файлом, задача репликации
+            в S3 ставится в очередь. Повторный вызов возвращает тот же UID
+
+    Возвращает:
+        - JSONResponse(201): Файл успешно сохранен
+
+    Ошибки:
+        HTTPException(404, 409, 500): Сессия не найдена,
+            Не все части получены, Баг
+    """
+    try:
+        result = await tools.upload_service.complete_upload(upload_id)
+        return JSONResponse(
+            {
+                "success": True,
+                "fileUID": result["file_uid"]
+            },
+            status_code=201
+        )
+    except Exception as e:
+        raise upload_error(e)
+
+
+@router.delete(
+    "/{upload_id}", status_code=204,
+    summary="Отмена загрузки по частям"
+)
+async def abort_upload(
+        upload_id: UUID,
+        tools: ServiceTools = Depends(get_tools),
+):
+    """
+    Функция обработчик отмены загрузки.
+
+    Аргументы:
+        *upload_id(UUID)*: ID сессии;
+        *tools(ServiceTools)*: Объект с сервисами;
+
+    Возвращает:
+        - Response(204): Сессия удалена
+
+    Ошибки:
+        HTTPException(404, 409, 500): Сессия не найдена, Сессия завершена,
+            Баг
+    """
+    try:
+        await tools.upload_service.abort_upload(upload_id)
+        return Response(status_code=204)
+    except Exception as e:
+        raise upload_error(e)
@@ -1,6 +1,9 @@
+from typing import Any, Literal
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from app.settings import settings
 
 
 class FileIn(BaseModel):
@@ -11,3 +14,41 @@ class FileIn(BaseModel):
     size: int | None = None
     local_path: str | None = None
     cloud_path: str | None = None
+    content_hash: str | None = None
+    encoding: str = "identity"
+    meta: dict[str, Any] | None = None
+
+
+class FilesBatchIn(BaseModel):
+    """Объект со списком UID для пакетного получения метаданных"""
+    uids: list[UUID] = Field(min_length=1, max_length=settings.BATCH_MAX_UIDS)
+
+
+class PresignedUploadIn(BaseModel):
+    """Объект запроса ссылки для загрузки файла напрямую в облако"""
+    filename: str = Field(min_length=1, max_length=255)
+    size: int = Field(gt=0, le=settings.S3_PRESIGN_MAX_SIZE)
+    content_type: str | None = None
+    method: Literal["put", "post", "multipart"] = "put"
+
+
+class UploadedPartIn(BaseModel):
+    """Объект загруженной части multipart загрузки"""
+    part_number: int = Field(ge=1, le=10000)
+    etag: str
+
+
+class PresignedCompleteIn(BaseModel):
+    """Объект завершения загрузки файла напрямую в облако"""
+    uid: UUID
+    key: str
+    filename: str | None = None
+    upload_id: str | None = None
+    parts: list[UploadedPartIn] | None = None
+
+
+class UploadSessionIn(BaseModel):
+    """Объект создания сессии загрузки файла по частям"""
+    filename: str = Field(min_length=1, max_length=255)
+    size: int = Field(gt=0, le=settings.UPLOAD_MAX_SIZE)
+    part_size: int | None = Field(default=None, ge=64 * 1024)
@@ -1,23 +1,57 @@
+import logging
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, JSONResponse
-from starlette.staticfiles import StaticFiles
-
+from fastapi.responses import RedirectResponse, JSONResponse, Response
+from app.api.v1.dependencies import build_tools
 from app.api.v1.files.router import router
+from app.api.v1.uploads.router import router as uploads_router
+from app.api.v1.responses import BlobStaticFiles
+from app.repository.cache import path_cache
 from app.repository.models import create_table
+from app.repository.repository import ReplicationRepository
+from app.repository.session import POOL_MAX_OVERFLOW, async_session, engine
+from app.service.blob_cache import blob_cache
+from app.service.cloud_service import s3_client
+from app.service.derivative_service import derivative_renderer
+from app.service.meta_extractor import extractor_pool
+from app.service.replication_service import ReplicationService
 from app.settings import settings
+from app.utils.log import stop_logging
+from app.utils.metrics import (
+    BACKLOG, CACHE, DB_POOL, DB_POOL_UTILIZATION, metrics
+)
+
+logger = logging.getLogger("Main")
 
 
 @asynccontextmanager
-async def lifespan(_: FastAPI):
-    """Функция инициализатор компонентов приложения"""
+async def lifespan(app: FastAPI):
+    """
+    Функция инициализатор компонентов приложения.
+    Остановка выполняется в finally: ошибка на одном шаге не мешает
+    остановить воркеры репликации, пул, клиент S3 и поток логов.
+    """
     await create_table()
     settings.setup_architecture()
     settings.setup_logging()
-    yield
+    try:
+        async with s3_client() as client:
+            app.state.s3_client = client
+            app.state.tools = build_tools(client)
+            replication = ReplicationService(client)
+            replication.start()
+            try:
+                yield
+            finally:
+                try:
+                    await derivative_renderer.stop()
+                finally:
+                    await replication.stop()
+    finally:
+        extractor_pool.shutdown()
+        stop_logging()
 
 
 app = FastAPI(
@@ -30,8 +64,9 @@ app.add_middleware(
     **settings.cors_middleware_config
 )
 
-app.mount("/static", StaticFiles(directory="./static"), name="static")
+app.mount("/static", BlobStaticFiles(directory="./static"), name="static")
 app.include_router(router)
+app.include_router(uploads_router)
 
 
 @app.get("/")
@@ -42,5 +77,52 @@ async def root():
 
 @app.get("/health")
 async def health():
-    """Проверка состояния приложения"""
-    return JSONResponse({"status": "ok"}, status_code=200)
+    """Проверка состояния приложения и статистика кэшей"""
+    return JSONResponse(
+        {
+            "status": "ok",
+            "path_cache": path_cache.stats(),
+            "blob_cache": blob_cache.stats(),
+            "derivatives": derivative_renderer.stats(),
+        },
+        status_code=200
+    )
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Метрики в текстовом формате Prometheus
+
+    Логика:
+        - Гистограммы этапов и счетчики копятся по ходу работы
+        - Состояние пула БД, очередей и кэшей снимается при запросе
+        - Если БД недоступна, очередь репликации не обновляется,
+            остальные метрики отдаются
+    """
+    pool = engine.pool
+    checked_out = pool.checkedout()
+    DB_POOL.set(pool.size(), state="size")
+    DB_POOL.set(checked_out, state="checked_out")
+    DB_POOL.set(pool.checkedin(), state="idle")
+    DB_POOL.set(max(pool.overflow(), 0), state="overflow")
+    DB_POOL_UTILIZATION.set(checked_out / (pool.size() + POOL_MAX_OVERFLOW))
+
+    try:
+        backlog = await ReplicationRepository(async_session).count_backlog()
+        for state in ("pending", "in_progress", "failed"):
+            BACKLOG.set(backlog.get(state, 0), queue=f"replication_{state}")
+    except Exception as e:
+        logger.warning("Не удалось получить очередь репликации: %s", e)
+    BACKLOG.set(extractor_pool.pending, queue="worker_pool")
+    BACKLOG.set(derivative_renderer.stats()["inflight"], queue="derivatives")
+
+    for name, stats in (
+            ("path", path_cache.stats()), ("blob", blob_cache.stats())
+    ):
+        for stat, value in stats.items():
+            CACHE.set(value, cache=name, stat=stat)
+    return Response(
+        metrics.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -0,0 +1,36 @@
+import argparse
+import asyncio
+
+from app.service.layout_service import LayoutMigrationService
+from app.settings import settings
+from app.utils.log import stop_logging
+
+
+def main() -> None:
+    """
+    Точка входа переноса файлов из корня ./static во вложенные папки.
+    Запускается из корневой директории при работающем сервисе:
+        python -m app.migrate_layout
+    """
+    parser = argparse.ArgumentParser(
+        description="Перенос файлов во вложенные папки"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=settings.LAYOUT_MIGRATION_BATCH_SIZE,
+        help="Размер пачки строк"
+    )
+    parser.add_argument(
+        "--grace", type=float, default=settings.PATH_CACHE_TTL,
+        help="Через сколько секунд удалять старые пути"
+    )
+    args = parser.parse_args()
+    settings.setup_architecture()
+    settings.setup_logging()
+    try:
+        asyncio.run(LayoutMigrationService().run(args.batch_size, args.grace))
+    finally:
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from app.settings import settings
+
+# Маркер закэшированного отсутствия значения
+MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU кэш с TTL и негативным кэшированием.
+    Используется из одного event loop, поэтому без блокировок.
+    """
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float):
+        """
+        Инициализация
+
+        Аргументы:
+            - maxsize(int): максимальное кол-во записей
+            - ttl(float): время жизни записи в секундах
+            - negative_ttl(float): время жизни записи об отсутствии значения
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.__data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Метод получения значения
+
+        Возвращает:
+            - Any: значение, MISSING если закэшировано отсутствие,
+                None если записи нет или она устарела
+        """
+        item = self.__data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self.__data[key]
+            self.misses += 1
+            return None
+        self.__data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Метод сохранения значения"""
+        self.__put(key, value, self.ttl)
+
+    def set_missing(self, key: Hashable) -> None:
+        """Метод сохранения отсутствия значения"""
+        self.__put(key, MISSING, self.negative_ttl)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Метод удаления записи"""
+        self.__data.pop(key, None)
+
+    def clear(self) -> None:
+        """Метод очистки кэша"""
+        self.__data.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        """Статистика кэша"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self.__data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def __put(self, key: Hashable, value: Any, ttl: float) -> None:
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self.__data[key] = (time.monotonic() + ttl, value)
+        self.__data.move_to_end(key)
+        while len(self.__data) > self.maxsize:
+            self.__data.popitem(last=False)
+
+
+# Кэш путей файлов по UID: {"local_path": ..., "cloud_path": ...}
+path_cache = TTLCache(
+    maxsize=settings.PATH_CACHE_SIZE,
+    ttl=settings.PATH_CACHE_TTL,
+    negative_ttl=settings.PATH_CACHE_NEGATIVE_TTL,
+)
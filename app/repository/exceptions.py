@@ -21,3 +21,11 @@ class FileNotFoundDB(Exception):
         super().__init__(
             f"Файл с {uid=} не найден."
         )
+
+
+class UploadNotFoundDB(Exception):
+    """Ошибка: Сессия загрузки не найдена"""
+    def __init__(self, upload_id: UUID):
+        super().__init__(
+            f"Сессия загрузки {upload_id} не найдена."
+        )
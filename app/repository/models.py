@@ -1,12 +1,19 @@
 import uuid
-from datetime import datetime
+from datetime import date, datetime
+from enum import StrEnum
+from typing import Any
 
-from sqlalchemy import BigInteger
+from sqlalchemy import (
+    BigInteger, Connection, Index, String, UniqueConstraint, text
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import (
     DeclarativeBase, Mapped, mapped_column
 )
 
 from app.repository.session import engine
+from app.settings import settings
+from app.utils.uid import utc_now
 
 
 class Base(DeclarativeBase):
@@ -15,20 +22,167 @@ class Base(DeclarativeBase):
 
 
 class Files(Base):
-    """Таблица для хранения метаданных файлов"""
+    """
+    Таблица для хранения метаданных файлов.
+
+    Секционирована по месяцам created_at. Ключи секционированной таблицы
+    обязаны включать created_at, поэтому уникальность uid задается парой
+    (uid, created_at): created_at берется из времени UUIDv7, и один uid
+    всегда дает один created_at.
+    """
     __tablename__ = 'files'
+    __table_args__ = (
+        UniqueConstraint("uid", "created_at", name="files_uid_created_at_key"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     id: Mapped[int] = mapped_column(BigInteger, autoincrement=True, primary_key=True)
-    uid: Mapped[uuid.UUID] = mapped_column(index=True, unique=True)
+    uid: Mapped[uuid.UUID] = mapped_column(index=True)
     filename: Mapped[str] = mapped_column(nullable=True)
     extension: Mapped[str] = mapped_column(nullable=True)
-    size: Mapped[int] = mapped_column(nullable=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=True)
     local_path: Mapped[str]
     cloud_path: Mapped[str]
+    # SHA-256 содержимого. Строки с одним хэшем ссылаются на один файл
+    content_hash: Mapped[str] = mapped_column(String(64), index=True, nullable=True)
+    # Формат хранения: identity, gzip или zstd
+    encoding: Mapped[str] = mapped_column(
+        String(16), default="identity", server_default="identity"
+    )
+    # Мета из заголовков файла: длительность, кодеки, размеры, страницы
+    meta: Mapped[dict[str, Any]] = mapped_column(JSONB, nullable=True)
+    # Время UTC без часового пояса, для UUIDv7 - время из UID
+    created_at: Mapped[datetime] = mapped_column(
+        default=utc_now, primary_key=True, index=True
+    )
+
+
+class ReplicationState(StrEnum):
+    """Состояния репликации файла в облако"""
+    PENDING = "pending"
+    IN_PROGRESS = "in_progress"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class ReplicationTasks(Base):
+    """
+    Таблица-очередь задач репликации файлов в облако.
+    Одна задача на объект в бакете, общая для всех дублей файла.
+    """
+    __tablename__ = 'replication_tasks'
+    __table_args__ = (
+        # Выполненных задач большинство, очередь считается по остальным
+        Index(
+            "ix_replication_tasks_backlog", "state",
+            postgresql_where=text("state <> 'done'"),
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, autoincrement=True, primary_key=True)
+    key: Mapped[str] = mapped_column(unique=True)
+    local_path: Mapped[str] = mapped_column(index=True)
+    state: Mapped[str] = mapped_column(default=ReplicationState.PENDING)
+    attempts: Mapped[int] = mapped_column(default=0)
+    last_error: Mapped[str] = mapped_column(nullable=True)
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        default=datetime.now, index=True
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        default=datetime.now, onupdate=datetime.now
+    )
+
+
+class UploadState(StrEnum):
+    """Состояния сессии загрузки по частям"""
+    OPEN = "open"
+    COMPLETING = "completing"
+    COMPLETED = "completed"
+
+
+class UploadSessions(Base):
+    """
+    Таблица сессий загрузки файла по частям.
+    Части пишутся сразу на свое место во временный файл сессии.
+    """
+    __tablename__ = 'upload_sessions'
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
+    filename: Mapped[str]
+    size: Mapped[int] = mapped_column(BigInteger)
+    part_size: Mapped[int] = mapped_column(BigInteger)
+    tmp_path: Mapped[str]
+    state: Mapped[str] = mapped_column(default=UploadState.OPEN)
+    file_uid: Mapped[uuid.UUID] = mapped_column(nullable=True)
+    # Кол-во частей, которые пишутся сейчас, и до какого времени
+    # они могут писаться
+    writers: Mapped[int] = mapped_column(default=0)
+    writes_until: Mapped[datetime] = mapped_column(nullable=True)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    expires_at: Mapped[datetime] = mapped_column(index=True)
+
+
+class UploadParts(Base):
+    """Таблица полученных частей сессий загрузки"""
+    __tablename__ = 'upload_parts'
+
+    session_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    part_number: Mapped[int] = mapped_column(primary_key=True)
+    size: Mapped[int] = mapped_column(BigInteger)
+
+
+class Derivatives(Base):
+    """
+    Таблица производных изображений (превью, уменьшенные копии).
+    Производные общие для всех дублей исходного файла и удаляются
+    вместе с ним.
+    """
+    __tablename__ = 'derivatives'
+
+    id: Mapped[int] = mapped_column(BigInteger, autoincrement=True, primary_key=True)
+    # Имя исходного файла без расширения: хэш содержимого или UID
+    source: Mapped[str] = mapped_column(String(64), index=True)
+    key: Mapped[str] = mapped_column(unique=True)
+    local_path: Mapped[str]
+    size: Mapped[int] = mapped_column(BigInteger)
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
 
 
+def month_start(day: date, shift: int = 0) -> date:
+    """Первое число месяца со сдвигом на shift месяцев"""
+    month = day.year * 12 + day.month - 1 + shift
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def create_partitions(conn: Connection, months_ahead: int) -> list[str]:
+    """
+    Функция создания месячных секций таблицы files
+
+    Аргументы:
+        - conn(Connection): соединение
+        - months_ahead(int): на сколько месяцев вперед создавать секции
+
+    Возвращает:
+        - list[str]: названия секций (текущая и будущие)
+    """
+    names = []
+    # Секции по месяцам UTC, как и created_at
+    today = utc_now().date()
+    for shift in range(months_ahead + 1):
+        start, end = month_start(today, shift), month_start(today, shift + 1)
+        name = f"files_p{start:%Y%m}"
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF files "
+            f"FOR VALUES FROM ('{start}') TO ('{end}')"
+        ))
+        names.append(name)
+    return names
+
+
 async def create_table() -> None:
-    """Функция создания таблицы"""
+    """Функция создания таблиц и будущих секций files"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(
+            create_partitions, settings.FILES_PARTITION_MONTHS_AHEAD
+        )
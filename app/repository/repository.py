@@ -1,56 +1,286 @@
 import logging
-from typing import Any
+import random
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable
 from uuid import UUID
 
-from sqlalchemy import select, delete, Result, Select
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import (
+    and_, any_, bindparam, or_, select, delete, func, text, tuple_, update,
+    ColumnElement, Result, Select, String, Uuid
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.sql.dml import ReturningDelete
 
 from app.dtos.dto import FileIn
+from app.repository.cache import MISSING, path_cache
 from app.repository.exceptions import (
-    PathNotFoundDB, FileAlreadyExistsDB, FileNotFoundDB
+    PathNotFoundDB, FileAlreadyExistsDB, FileNotFoundDB, UploadNotFoundDB
+)
+from app.repository.models import (
+    Derivatives, Files, ReplicationTasks, ReplicationState, UploadParts, UploadSessions,
+    UploadState, month_start
 )
-from app.repository.models import Files
+from app.utils.uid import utc_now, uuid7_datetime
+
+
+async def lock_content_hashes(
+        session: AsyncSession, content_hashes: list[str]
+) -> None:
+    """
+    Функция блокировки файлов хранилища по хэшам содержимого
+    до конца транзакции сессии
+
+    Аргументы:
+        - session (AsyncSession): сессия с открытой транзакцией
+        - content_hashes (list[str]): SHA-256 файлов
+
+    Логика:
+        - pg_advisory_xact_lock по hashtext хэша: сохранение файла и его
+            удаление очисткой не пересекаются
+        - Хэши блокируются по порядку, поэтому две транзакции с общими
+            хэшами не ждут друг друга по кругу
+    """
+    for content_hash in sorted(set(filter(None, content_hashes))):
+        await session.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(:hash))"),
+            {"hash": content_hash},
+        )
 
 
 class FileRepository:
     """Репозиторий для работы с файлами в БД"""
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]):
         """
         Инициализация репозитория
 
         Аргументы:
-            - session (AsyncSession): асинхронная сессия
+            - session_factory (async_sessionmaker[AsyncSession]): фабрика
+                сессий. Сессия открывается на время запроса к БД,
+                поэтому соединение из пула не держится между запросами
         """
-        self.session = session
+        self.session_factory = session_factory
         self.logger = logging.getLogger(self.__class__.__name__)
 
-    async def save_file_data(self, file: FileIn) -> None:
+    async def save_files_data(
+            self, files: list[FileIn], uid_factory: Callable[[], UUID],
+            attempts: int = 3,
+            before_insert: Callable[[], Awaitable[None]] | None = None
+    ) -> None:
+        """
+        Метод для сохранения метаинформации нескольких файлов в БД
+
+        Аргументы:
+            - files (list[FileIn]): Объекты с данными файлов
+            - uid_factory (Callable[[], UUID]): генератор новых UID
+            - attempts (int): кол-во попыток подобрать свободные UID
+            - before_insert (Callable[[], Awaitable[None]] | None): проверка
+                перед вставкой под блокировкой, ее ошибка откатывает
+                транзакцию
+
+        Логика:
+            - Транзакция начинается с блокировки хэшей содержимого
+                (lock_content_hashes), поэтому очистка не удалит файлы
+                хранилища, на которые ссылаются новые строки
+            - created_at берется из времени UUIDv7, так строка попадает
+                в секцию по времени своего UID
+            - Все строки вставляются одной транзакцией через
+                INSERT ... ON CONFLICT (uid, created_at) DO NOTHING
+                RETURNING uid
+            - Файлам, чей UID уже занят, выдаем новый UID и вставляем
+                только их, без исключений и отката транзакции
+            - В той же транзакции ставим задачи репликации в облако.
+                Если задача для объекта уже есть (дубль), новая
+                не создается.
+
+        Ошибки:
+            - FileAlreadyExistsDB: не удалось подобрать свободный UID
+        """
+        self.logger.info("Сохранение метаданных %d файлов", len(files))
+        pending = files
+        async with self.session_factory() as session:
+            await lock_content_hashes(
+                session, [file.content_hash for file in files]
+            )
+            if before_insert is not None:
+                await before_insert()
+            for _ in range(attempts):
+                result = await session.execute(
+                    insert(Files)
+                    .on_conflict_do_nothing(index_elements=["uid", "created_at"])
+                    .returning(Files.uid),
+                    [
+                        file.model_dump() | {
+                            "created_at": uuid7_datetime(file.uid) or utc_now()
+                        }
+                        for file in pending
+                    ]
+                )
+                inserted = {str(uid) for uid in result.scalars()}
+                pending = [
+                    file for file in pending if str(file.uid) not in inserted
+                ]
+                if not pending:
+                    break
+                for file in pending:
+                    self.logger.warning(
+                        "Файл с %s уже существует. Замена", file.uid
+                    )
+                    file.uid = str(uid_factory())
+            else:
+                await session.rollback()
+                raise FileAlreadyExistsDB(uid=pending[0].uid)
+
+            tasks = {
+                file.local_path[file.local_path.rfind("/") + 1:]: file.local_path
+                for file in files
+            }
+            await session.execute(
+                insert(ReplicationTasks).on_conflict_do_nothing(
+                    index_elements=["key"]
+                ),
+                [{"key": key, "local_path": path} for key, path in tasks.items()]
+            )
+            await session.commit()
+        for file in files:
+            path_cache.invalidate(str(file.uid))
+        self.logger.info("Сохранены метаданные %d файлов", len(files))
+
+    async def save_cloud_file_data(self, file: FileIn) -> bool:
         """
-        Метод для сохранения метаинформации в БД
+        Метод для сохранения метаинформации файла, загруженного
+        клиентом напрямую в облако
 
         Аргументы:
             - file (FileIn): Объект с данными файла
 
+        Возвращает:
+            - bool: была ли создана строка (False - файл уже сохранен)
+
+        Логика:
+            - UID выдан при запросе ссылки и входит в ключ объекта,
+                поэтому повторное завершение загрузки ничего не меняет
+            - Задача репликации не нужна: файл уже в облаке
+        """
+        async with self.session_factory() as session:
+            result = await session.execute(
+                insert(Files)
+                .on_conflict_do_nothing(index_elements=["uid", "created_at"])
+                .returning(Files.uid),
+                [
+                    file.model_dump() | {
+                        "created_at": uuid7_datetime(file.uid) or utc_now()
+                    }
+                ]
+            )
+            created = result.scalar_one_or_none() is not None
+            await session.commit()
+        path_cache.invalidate(str(file.uid))
+        return created
+
+    @staticmethod
+    def __uid_month(uid: UUID) -> date | None:
+        """Месяц секции строки по времени из UUIDv7, None для других UID"""
+        created_at = uuid7_datetime(uid)
+        return None if created_at is None else month_start(created_at.date())
+
+    @staticmethod
+    def __month_range(start: date) -> ColumnElement[bool]:
+        """
+        Условие на месяц created_at для отсечения секций.
+        Сравнивается диапазон месяца, а не точное время из UID: строка
+        найдется, даже если время при вставке посчитано чуть иначе.
+        """
+        return and_(
+            Files.created_at >= datetime.combine(start, time()),
+            Files.created_at < datetime.combine(month_start(start, 1), time()),
+        )
+
+    @classmethod
+    def __uid_filter(cls, uid: UUID) -> list[ColumnElement[bool]]:
+        """Условия поиска строки по UID с отсечением секций для UUIDv7"""
+        conditions = [Files.uid == uid]
+        month = cls.__uid_month(uid)
+        if month is not None:
+            conditions.append(cls.__month_range(month))
+        return conditions
+
+    async def get_file_paths(self, uid: UUID) -> dict[str, str]:
+        """
+        Метод для получения локального и облачного путей файла.
+
+        Аргументы:
+            - uid (UUID): уникальный идентификатор файла
+
+        Возвращает:
+            - dict[str, str]: local_path и cloud_path
+
+        Логика:
+            - Сначала смотрим в кэш путей, в том числе в негативный
+            - При промахе одним запросом получаем оба пути и кэшируем их
+
         Ошибки:
-            - FileAlreadyExistsDB: Файл с таким UID уже существует
+            - PathNotFoundDB: файла нет
+        """
+        paths = path_cache.get(str(uid))
+        if paths is MISSING:
+            raise PathNotFoundDB(uid=uid)
+        if paths is not None:
+            return paths
+
+        self.logger.info("Получение путей файла: %s", uid)
+        statement: Select[tuple[Any]] = select(
+            Files.local_path, Files.cloud_path
+        ).where(*self.__uid_filter(uid))
+        async with self.session_factory() as session:
+            result: Result[tuple[Any]] = await session.execute(statement)
+        row = result.one_or_none()
+        if row is None:
+            self.logger.error("Файл uid=%s не найден", uid)
+            path_cache.set_missing(str(uid))
+            raise PathNotFoundDB(uid=uid)
+        paths = row._asdict()
+        path_cache.set(str(uid), paths)
+        return paths
+
+    async def get_files_metadata(self, uids: list[UUID]) -> list[dict[str, Any]]:
         """
-        self.logger.info(f"Сохранение метаданных файла: {file.uid}")
-        file_obj: Files = Files(
-            **file.model_dump()
+        Метод для получения метаданных нескольких файлов одним запросом.
+
+        Аргументы:
+            - uids (list[UUID]): уникальные идентификаторы файлов
+
+        Возвращает:
+            - list[dict[str, Any]]: метаданные найденных файлов
+
+        Логика:
+            - Один запрос WHERE uid = ANY(:uids)
+            - Пути найденных файлов кладем в кэш путей
+        """
+        self.logger.info("Получение метаданных %d файлов", len(uids))
+        statement: Select[tuple[Any]] = select(
+            Files.uid, Files.filename, Files.extension, Files.size,
+            Files.local_path, Files.cloud_path, Files.content_hash,
+            Files.encoding, Files.meta, Files.created_at,
+        ).where(
+            Files.uid == any_(bindparam("uids", uids, type_=ARRAY(Uuid)))
         )
-        try:
-            self.session.add(file_obj)
-            await self.session.flush()
-            self.logger.info(f"Файл сохранен с ID: {file_obj.id}")
-            await self.session.commit()
-        except IntegrityError as e:
-            self.logger.error(
-                f"Ошибка добавления файла {file_obj.id}. "
-                f"Детали: {e.orig.args}"
-            )
-            raise FileAlreadyExistsDB(uid=file_obj.uid)
+        months = {self.__uid_month(uid) for uid in uids}
+        if None not in months:
+            # Отсечение секций по месяцам из UUIDv7
+            statement = statement.where(or_(
+                *(self.__month_range(month) for month in sorted(months))
+            ))
+        async with self.session_factory() as session:
+            result: Result[tuple[Any]] = await session.execute(statement)
+        rows = [row._asdict() for row in result]
+        for row in rows:
+            path_cache.set(
+                str(row["uid"]),
+                {"local_path": row["local_path"], "cloud_path": row["cloud_path"]}
+            )
+        return rows
 
     async def get_file_local_path(self, uid: UUID) -> str:
         """
@@ -63,20 +293,83 @@ class FileRepository:
             - str: путь для файла для апи
 
         Ошибки:
-            - LocalPathNotFound: путь не найден
+            - PathNotFoundDB: путь не найден
         """
-        self.logger.info(f"Получение локального пути файла: {uid}")
+        local_file_path = (await self.get_file_paths(uid))["local_path"]
+        self.logger.info(
+            "Файл uid=%s получен локальный путь: %s", uid, local_file_path
+        )
+        return local_file_path
+
+    async def get_replication_state(self, uid: UUID) -> dict[str, Any]:
+        """
+        Метод для получения состояния репликации файла.
+
+        Аргументы:
+            - uid (UUID): уникальный идентификатор файла
+
+        Возвращает:
+            - dict[str, Any]: состояние, кол-во попыток и последняя ошибка
+
+        Логика:
+            - У файла без задачи репликации (загружен сразу в облако по
+                подписанной ссылке) состояние done
+
+        Ошибки:
+            - FileNotFoundDB: файла нет
+        """
+        self.logger.info("Получение состояния репликации файла: %s", uid)
         statement: Select[tuple[Any]] = select(
-            Files.local_path
-        ).filter_by(uid=uid)
-        result: Result[tuple[Any]] = await self.session.execute(statement)
-        local_file_path: str | None = result.scalar_one_or_none()
-        if local_file_path is not None:
-            self.logger.info(f"Файл {uid=} получен локальный путь: {local_file_path}")
-            return local_file_path
-        else:
-            self.logger.error(f"Файл {uid=} не найден")
-            raise PathNotFoundDB(uid=uid)
+            ReplicationTasks.state,
+            ReplicationTasks.attempts,
+            ReplicationTasks.last_error,
+        ).select_from(Files).outerjoin(
+            ReplicationTasks, Files.local_path == ReplicationTasks.local_path
+        ).where(*self.__uid_filter(uid))
+        async with self.session_factory() as session:
+            result: Result[tuple[Any]] = await session.execute(statement)
+        row = result.one_or_none()
+        if row is None:
+            self.logger.error("Файл uid=%s не найден", uid)
+            raise FileNotFoundDB(uid=uid)
+        if row.state is None:
+            return {
+                "state": ReplicationState.DONE, "attempts": 0,
+                "last_error": None,
+            }
+        return row._asdict()
+
+    @asynccontextmanager
+    async def lock_unreferenced(
+            self, content_hashes: list[str]
+    ) -> AsyncIterator[set[str]]:
+        """
+        Контекст блокировки файлов хранилища, на которые нет ссылок
+
+        Аргументы:
+            - content_hashes (list[str]): SHA-256 файлов
+
+        Возвращает:
+            - set[str]: хэши из content_hashes, на которые не ссылается
+                ни одна строка
+
+        Логика:
+            - Блокировка и подсчет ссылок идут в одной транзакции,
+                пока контекст открыт, сохранение того же содержимого ждет
+        """
+        async with self.session_factory() as session, session.begin():
+            await lock_content_hashes(session, content_hashes)
+            result: Result[tuple[str]] = await session.execute(
+                select(Files.content_hash).distinct().where(
+                    Files.content_hash == any_(
+                        bindparam(
+                            "hashes", list(set(content_hashes)),
+                            type_=ARRAY(String)
+                        )
+                    )
+                )
+            )
+            yield set(content_hashes) - set(result.scalars())
 
     async def get_file_cloud_path(self, uid: UUID) -> str:
         """
@@ -89,17 +382,698 @@ class FileRepository:
             - str: путь для файла для апи
 
         Ошибки:
-            - LocalPathNotFound: путь не найден
+            - PathNotFoundDB: путь не найден
+        """
+        cloud_file_path = (await self.get_file_paths(uid))["cloud_path"]
+        self.logger.info(
+            "Файл uid=%s получен облачный путь: %s", uid, cloud_file_path
+        )
+        return cloud_file_path
+
+
+class ReplicationRepository:
+    """Репозиторий очереди задач репликации в облако"""
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]):
+        """
+        Инициализация репозитория
+
+        Аргументы:
+            - session_factory (async_sessionmaker[AsyncSession]): фабрика
+                сессий. Сессия открывается на время запроса к БД,
+                поэтому соединение из пула не держится между запросами
+        """
+        self.session_factory = session_factory
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def claim_task(self, lease: int) -> dict[str, Any] | None:
+        """
+        Метод для захвата следующей задачи репликации
+
+        Аргументы:
+            - lease (int): на сколько секунд задача закрепляется за воркером
+
+        Возвращает:
+            - dict[str, Any] | None: ID, ключ и путь задачи
+                или None, если очередь пуста
+
+        Логика:
+            - Берем ожидающую задачу или задачу, у которой истекла аренда
+                (воркер упал посреди загрузки)
+            - Строки, захваченные другими воркерами, пропускаются
+        """
+        now = datetime.now()
+        statement = (
+            select(ReplicationTasks)
+            .where(
+                ReplicationTasks.state.in_(
+                    [ReplicationState.PENDING, ReplicationState.IN_PROGRESS]
+                ),
+                ReplicationTasks.next_attempt_at <= now,
+            )
+            .order_by(ReplicationTasks.next_attempt_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        async with self.session_factory() as session:
+            result = await session.execute(statement)
+            task: ReplicationTasks | None = result.scalar_one_or_none()
+            if task is None:
+                return None
+            task.state = ReplicationState.IN_PROGRESS
+            task.attempts += 1
+            task.next_attempt_at = now + timedelta(seconds=lease)
+            claimed = {
+                "id": task.id,
+                "key": task.key,
+                "local_path": task.local_path,
+            }
+            self.logger.info(
+                "Захвачена задача репликации %s, попытка %d",
+                task.key, task.attempts
+            )
+            await session.commit()
+        return claimed
+
+    async def count_backlog(self) -> dict[str, int]:
+        """
+        Метод для подсчета невыполненных задач репликации
+
+        Возвращает:
+            - dict[str, int]: кол-во задач по состояниям, кроме done
+        """
+        async with self.session_factory() as session:
+            result: Result[tuple[Any]] = await session.execute(
+                # Условие литералом, чтобы совпасть с частичным индексом
+                select(ReplicationTasks.state, func.count()).where(
+                    text("state <> 'done'")
+                ).group_by(ReplicationTasks.state)
+            )
+        return {state: count for state, count in result.all()}
+
+    async def mark_done(self, task_id: int) -> None:
+        """
+        Метод для отметки успешной репликации
+
+        Аргументы:
+            - task_id (int): ID задачи
+        """
+        async with self.session_factory() as session:
+            task = await session.get(ReplicationTasks, task_id)
+            task.state = ReplicationState.DONE
+            task.last_error = None
+            await session.commit()
+
+    async def mark_failed(
+            self, task_id: int, error: str,
+            max_attempts: int, backoff_base: float, backoff_max: float
+    ) -> None:
+        """
+        Метод для отметки неудачной попытки репликации
+
+        Аргументы:
+            - task_id (int): ID задачи
+            - error (str): текст ошибки
+            - max_attempts (int): максимальное кол-во попыток
+            - backoff_base (float): базовая задержка перед повтором в секундах
+            - backoff_max (float): максимальная задержка в секундах
+
+        Логика:
+            - Если попытки кончились, задача переходит в failed
+            - Иначе откладываем ее с экспоненциальной задержкой и джиттером
+        """
+        async with self.session_factory() as session:
+            task = await session.get(ReplicationTasks, task_id)
+            task.last_error = error
+            if task.attempts >= max_attempts:
+                self.logger.error(
+                    "Репликация %s не удалась после %d попыток",
+                    task.key, task.attempts
+                )
+                task.state = ReplicationState.FAILED
+            else:
+                delay = min(
+                    backoff_base * 2 ** (task.attempts - 1), backoff_max
+                )
+                task.state = ReplicationState.PENDING
+                task.next_attempt_at = datetime.now() + timedelta(
+                    seconds=delay * random.uniform(0.5, 1)
+                )
+            await session.commit()
+
+
+class RetentionRepository:
+    """
+    Репозиторий для удаления устаревших файлов.
+
+    В отличие от остальных репозиториев работает в сессии вызывающего:
+    блокировка хэшей, проверка ссылок и удаление строк пачки должны
+    пройти в одной транзакции, иначе блокировка снимется раньше времени.
+    """
+    def __init__(self, session: AsyncSession):
+        """
+        Инициализация репозитория
+
+        Аргументы:
+            - session (AsyncSession): асинхронная сессия
+        """
+        self.session = session
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def get_expired_batch(
+            self, cutoff: datetime, limit: int
+    ) -> list[dict[str, Any]]:
+        """
+        Метод для получения пачки устаревших строк
+
+        Аргументы:
+            - cutoff (datetime): строки старше этого времени устарели
+            - limit (int): размер пачки
+
+        Возвращает:
+            - list[dict[str, Any]]: id, created_at, uid, local_path,
+                content_hash самых старых строк
+        """
+        statement: Select[tuple[Any]] = select(
+            Files.id, Files.created_at, Files.uid,
+            Files.local_path, Files.content_hash,
+        ).where(
+            Files.created_at < cutoff
+        ).order_by(Files.created_at).limit(limit)
+        result: Result[tuple[Any]] = await self.session.execute(statement)
+        return [row._asdict() for row in result]
+
+    async def lock_hashes(self, content_hashes: list[str]) -> None:
+        """
+        Метод блокировки файлов по хэшам содержимого до конца транзакции,
+        той же блокировкой, что берет FileService при сохранении
+
+        Аргументы:
+            - content_hashes (list[str]): SHA-256 файлов
+        """
+        await lock_content_hashes(self.session, content_hashes)
+
+    async def get_live_hashes(
+            self, content_hashes: list[str], cutoff: datetime
+    ) -> set[str]:
+        """
+        Метод для получения хэшей, на которые ссылаются актуальные строки
+
+        Аргументы:
+            - content_hashes (list[str]): проверяемые хэши
+            - cutoff (datetime): граница устаревания
+
+        Возвращает:
+            - set[str]: хэши, файлы которых удалять нельзя
         """
-        self.logger.info(f"Получение облачного пути файла: {uid}")
         statement: Select[tuple[Any]] = select(
-            Files.cloud_path
-        ).filter_by(uid=uid)
+            Files.content_hash
+        ).distinct().where(
+            Files.content_hash == any_(
+                bindparam("hashes", content_hashes, type_=ARRAY(String))
+            ),
+            Files.created_at >= cutoff,
+        )
         result: Result[tuple[Any]] = await self.session.execute(statement)
-        cloud_file_path: str | None = result.scalar_one_or_none()
-        if cloud_file_path is not None:
-            self.logger.info(f"Файл {uid=} получен облачный путь: {cloud_file_path}")
-            return cloud_file_path
-        else:
-            self.logger.error(f"Файл {uid=} не найден")
-            raise PathNotFoundDB(uid=uid)
\ No newline at end of file
+        return set(result.scalars())
+
+    async def delete_rows(
+            self, rows: list[dict[str, Any]], local_paths: list[str]
+    ) -> None:
+        """
+        Метод для удаления строк и задач репликации удаленных файлов
+
+        Аргументы:
+            - rows (list[dict[str, Any]]): строки с id и created_at
+            - local_paths (list[str]): пути удаленных файлов
+        """
+        await self.session.execute(
+            delete(Files).where(
+                tuple_(Files.id, Files.created_at).in_(
+                    [(row["id"], row["created_at"]) for row in rows]
+                )
+            )
+        )
+        if local_paths:
+            await self.session.execute(
+                delete(ReplicationTasks).where(
+                    ReplicationTasks.local_path == any_(
+                        bindparam("paths", local_paths, type_=ARRAY(String))
+                    )
+                )
+            )
+        await self.session.commit()
+
+    async def drop_expired_partitions(self, cutoff: datetime) -> list[str]:
+        """
+        Метод для удаления пустых секций files, целиком старше cutoff
+
+        Аргументы:
+            - cutoff (datetime): граница устаревания
+
+        Возвращает:
+            - list[str]: названия удаленных секций
+        """
+        result = await self.session.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'files' ORDER BY c.relname"
+        ))
+        dropped = []
+        for name in result.scalars():
+            if not name.startswith("files_p"):
+                continue
+            start = datetime.strptime(name[len("files_p"):], "%Y%m")
+            if month_start(start.date(), 1) > cutoff.date():
+                break
+            empty = (await self.session.execute(
+                text(f"SELECT NOT EXISTS (SELECT 1 FROM {name})")
+            )).scalar_one()
+            if empty:
+                await self.session.execute(text(f"DROP TABLE {name}"))
+                dropped.append(name)
+        await self.session.commit()
+        return dropped
+
+
+class LayoutRepository:
+    """Репозиторий для переноса файлов во вложенные папки"""
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]):
+        """
+        Инициализация репозитория
+
+        Аргументы:
+            - session_factory (async_sessionmaker[AsyncSession]): фабрика
+                сессий. Сессия открывается на время запроса к БД,
+                поэтому соединение из пула не держится между запросами
+        """
+        self.session_factory = session_factory
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def get_flat_batch(
+            self, root: str, after: tuple[datetime, int] | None, limit: int
+    ) -> list[dict[str, Any]]:
+        """
+        Метод для получения пачки строк с файлами в корне папки
+
+        Аргументы:
+            - root (str): корневая папка файлов
+            - after (tuple[datetime, int] | None): created_at и id последней
+                строки прошлой пачки
+            - limit (int): размер пачки
+
+        Возвращает:
+            - list[dict[str, Any]]: id, created_at, uid, local_path,
+                content_hash строк по порядку (created_at, id)
+        """
+        statement: Select[tuple[Any]] = select(
+            Files.id, Files.created_at, Files.uid,
+            Files.local_path, Files.content_hash,
+        ).where(
+            Files.local_path.like(f"{root}/%"),
+            Files.local_path.not_like(f"{root}/%/%"),
+        ).order_by(Files.created_at, Files.id).limit(limit)
+        if after is not None:
+            statement = statement.where(
+                tuple_(Files.created_at, Files.id) > tuple_(*after)
+            )
+        async with self.session_factory() as session:
+            result: Result[tuple[Any]] = await session.execute(statement)
+        return [row._asdict() for row in result]
+
+    async def move_paths(self, moves: list[dict[str, Any]]) -> None:
+        """
+        Метод для замены путей файлов одной транзакцией
+
+        Аргументы:
+            - moves (list[dict[str, Any]]): старый путь src, новый путь dst,
+                content_hash и uids строк
+
+        Логика:
+            - Строки с хэшем меняются все, кто ссылается на файл, по индексу
+                content_hash, в том числе вне текущей пачки
+            - Строки без хэша (загружены до дедупликации) меняются по UID
+            - Задачи репликации меняются по пути, ключ не меняется
+        """
+        async with self.session_factory() as session:
+            for move in moves:
+                if move["content_hash"]:
+                    condition = Files.content_hash == move["content_hash"]
+                else:
+                    condition = Files.uid == any_(
+                        bindparam("uids", move["uids"], type_=ARRAY(Uuid))
+                    )
+                await session.execute(
+                    update(Files).where(
+                        condition, Files.local_path == move["src"]
+                    ).values(local_path=move["dst"])
+                )
+                await session.execute(
+                    update(ReplicationTasks).where(
+                        ReplicationTasks.local_path == move["src"]
+                    ).values(local_path=move["dst"])
+                )
+            await session.commit()
+
+
+class UploadRepository:
+    """Репозиторий сессий загрузки файлов по частям"""
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]):
+        """
+        Инициализация репозитория
+
+        Аргументы:
+            - session_factory (async_sessionmaker[AsyncSession]): фабрика
+                сессий. Сессия открывается на время запроса к БД,
+                поэтому соединение из пула не держится между запросами
+        """
+        self.session_factory = session_factory
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def create_session(
+            self, filename: str, size: int, part_size: int, tmp_path: str,
+            ttl: int
+    ) -> dict[str, Any]:
+        """
+        Метод для создания сессии загрузки
+
+        Аргументы:
+            - filename (str): имя файла
+            - size (int): размер файла
+            - part_size (int): размер части
+            - tmp_path (str): путь временного файла сессии
+            - ttl (int): время жизни сессии в секундах
+
+        Возвращает:
+            - dict[str, Any]: данные сессии
+        """
+        now = datetime.now()
+        upload = UploadSessions(
+            filename=filename, size=size, part_size=part_size,
+            tmp_path=tmp_path, state=UploadState.OPEN,
+            created_at=now, expires_at=now + timedelta(seconds=ttl),
+        )
+        async with self.session_factory() as session:
+            session.add(upload)
+            await session.flush()
+            data = self.__as_dict(upload)
+            await session.commit()
+        return data
+
+    async def get_session(self, upload_id: UUID) -> dict[str, Any]:
+        """
+        Метод для получения сессии загрузки с полученными частями
+
+        Аргументы:
+            - upload_id (UUID): ID сессии
+
+        Возвращает:
+            - dict[str, Any]: данные сессии и parts: {номер: размер}
+
+        Ошибки:
+            - UploadNotFoundDB: сессии нет или она истекла
+        """
+        async with self.session_factory() as session:
+            upload = await session.get(UploadSessions, upload_id)
+            if upload is None or upload.expires_at < datetime.now():
+                raise UploadNotFoundDB(upload_id)
+            data = self.__as_dict(upload)
+            result: Result[tuple[Any]] = await session.execute(
+                select(UploadParts.part_number, UploadParts.size).where(
+                    UploadParts.session_id == upload_id
+                )
+            )
+        data["parts"] = {row.part_number: row.size for row in result}
+        return data
+
+    async def begin_part(
+            self, upload_id: UUID, part_number: int, timeout: int
+    ) -> bool:
+        """
+        Метод для начала записи части
+
+        Аргументы:
+            - upload_id (UUID): ID сессии
+            - part_number (int): номер части
+            - timeout (int): сколько секунд может писаться часть
+
+        Возвращает:
+            - bool: открыта ли сессия для записи
+
+        Логика:
+            - Одной короткой транзакцией увеличиваем счетчик пишущихся
+                частей, продлеваем writes_until и снимаем отметку о части.
+                Соединение на время записи не держится
+            - Счетчик меняется только в сессии в состоянии open, а
+                завершение ждет, пока он обнулится, поэтому после начала
+                завершения новые части не пишутся
+        """
+        now = datetime.now()
+        async with self.session_factory() as session:
+            result = await session.execute(
+                update(UploadSessions).where(
+                    UploadSessions.id == upload_id,
+                    UploadSessions.state == UploadState.OPEN,
+                    UploadSessions.expires_at >= now,
+                ).values(
+                    writers=UploadSessions.writers + 1,
+                    writes_until=func.greatest(
+                        func.coalesce(UploadSessions.writes_until, now),
+                        now + timedelta(seconds=timeout),
+                    ),
+                ).returning(UploadSessions.id)
+            )
+            if result.scalar_one_or_none() is None:
+                await session.rollback()
+                return False
+            await session.execute(
+                delete(UploadParts).where(
+                    UploadParts.session_id == upload_id,
+                    UploadParts.part_number == part_number,
+                )
+            )
+            await session.commit()
+        return True
+
+    async def end_part(
+            self, upload_id: UUID, part_number: int, size: int | None
+    ) -> bool:
+        """
+        Метод для окончания записи части
+
+        Аргументы:
+            - upload_id (UUID): ID сессии
+            - part_number (int): номер части
+            - size (int | None): размер части, None - часть не записана
+
+        Возвращает:
+            - bool: есть ли еще сессия
+
+        Логика:
+            - Одной транзакцией уменьшаем счетчик пишущихся частей
+                и отмечаем часть полученной. Повторная часть
+                перезаписывает прежнюю
+            - Если сессию успели отменить, часть не отмечается
+        """
+        async with self.session_factory() as session:
+            result = await session.execute(
+                update(UploadSessions).where(
+                    UploadSessions.id == upload_id
+                ).values(
+                    writers=func.greatest(UploadSessions.writers - 1, 0)
+                ).returning(UploadSessions.id)
+            )
+            found = result.scalar_one_or_none() is not None
+            if found and size is not None:
+                statement = insert(UploadParts).values(
+                    session_id=upload_id, part_number=part_number, size=size
+                )
+                await session.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["session_id", "part_number"],
+                        set_={"size": statement.excluded.size},
+                    )
+                )
+            await session.commit()
+        return found
+
+    async def set_state(
+            self, upload_id: UUID, state: UploadState,
+            expected: UploadState | None = None,
+            file_uid: str | None = None, idle: bool = False
+    ) -> bool:
+        """
+        Метод для смены состояния сессии
+
+        Аргументы:
+            - upload_id (UUID): ID сессии
+            - state (UploadState): новое состояние
+            - expected (UploadState | None): менять, только если сессия
+                в этом состоянии
+            - file_uid (str | None): UID сохраненного файла
+            - idle (bool): менять, только если части не пишутся
+                (или их время записи вышло)
+
+        Возвращает:
+            - bool: было ли изменено состояние
+        """
+        statement = update(UploadSessions).where(
+            UploadSessions.id == upload_id
+        ).values(state=state).returning(UploadSessions.id)
+        if expected is not None:
+            statement = statement.where(UploadSessions.state == expected)
+        if idle:
+            statement = statement.where(or_(
+                UploadSessions.writers == 0,
+                UploadSessions.writes_until < datetime.now(),
+            ))
+        if file_uid is not None:
+            statement = statement.values(file_uid=file_uid)
+        async with self.session_factory() as session:
+            result = await session.execute(statement)
+            changed = result.scalar_one_or_none() is not None
+            await session.commit()
+        return changed
+
+    async def delete_session(self, upload_id: UUID) -> None:
+        """
+        Метод для удаления сессии и ее частей
+
+        Аргументы:
+            - upload_id (UUID): ID сессии
+        """
+        async with self.session_factory() as session:
+            await session.execute(
+                delete(UploadParts).where(UploadParts.session_id == upload_id)
+            )
+            await session.execute(
+                delete(UploadSessions).where(UploadSessions.id == upload_id)
+            )
+            await session.commit()
+
+    async def delete_expired_sessions(self, limit: int) -> list[str]:
+        """
+        Метод для удаления пачки истекших сессий
+
+        Аргументы:
+            - limit (int): размер пачки
+
+        Возвращает:
+            - list[str]: пути временных файлов удаленных сессий
+        """
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(UploadSessions.id, UploadSessions.tmp_path).where(
+                    UploadSessions.expires_at < datetime.now()
+                ).limit(limit)
+            )
+            rows = result.all()
+            if rows:
+                ids = [row.id for row in rows]
+                await session.execute(
+                    delete(UploadParts).where(UploadParts.session_id.in_(ids))
+                )
+                await session.execute(
+                    delete(UploadSessions).where(UploadSessions.id.in_(ids))
+                )
+                await session.commit()
+        return [row.tmp_path for row in rows]
+
+    @staticmethod
+    def __as_dict(upload: UploadSessions) -> dict[str, Any]:
+        return {
+            "id": upload.id,
+            "filename": upload.filename,
+            "size": upload.size,
+            "part_size": upload.part_size,
+            "tmp_path": upload.tmp_path,
+            "state": upload.state,
+            "file_uid": upload.file_uid,
+            "expires_at": upload.expires_at,
+        }
+
+
+class DerivativeRepository:
+    """Репозиторий производных изображений"""
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]):
+        """
+        Инициализация репозитория
+
+        Аргументы:
+            - session_factory (async_sessionmaker[AsyncSession]): фабрика
+                сессий. Сессия открывается на время запроса к БД,
+                поэтому соединение из пула не держится между запросами
+        """
+        self.session_factory = session_factory
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def save_derivative(
+            self, source: str, key: str, local_path: str, size: int
+    ) -> None:
+        """
+        Метод для сохранения производной и задачи ее репликации
+
+        Аргументы:
+            - source (str): имя исходного файла без расширения
+            - key (str): ключ производной
+            - local_path (str): локальный путь производной
+            - size (int): размер производной
+
+        Логика:
+            - Повторное сохранение той же производной ничего не меняет
+        """
+        async with self.session_factory() as session:
+            await session.execute(
+                insert(Derivatives).values(
+                    source=source, key=key, local_path=local_path, size=size
+                ).on_conflict_do_nothing(index_elements=["key"])
+            )
+            await session.execute(
+                insert(ReplicationTasks).values(
+                    key=key, local_path=local_path
+                ).on_conflict_do_nothing(index_elements=["key"])
+            )
+            await session.commit()
+
+    async def has_derivative(self, key: str) -> bool:
+        """
+        Метод для проверки, создавалась ли производная
+
+        Аргументы:
+            - key (str): ключ производной
+        """
+        async with self.session_factory() as session:
+            result: Result[tuple[Any]] = await session.execute(
+                select(Derivatives.id).where(Derivatives.key == key)
+            )
+        return result.scalar_one_or_none() is not None
+
+    async def delete_by_sources(self, sources: list[str]) -> list[str]:
+        """
+        Метод для удаления производных исходных файлов
+
+        Аргументы:
+            - sources (list[str]): имена исходных файлов без расширения
+
+        Возвращает:
+            - list[str]: локальные пути удаленных производных
+        """
+        if not sources:
+            return []
+        async with self.session_factory() as session:
+            result = await session.execute(
+                delete(Derivatives).where(
+                    Derivatives.source == any_(
+                        bindparam("sources", sources, type_=ARRAY(String))
+                    )
+                ).returning(Derivatives.key, Derivatives.local_path)
+            )
+            rows = result.all()
+            if rows:
+                await session.execute(
+                    delete(ReplicationTasks).where(
+                        ReplicationTasks.key.in_([row.key for row in rows])
+                    )
+                )
+            await session.commit()
+        return [row.local_path for row in rows]
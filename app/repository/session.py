@@ -1,27 +1,36 @@
+import time
+
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.settings import settings
+from app.utils.metrics import DB_POOL_WAIT_SECONDS
+
+# Размер пула соединений и сколько соединений можно открыть сверх него
+POOL_SIZE = 10
+POOL_MAX_OVERFLOW = 20
+
+
+class MeasuredQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений с замером времени получения соединения"""
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
 
 # Асинхронный движок для получения сессии
 engine = create_async_engine(
     settings.async_dcn_string,
     echo=settings.DEBUG,
-    pool_size=10,
-    max_overflow=20,
+    poolclass=MeasuredQueuePool,
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_MAX_OVERFLOW,
     pool_timeout=30,
     pool_recycle=1800,
 )
 
 # фабрика для создания сессии
 async_session = async_sessionmaker(bind=engine, autoflush=False, autocommit=False)
-
-
-async def get_session():
-    """
-    Функция-генератор для получения сессии
-
-    Возвращает:
-        session(AsyncSession)
-    """
-    async with async_session() as session:
-        yield session
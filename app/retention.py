@@ -0,0 +1,47 @@
+import argparse
+import asyncio
+
+from app.service.cloud_service import s3_client
+from app.service.retention_service import RetentionService
+from app.settings import settings
+from app.utils.log import stop_logging
+
+
+async def run(days: int, batch_size: int, rate: float) -> None:
+    """Запуск очистки с клиентом S3"""
+    async with s3_client() as client:
+        await RetentionService(client).run(days, batch_size, rate)
+
+
+def main() -> None:
+    """
+    Точка входа очистки устаревших файлов.
+    Запускается по расписанию из корневой директории:
+        python -m app.retention --days 30
+    """
+    parser = argparse.ArgumentParser(
+        description="Удаление файлов старше срока хранения"
+    )
+    parser.add_argument(
+        "--days", type=int, default=settings.RETENTION_DAYS,
+        help="Срок хранения в днях"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=settings.RETENTION_BATCH_SIZE,
+        help="Размер пачки строк"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=settings.RETENTION_RATE,
+        help="Максимум удаляемых строк в секунду, 0 - без лимита"
+    )
+    args = parser.parse_args()
+    settings.setup_architecture()
+    settings.setup_logging()
+    try:
+        asyncio.run(run(args.days, args.batch_size, args.rate))
+    finally:
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()
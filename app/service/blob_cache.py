@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+
+from app.settings import settings
+
+
+class BlobCache:
+    """
+    LRU кэш содержимого небольших файлов с бюджетом в байтах.
+    Используется из одного event loop, поэтому без блокировок.
+
+    Файлы адресуются хэшем содержимого и не меняются, поэтому записи
+    не нужно инвалидировать. В кэш попадают только файлы, которые
+    запросили admit_hits раз, чтобы разовые запросы не вытесняли
+    популярные файлы.
+    """
+    def __init__(self, max_bytes: int, max_file_size: int, admit_hits: int):
+        """
+        Инициализация
+
+        Аргументы:
+            - max_bytes(int): общий бюджет в байтах, 0 - кэш выключен
+            - max_file_size(int): максимальный размер файла в кэше
+            - admit_hits(int): после скольких запросов файл попадает в кэш
+        """
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.admit_hits = admit_hits
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__data: OrderedDict[str, tuple[os.stat_result, bytes]] = (
+            OrderedDict()
+        )
+        # Кол-во запросов файлов, которые еще не в кэше
+        self.__candidates: OrderedDict[str, int] = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.max_file_size > 0
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.__data
+
+    def get(self, path: str) -> tuple[os.stat_result, bytes] | None:
+        """
+        Метод получения файла
+
+        Аргументы:
+            - path(str): путь до файла
+
+        Возвращает:
+            - tuple[os.stat_result, bytes] | None: stat и содержимое файла
+                или None, если файла нет в кэше
+        """
+        item = self.__data.get(path)
+        if item is None:
+            self.misses += 1
+            return None
+        self.__data.move_to_end(path)
+        self.hits += 1
+        return item
+
+    async def load(
+            self, path: str, stat_result: os.stat_result
+    ) -> bytes | None:
+        """
+        Метод учета промаха и загрузки файла в кэш
+
+        Аргументы:
+            - path(str): путь до файла
+            - stat_result(os.stat_result): stat файла
+
+        Возвращает:
+            - bytes | None: содержимое, если файл попал в кэш
+
+        Логика:
+            - Большие файлы не кэшируются
+            - Считаем запросы файла, на admit_hits запрос читаем его
+                вне event loop и кладем в кэш, вытесняя самые давние
+        """
+        size = stat_result.st_size
+        if not self.enabled or size > self.max_file_size:
+            return None
+        count = self.__candidates.pop(path, 0) + 1
+        if count < self.admit_hits:
+            self.__candidates[path] = count
+            while len(self.__candidates) > settings.BLOB_CACHE_CANDIDATES:
+                self.__candidates.popitem(last=False)
+            return None
+
+        data = await asyncio.to_thread(self.__read, path)
+        if len(data) != size or path in self.__data:
+            return data
+        self.__data[path] = (stat_result, data)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted) = self.__data.popitem(last=False)
+            self.bytes -= len(evicted)
+            self.evictions += 1
+        return data
+
+    @staticmethod
+    def __read(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    def clear(self) -> None:
+        """Метод очистки кэша"""
+        self.__data.clear()
+        self.__candidates.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict[str, int | float]:
+        """Статистика кэша"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self.__data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# Кэш содержимого небольших популярных файлов
+blob_cache = BlobCache(
+    max_bytes=settings.BLOB_CACHE_BYTES,
+    max_file_size=settings.BLOB_CACHE_MAX_FILE_SIZE,
+    admit_hits=settings.BLOB_CACHE_ADMIT_HITS,
+)
@@ -1,41 +1,402 @@
+import asyncio
 import logging
+import mimetypes
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator
 
+from aiobotocore.client import AioBaseClient
+from aiobotocore.config import AioConfig
 from aiobotocore.session import get_session
 import botocore.exceptions as exc
 
+from app.service import codec
+from app.service.exceptions import CloudObjectNotFound, CloudUnavailable
 from app.settings import settings
 from app.utils.decorators import mock
-from app.utils.mocks import s3_session_mock, upload_to_cloud_mock
+from app.utils.mocks import delete_from_cloud_mock, upload_to_cloud_mock
+
+
+@asynccontextmanager
+async def s3_client() -> AsyncGenerator[AioBaseClient | None, None]:
+    """
+    Контекстный менеджер долгоживущего клиента S3 на время жизни приложения
+
+    Возвращает:
+        - AioBaseClient | None: клиент S3, в дебаг режиме None
+
+    Логика:
+        - Клиент держит пул из S3_MAX_POOL_CONNECTIONS соединений
+            с keep-alive S3_KEEPALIVE_TIMEOUT секунд
+        - В дебаг режиме клиент не создается, загрузки замоканы
+    """
+    logger = logging.getLogger("S3Client")
+    if settings.DEBUG:
+        logger.info("Дебаг режим. Клиент S3 не создается")
+        yield None
+        return
+
+    session = get_session()
+    config = AioConfig(
+        max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+        connector_args={"keepalive_timeout": settings.S3_KEEPALIVE_TIMEOUT},
+    )
+    async with session.create_client(
+        "s3", region_name=settings.S3_REGION_NAME,
+        endpoint_url=settings.S3_URL,
+        aws_access_key_id=settings.S3_KEY_ID,
+        aws_secret_access_key=settings.S3_ACCESS_KEY,
+        config=config,
+    ) as client:
+        logger.info("Клиент S3 создан")
+        yield client
+    logger.info("Клиент S3 закрыт")
 
 
 class CloudService:
-    def __init__(self):
+    def __init__(self, client: AioBaseClient | None):
+        """
+        Инициализация
+
+        Аргументы:
+            - client(AioBaseClient | None): общий клиент S3 приложения
+        """
         self.logger = logging.getLogger(self.__class__.__name__)
         self.bucket = settings.S3_BUCKET
-        self.ctx = None
-
-    @mock(s3_session_mock)
-    async def session(self):
-        session = get_session()
-        client = session.create_client(
-            "s3", region_name=settings.S3_REGION_NAME,
-            endpoint_url=settings.S3_URL,
-            aws_access_key_id=settings.S3_KEY_ID,
-            aws_secret_access_key=settings.S3_ACCESS_KEY,
-        )
-        self.ctx = await client.__aenter__()
+        self.ctx = client
 
     @mock(upload_to_cloud_mock)
-    async def save_file(self, binary_file: bytes, key: str):
+    async def save_file(self, file_path: str, key: str):
+        """
+        Метод загрузки локального файла в S3
+
+        Аргументы:
+            - file_path(str): путь до файла на диске
+            - key(str): ключ объекта в бакете
+
+        Логика:
+            - Сжатые файлы хранятся с Content-Encoding и типом исходного
+                файла, чтобы облако отдавало их как сжатый ответ
+            - Файлы меньше размера части читаются с диска в потоке
+                и загружаются одним put_object
+            - Остальные загружаются multipart-ом: части читаются с диска,
+                в полете не больше S3_UPLOAD_CONCURRENCY частей,
+                каждая часть повторяется до S3_PART_RETRIES раз
+            - При ошибке multipart загрузка отменяется
+
+        Ошибки:
+            - Exception: файл не удалось загрузить
+        """
+        try:
+            size = await asyncio.to_thread(os.path.getsize, file_path)
+            if size <= settings.S3_PART_SIZE:
+                body = await asyncio.to_thread(
+                    self.__read_part, file_path, 0, size
+                )
+                await self.ctx.put_object(
+                    Body=body,
+                    Bucket=self.bucket,
+                    Key=key,
+                    **self.__object_params(key),
+                )
+            else:
+                await self.__multipart_upload(file_path, key, size)
+        except (exc.BotoCoreError, exc.ClientError) as e:
+            self.logger.error(e)
+            raise Exception(f"Ошибка загрузки файла с ключом {key}")
+
+    @mock(delete_from_cloud_mock)
+    async def delete_files(self, keys: list[str]):
+        """
+        Метод удаления объектов из S3
+
+        Аргументы:
+            - keys(list[str]): ключи объектов, не больше 1000 за вызов
+
+        Ошибки:
+            - Exception: объекты не удалось удалить
+        """
         try:
-            await self.ctx.put_object(
-                Body=binary_file,
+            response = await self.ctx.delete_objects(
                 Bucket=self.bucket,
-                Key=key,
+                Delete={
+                    "Objects": [{"Key": key} for key in keys],
+                    "Quiet": True,
+                },
             )
-            await self.ctx.__aexit__(None, None, None)
-        except exc.BotoCoreError as e:
+        except (exc.BotoCoreError, exc.ClientError) as e:
             self.logger.error(e)
-            raise Exception(f"Ошибка загрузки файла с ключом {key}")
+            raise Exception(f"Ошибка удаления {len(keys)} файлов из облака")
+        for error in response.get("Errors", []):
+            self.logger.error(
+                "Ошибка удаления %s из облака: %s",
+                error["Key"], error["Message"]
+            )
+
+    def __require_client(self) -> AioBaseClient:
+        """
+        Проверка наличия клиента для операций без мока
+
+        Ошибки:
+            - CloudUnavailable: клиента нет (дебаг режим)
+        """
+        if self.ctx is None:
+            raise CloudUnavailable()
+        return self.ctx
+
+    async def presign_put(
+            self, key: str, content_type: str | None, expires: int
+    ) -> str:
+        """
+        Метод получения подписанной ссылки для загрузки PUT
+
+        Аргументы:
+            - key(str): ключ объекта в бакете
+            - content_type(str | None): Content-Type, который обязан
+                передать клиент
+            - expires(int): время жизни ссылки в секундах
+
+        Возвращает:
+            - str: ссылка
+        """
+        params = {"Bucket": self.bucket, "Key": key}
+        if content_type:
+            params["ContentType"] = content_type
+        return await self.__require_client().generate_presigned_url(
+            "put_object", Params=params, ExpiresIn=expires
+        )
+
+    async def presign_post(
+            self, key: str, max_size: int, content_type: str | None,
+            expires: int
+    ) -> dict[str, Any]:
+        """
+        Метод получения подписанной формы для загрузки POST
+
+        Аргументы:
+            - key(str): ключ объекта в бакете
+            - max_size(int): максимальный размер файла
+            - content_type(str | None): Content-Type файла
+            - expires(int): время жизни формы в секундах
+
+        Возвращает:
+            - dict[str, Any]: url и поля формы
+        """
+        fields = {}
+        conditions: list[Any] = [["content-length-range", 1, max_size]]
+        if content_type:
+            fields["Content-Type"] = content_type
+            conditions.append({"Content-Type": content_type})
+        return await self.__require_client().generate_presigned_post(
+            Bucket=self.bucket, Key=key, Fields=fields,
+            Conditions=conditions, ExpiresIn=expires
+        )
+
+    async def presign_multipart(
+            self, key: str, parts_count: int, content_type: str | None,
+            expires: int
+    ) -> tuple[str, list[str]]:
+        """
+        Метод создания multipart загрузки с подписанными ссылками на части
+
+        Аргументы:
+            - key(str): ключ объекта в бакете
+            - parts_count(int): кол-во частей
+            - content_type(str | None): Content-Type файла
+            - expires(int): время жизни ссылок в секундах
 
+        Возвращает:
+            - tuple[str, list[str]]: ID загрузки и ссылки PUT на части
+                по порядку номеров
+        """
+        client = self.__require_client()
+        params = {"Bucket": self.bucket, "Key": key}
+        if content_type:
+            params["ContentType"] = content_type
+        upload = await client.create_multipart_upload(**params)
+        upload_id = upload["UploadId"]
+        urls = [
+            await client.generate_presigned_url(
+                "upload_part",
+                Params={
+                    "Bucket": self.bucket, "Key": key,
+                    "UploadId": upload_id, "PartNumber": number,
+                },
+                ExpiresIn=expires,
+            )
+            for number in range(1, parts_count + 1)
+        ]
+        return upload_id, urls
+
+    async def complete_multipart(
+            self, key: str, upload_id: str, parts: list[dict[str, Any]]
+    ) -> None:
+        """
+        Метод завершения multipart загрузки, части которой загрузил клиент
+
+        Аргументы:
+            - key(str): ключ объекта в бакете
+            - upload_id(str): ID загрузки
+            - parts(list[dict[str, Any]]): номера и ETag частей
+
+        Ошибки:
+            - CloudObjectNotFound: загрузки нет или части не совпадают
+        """
+        try:
+            await self.__require_client().complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id,
+                MultipartUpload={"Parts": sorted(
+                    parts, key=lambda part: part["PartNumber"]
+                )},
+            )
+        except exc.ClientError as e:
+            self.logger.error(e)
+            raise CloudObjectNotFound(key)
+
+    async def head_file(self, key: str) -> dict[str, Any]:
+        """
+        Метод получения метаданных объекта
+
+        Аргументы:
+            - key(str): ключ объекта в бакете
+
+        Возвращает:
+            - dict[str, Any]: размер, Content-Type и пользовательские
+                метаданные объекта
+
+        Ошибки:
+            - CloudObjectNotFound: объекта нет
+        """
+        try:
+            response = await self.__require_client().head_object(
+                Bucket=self.bucket, Key=key
+            )
+        except exc.ClientError as e:
+            self.logger.warning("Объект %s не найден. Детали: %s", key, e)
+            raise CloudObjectNotFound(key)
+        return {
+            "size": response["ContentLength"],
+            "content_type": response.get("ContentType"),
+            "metadata": response.get("Metadata", {}),
+        }
+
+    async def presign_get(
+            self, key: str, expires: int, filename: str | None = None
+    ) -> str:
+        """
+        Метод получения подписанной ссылки на скачивание
+
+        Аргументы:
+            - key(str): ключ объекта в бакете
+            - expires(int): время жизни ссылки в секундах
+            - filename(str | None): имя для Content-Disposition,
+                если файл нужно скачать
+
+        Возвращает:
+            - str: ссылка
+        """
+        params = {"Bucket": self.bucket, "Key": key}
+        if filename is not None:
+            params["ResponseContentDisposition"] = (
+                f'attachment; filename="{filename}"'
+            )
+        return await self.__require_client().generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=expires
+        )
+
+    @staticmethod
+    def __object_params(key: str) -> dict[str, str]:
+        """Заголовки объекта для сжатых файлов"""
+        encoding = codec.encoding_of(key)
+        if encoding == codec.IDENTITY:
+            return {}
+        return {
+            "ContentEncoding": encoding,
+            "ContentType": (
+                mimetypes.guess_type(codec.strip_encoding(key))[0]
+                or "application/octet-stream"
+            ),
+        }
+
+    async def __multipart_upload(self, file_path: str, key: str, size: int):
+        """
+        Метод multipart загрузки файла в S3
+
+        Аргументы:
+            - file_path(str): путь до файла на диске
+            - key(str): ключ объекта в бакете
+            - size(int): размер файла
+        """
+        upload = await self.ctx.create_multipart_upload(
+            Bucket=self.bucket, Key=key, **self.__object_params(key)
+        )
+        upload_id = upload["UploadId"]
+        semaphore = asyncio.Semaphore(settings.S3_UPLOAD_CONCURRENCY)
+        offsets = range(0, size, settings.S3_PART_SIZE)
+        self.logger.info(
+            "Multipart загрузка %s: %d частей, upload_id=%s",
+            key, len(offsets), upload_id
+        )
+        try:
+            parts = await asyncio.gather(*(
+                self.__upload_part(
+                    semaphore, file_path, key, upload_id,
+                    part_number=number, offset=offset
+                )
+                for number, offset in enumerate(offsets, start=1)
+            ))
+            await self.ctx.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            self.logger.error("Отмена multipart загрузки %s", key)
+            await self.ctx.abort_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id
+            )
+            raise
+
+    async def __upload_part(
+            self, semaphore: asyncio.Semaphore, file_path: str, key: str,
+            upload_id: str, part_number: int, offset: int
+    ) -> dict[str, int | str]:
+        """
+        Метод загрузки одной части с повторами
+
+        Возвращает:
+            - dict[str, int | str]: номер и ETag части
+        """
+        async with semaphore:
+            body = await asyncio.to_thread(
+                self.__read_part, file_path, offset, settings.S3_PART_SIZE
+            )
+            attempt = 1
+            while True:
+                try:
+                    response = await self.ctx.upload_part(
+                        Body=body,
+                        Bucket=self.bucket,
+                        Key=key,
+                        UploadId=upload_id,
+                        PartNumber=part_number,
+                    )
+                    return {"PartNumber": part_number, "ETag": response["ETag"]}
+                except (exc.BotoCoreError, exc.ClientError) as e:
+                    if attempt >= settings.S3_PART_RETRIES:
+                        raise
+                    self.logger.warning(
+                        "Ошибка загрузки части %d файла %s. "
+                        "Попытка %d. Детали: %s",
+                        part_number, key, attempt, e
+                    )
+                    await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+                    attempt += 1
 
+    @staticmethod
+    def __read_part(file_path: str, offset: int, size: int) -> bytes:
+        """Чтение части файла с диска"""
+        with open(file_path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
@@ -0,0 +1,188 @@
+import gzip
+import io
+import mimetypes
+import os
+import zlib
+from typing import Any, BinaryIO
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Формат хранения без сжатия
+IDENTITY = "identity"
+# Кодеки и суффиксы имен сжатых файлов
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+# Типы, которые уже сжаты внутри и почти не сжимаются повторно
+INCOMPRESSIBLE_PREFIXES = ("image/", "video/", "audio/")
+COMPRESSIBLE_MEDIA = {
+    "image/svg+xml", "image/bmp", "image/tiff", "audio/wav", "audio/x-wav",
+}
+INCOMPRESSIBLE_TYPES = {
+    "application/zip", "application/gzip", "application/x-7z-compressed",
+    "application/vnd.rar", "application/x-rar-compressed", "application/zstd",
+    "application/x-bzip2", "application/x-xz",
+}
+
+
+def available(encoding: str) -> bool:
+    """Доступен ли кодек в текущем окружении"""
+    return encoding == "gzip" or (encoding == "zstd" and zstandard is not None)
+
+
+def encoding_of(path: str) -> str:
+    """Формат хранения файла по суффиксу имени"""
+    for encoding, suffix in SUFFIXES.items():
+        if path.endswith(suffix):
+            return encoding
+    return IDENTITY
+
+
+def strip_encoding(path: str) -> str:
+    """Путь или имя файла без суффикса сжатия"""
+    encoding = encoding_of(path)
+    if encoding == IDENTITY:
+        return path
+    return path[:-len(SUFFIXES[encoding])]
+
+
+def is_compressible(extension: str | None) -> bool:
+    """
+    Стоит ли пробовать сжимать файл
+
+    Аргументы:
+        - extension(str | None): расширение файла
+
+    Возвращает:
+        - bool: False для уже сжатых форматов (медиа, архивы, OOXML)
+    """
+    mime_type, _ = mimetypes.guess_type(f"file.{extension}")
+    if mime_type is None:
+        return True
+    if mime_type in COMPRESSIBLE_MEDIA:
+        return True
+    return not (
+        mime_type.startswith(INCOMPRESSIBLE_PREFIXES)
+        or mime_type in INCOMPRESSIBLE_TYPES
+        or mime_type.startswith("application/vnd.openxmlformats")
+    )
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    """Сжатие байт целиком"""
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def encode_file(
+        path: str, encoding: str, level: int, min_ratio: float,
+        sample_size: int, fsync: bool
+) -> str | None:
+    """
+    Функция сжатия файла, если он хорошо сжимается.
+    Выполняется в пуле воркеров, поэтому синхронная.
+
+    Аргументы:
+        - path(str): путь до файла
+        - encoding(str): кодек gzip или zstd
+        - level(int): уровень сжатия
+        - min_ratio(float): сжимать, если выборка сжимается хотя бы
+            до этой доли размера
+        - sample_size(int): размер выборки из начала файла
+        - fsync(bool): нужно ли делать fsync сжатого файла
+
+    Возвращает:
+        - str | None: путь сжатого файла рядом с исходным
+            или None, если сжимать не стоит
+    """
+    with open(path, "rb") as f:
+        sample = f.read(sample_size)
+    if not sample or len(compress(sample, encoding, level)) > len(sample) * min_ratio:
+        return None
+
+    encoded_path = path + SUFFIXES[encoding]
+    with open(path, "rb") as src, open(encoded_path, "wb") as dst:
+        if encoding == "zstd":
+            zstandard.ZstdCompressor(level=level).copy_stream(src, dst)
+        else:
+            with gzip.GzipFile(
+                    fileobj=dst, mode="wb", compresslevel=level, mtime=0
+            ) as gz:
+                while chunk := src.read(1024 * 1024):
+                    gz.write(chunk)
+        original, encoded = src.tell(), dst.tell()
+        if encoded > original * min_ratio:
+            dst.close()
+            os.remove(encoded_path)
+            return None
+        if fsync:
+            dst.flush()
+            os.fsync(dst.fileno())
+    return encoded_path
+
+
+def decoder(encoding: str) -> Any:
+    """
+    Потоковый распаковщик
+
+    Возвращает:
+        - объект с методом decompress(chunk), данные отдаются по мере
+            поступления чанков
+    """
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Для файлов zstd нужен пакет zstandard")
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(wbits=31)
+
+
+def open_decoded(path: str) -> BinaryIO:
+    """
+    Открытие файла хранилища на чтение исходного содержимого
+
+    Аргументы:
+        - path(str): путь до файла, возможно сжатого
+
+    Возвращает:
+        - BinaryIO: файловый объект с поддержкой seek
+    """
+    encoding = encoding_of(path)
+    if encoding == "gzip":
+        return gzip.open(path, "rb")
+    if encoding == "zstd":
+        with open(path, "rb") as f:
+            return io.BytesIO(decoder(encoding).decompress(f.read()))
+    return open(path, "rb")
+
+
+def accepts(accept_encoding: str | None, encoding: str) -> bool:
+    """
+    Принимает ли клиент кодек
+
+    Аргументы:
+        - accept_encoding(str | None): заголовок Accept-Encoding
+        - encoding(str): кодек
+
+    Возвращает:
+        - bool: кодек или * указаны с ненулевым q
+    """
+    if not accept_encoding:
+        return False
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if name not in (encoding, "*"):
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        return quality > 0
+    return False
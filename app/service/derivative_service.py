@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import os
+from uuid import UUID, uuid4
+
+from app.repository.exceptions import PathNotFoundDB
+from app.repository.repository import DerivativeRepository, FileRepository
+from app.repository.session import async_session
+from app.service import codec
+from app.service.blob_cache import blob_cache
+from app.service.exceptions import (
+    DerivativeUnsupported, FileNotFound, FileNotFoundLocal
+)
+from app.service.imaging import IMAGE_FORMATS, SOURCE_EXTENSIONS, render_image
+from app.service.local_storage import local_storage
+from app.service.meta_extractor import extractor_pool
+from app.settings import settings
+from app.utils.metrics import DERIVATIVE_RENDER_SECONDS
+
+
+def derivative_key(
+        source_path: str, width: int | None, height: int | None,
+        image_format: str, quality: int
+) -> str:
+    """
+    Ключ производной: имя исходного файла без расширения и параметры
+
+    Логика:
+        - Имя исходного файла - хэш содержимого, поэтому производные
+            общие для всех дублей
+    """
+    source = os.path.basename(source_path).split(".", 1)[0]
+    return (
+        f"{source}_{width or 0}x{height or 0}_q{quality}"
+        f".{IMAGE_FORMATS[image_format]}"
+    )
+
+
+def parse_presets(presets: str) -> list[tuple[int | None, int | None]]:
+    """Разбор DERIVATIVE_PRESETS вида 200x200,800x0"""
+    sizes = []
+    for preset in filter(None, (p.strip() for p in presets.split(","))):
+        width, _, height = preset.partition("x")
+        sizes.append((int(width) or None, int(height or 0) or None))
+    return sizes
+
+
+class DerivativeRenderer:
+    """
+    Создание производных изображений в пуле воркеров.
+
+    Одинаковые производные, запрошенные одновременно, создаются одной
+    задачей, остальные запросы ждут ее результат. Задача не отменяется,
+    если запрос, который ее начал, оборвался.
+    """
+    def __init__(self):
+        """Инициализация"""
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.rendered = 0
+        self.coalesced = 0
+        self.__inflight: dict[str, asyncio.Task] = {}
+        self.__background: set[asyncio.Task] = set()
+
+    async def render(
+            self, source_path: str, width: int | None, height: int | None,
+            image_format: str, quality: int
+    ) -> str:
+        """
+        Метод создания производной
+
+        Аргументы:
+            - source_path(str): путь до исходного файла
+            - width(int | None): максимальная ширина
+            - height(int | None): максимальная высота
+            - image_format(str): jpeg, png или webp
+            - quality(int): качество для jpeg и webp
+
+        Возвращает:
+            - str: путь до производной
+
+        Ошибки:
+            - FileNotFoundError: исходного файла нет на диске
+            - DerivativeUnsupported: файл не читается как изображение
+            - ExtractorBusy, MetaExtractionError: ошибки пула воркеров
+        """
+        key = derivative_key(source_path, width, height, image_format, quality)
+        task = self.__inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self.__render(
+                source_path, key, width, height, image_format, quality
+            ))
+            self.__inflight[key] = task
+            task.add_done_callback(lambda t: self.__done(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def __done(self, key: str, task: asyncio.Task) -> None:
+        self.__inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.warning(
+                "Производная %s не создана: %s", key, task.exception()
+            )
+
+    async def __render(
+            self, source_path: str, key: str, width: int | None,
+            height: int | None, image_format: str, quality: int
+    ) -> str:
+        """
+        Создание производной во временном файле, перенос под ключ
+        и сохранение в БД вместе с задачей репликации
+        """
+        path = local_storage.blob_path(key)
+        tmp_path = f"{settings.UPLOAD_TMP_DIR}/{uuid4()}.{key.rsplit('.', 1)[1]}"
+        try:
+            with DERIVATIVE_RENDER_SECONDS.time():
+                size = await extractor_pool.run(
+                    render_image, source_path, tmp_path, width, height,
+                    image_format, quality, settings.STORAGE_FSYNC != "none",
+                )
+            await local_storage.commit(tmp_path, path)
+        except FileExistsError:
+            await local_storage.remove(tmp_path)
+        except FileNotFoundError:
+            await local_storage.remove(tmp_path)
+            raise
+        except (OSError, ValueError) as e:
+            await local_storage.remove(tmp_path)
+            raise DerivativeUnsupported(
+                f"Файл не читается как изображение: {e}"
+            )
+        except BaseException:
+            await local_storage.remove(tmp_path)
+            raise
+
+        await DerivativeRepository(async_session).save_derivative(
+            os.path.basename(source_path).split(".", 1)[0], key, path, size
+        )
+        self.rendered += 1
+        self.logger.info("Создана производная %s, размер %d", key, size)
+        return path
+
+    def schedule_presets(self, source_path: str, extension: str) -> None:
+        """
+        Метод фонового создания превью DERIVATIVE_PRESETS
+
+        Аргументы:
+            - source_path(str): путь до исходного файла
+            - extension(str): расширение исходного файла
+
+        Логика:
+            - Не изображения и пустой список размеров пропускаются
+            - Ошибки только логируются: превью будет создано при запросе
+        """
+        presets = parse_presets(settings.DERIVATIVE_PRESETS)
+        if not presets or extension.lower() not in SOURCE_EXTENSIONS:
+            return
+        for width, height in presets:
+            task = asyncio.create_task(self.render(
+                source_path, width, height, "webp",
+                settings.DERIVATIVE_QUALITY,
+            ))
+            self.__background.add(task)
+            task.add_done_callback(self.__background_done)
+
+    def __background_done(self, task: asyncio.Task) -> None:
+        self.__background.discard(task)
+        if not task.cancelled():
+            task.exception()
+
+    async def stop(self) -> None:
+        """Метод отмены фоновых задач при остановке приложения"""
+        tasks = [*self.__background, *self.__inflight.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict[str, int]:
+        """Статистика производных"""
+        return {
+            "rendered": self.rendered,
+            "coalesced": self.coalesced,
+            "inflight": len(self.__inflight),
+        }
+
+
+class DerivativeService:
+    """Сервис производных изображений: превью и уменьшенных копий"""
+    def __init__(
+            self, file_repository: FileRepository,
+            derivative_repository: DerivativeRepository
+    ):
+        """Инициализация"""
+        self.file_repository = file_repository
+        self.derivative_repository = derivative_repository
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def get_derivative(
+            self, uid: UUID, width: int | None, height: int | None,
+            image_format: str = "webp", quality: int | None = None
+    ) -> dict[str, str]:
+        """
+        Метод получения производной изображения
+
+        Аргументы:
+            - uid(UUID): UID исходного файла
+            - width(int | None): максимальная ширина
+            - height(int | None): максимальная высота
+            - image_format(str): jpeg, png или webp
+            - quality(int | None): качество, по умолчанию DERIVATIVE_QUALITY
+
+        Возвращает:
+            - dict[str, str]: path - путь до производной на диске
+                или cloud_url - ссылка на нее в облаке
+
+        Логика:
+            - Готовая производная отдается с диска
+            - Иначе создается из исходного файла, если он есть на диске
+            - Иначе отдается из облака, если создавалась раньше
+
+        Ошибки:
+            - FileNotFound: файла нет
+            - FileNotFoundLocal: нет ни исходного файла, ни производной
+            - DerivativeUnsupported: не указан размер или файл
+                не изображение
+        """
+        if width is None and height is None:
+            raise DerivativeUnsupported("Укажите ширину или высоту")
+        try:
+            paths = await self.file_repository.get_file_paths(uid)
+        except PathNotFoundDB as e:
+            self.logger.error(e)
+            raise FileNotFound(uid)
+        source_path = paths["local_path"]
+        extension = os.path.splitext(
+            codec.strip_encoding(source_path)
+        )[1].lstrip(".").lower()
+        if extension not in SOURCE_EXTENSIONS:
+            raise DerivativeUnsupported(f"Файл {uid} не изображение")
+
+        quality = quality or settings.DERIVATIVE_QUALITY
+        key = derivative_key(source_path, width, height, image_format, quality)
+        path = local_storage.blob_path(key)
+        if path in blob_cache or await asyncio.to_thread(os.path.exists, path):
+            return {"path": path}
+        try:
+            return {"path": await derivative_renderer.render(
+                source_path, width, height, image_format, quality
+            )}
+        except FileNotFoundError:
+            self.logger.info("Исходного файла %s нет на диске", source_path)
+        if await self.derivative_repository.has_derivative(key):
+            return {"cloud_url": f"{settings.S3_PUBLIC_URL}/{key}"}
+        raise FileNotFoundLocal(uid, source_path)
+
+
+# Общий создатель производных приложения
+derivative_renderer = DerivativeRenderer()
@@ -16,3 +16,48 @@ class FileNotFoundLocal(Exception):
 class FileNotFound(Exception):
     def __init__(self, uid: UUID):
         super().__init__(f"Файл: {uid} не найден локально")
+
+
+class ExtractorBusy(Exception):
+    def __init__(self):
+        super().__init__("Очередь обработки файлов заполнена, повторите позже")
+
+
+class MetaExtractionError(Exception):
+    def __init__(self, detail: str):
+        super().__init__(f"Ошибка получения меты файла. {detail}")
+
+
+class BlobMissing(Exception):
+    def __init__(self, path: str):
+        super().__init__(f"Файл хранилища {path} удален до записи в БД")
+
+
+class CloudUnavailable(Exception):
+    def __init__(self):
+        super().__init__("Облачное хранилище не настроено")
+
+
+class CloudObjectNotFound(Exception):
+    def __init__(self, key: str):
+        super().__init__(f"Объект {key} не найден в облаке")
+
+
+class UploadRejected(Exception):
+    def __init__(self, detail: str):
+        super().__init__(f"Загрузка отклонена. {detail}")
+
+
+class UploadNotFound(Exception):
+    def __init__(self, upload_id: UUID):
+        super().__init__(f"Сессия загрузки {upload_id} не найдена")
+
+
+class UploadConflict(Exception):
+    def __init__(self, detail: str):
+        super().__init__(f"Конфликт загрузки. {detail}")
+
+
+class DerivativeUnsupported(Exception):
+    def __init__(self, detail: str):
+        super().__init__(f"Производная не может быть создана. {detail}")
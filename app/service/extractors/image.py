@@ -0,0 +1,12 @@
+from typing import Any, BinaryIO
+
+from PIL import Image
+
+
+def image_meta(file: BinaryIO, mime_type: str) -> dict[str, Any]:
+    """Мета изображения: формат и размеры по заголовку, без декодирования"""
+    with Image.open(file) as image:
+        return {
+            "extension": image.format.lower() if image.format else None,
+            "meta": {"width": image.width, "height": image.height},
+        }
@@ -0,0 +1,227 @@
+import struct
+from typing import Any, BinaryIO
+
+import mutagen
+from mutagen.mp4 import MP4, Atoms
+
+# Элементы EBML (Matroska, WebM), из которых берется мета
+EBML = 0x1A45DFA3
+EBML_DOC_TYPE = 0x4282
+SEGMENT = 0x18538067
+CLUSTER = 0x1F43B675
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TITLE = 0x7BA9
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+AUDIO = 0xE1
+SAMPLING_FREQUENCY = 0xB5
+CHANNELS = 0x9F
+
+
+def media_meta(file: BinaryIO, mime_type: str) -> dict[str, Any]:
+    """
+    Мета аудио и видео через mutagen: длительность, битрейт, кодеки.
+    mutagen читает только заголовки и служебные блоки файла.
+    """
+    media = mutagen.File(file, easy=True)
+    if media is None:
+        return {}
+    info = media.info
+    title = (media.tags or {}).get("title") or [None]
+    meta = {
+        "duration": round(info.length, 3) if info.length else None,
+        "bitrate": getattr(info, "bitrate", None) or None,
+        "audio": {
+            "codec": (
+                getattr(info, "codec", None) or type(media).__name__.lower()
+            ),
+            "sample_rate": getattr(info, "sample_rate", None),
+            "channels": getattr(info, "channels", None),
+        },
+    }
+    if isinstance(media, MP4):
+        meta["video"] = mp4_video(file)
+        if not getattr(info, "codec", None):
+            # У MP4 без звуковой дорожки кодек звука не определен
+            meta.pop("audio")
+    return {"filename": title[0], "meta": meta}
+
+
+def mp4_video(file: BinaryIO) -> dict[str, Any] | None:
+    """Кодек и размеры первой видеодорожки MP4 из атомов tkhd и stsd"""
+    file.seek(0)
+    for trak in Atoms(file)[b"moov"].findall(b"trak"):
+        ok, handler = trak[b"mdia", b"hdlr"].read(file)
+        if not ok or handler[8:12] != b"vide":
+            continue
+        ok, header = trak[b"tkhd"].read(file)
+        width, height = struct.unpack(">II", header[-8:]) if ok else (0, 0)
+        ok, sample = trak[b"mdia", b"minf", b"stbl", b"stsd"].read(file)
+        return {
+            "codec": sample[12:16].decode("latin-1") if ok else None,
+            "width": width >> 16 or None,
+            "height": height >> 16 or None,
+        }
+    return None
+
+
+def matroska_meta(file: BinaryIO, mime_type: str) -> dict[str, Any]:
+    """
+    Мета Matroska и WebM из заголовков EBML: длительность, кодеки
+    и размеры дорожек. Чтение заканчивается на первом кластере данных.
+    """
+    element_id, size = _read_id(file), _read_size(file)
+    if element_id != EBML or size is None:
+        raise ValueError("Файл не EBML")
+    doc_type = "mkv"
+    for child, child_size in _children(file, file.tell() + size):
+        if child == EBML_DOC_TYPE:
+            doc_type = _read_string(file, child_size)
+    if _read_id(file) != SEGMENT:
+        raise ValueError("Нет сегмента Matroska")
+    size = _read_size(file)
+
+    info: dict[str, Any] = {}
+    tracks: list[dict[str, Any]] = []
+    for child, child_size in _children(
+            file, None if size is None else file.tell() + size
+    ):
+        if child == INFO:
+            info = _read_info(file, file.tell() + child_size)
+        elif child == TRACKS:
+            tracks = _read_tracks(file, file.tell() + child_size)
+        if child == CLUSTER or (info and tracks):
+            break
+
+    video = next((t for t in tracks if t["type"] == 1), None)
+    audio = next((t for t in tracks if t["type"] == 2), None)
+    meta = {
+        "duration": info.get("duration"),
+        "video": video and {
+            "codec": video.get("codec"),
+            "width": video.get("width"),
+            "height": video.get("height"),
+        },
+        "audio": audio and {
+            "codec": audio.get("codec"),
+            "sample_rate": audio.get("sample_rate"),
+            "channels": audio.get("channels"),
+        },
+    }
+    return {
+        "filename": info.get("title"),
+        "extension": "webm" if doc_type == "webm" else "mkv",
+        "meta": meta,
+    }
+
+
+def _read_info(file: BinaryIO, end: int) -> dict[str, Any]:
+    scale, duration, title = 1_000_000, None, None
+    for child, size in _children(file, end):
+        if child == TIMECODE_SCALE:
+            scale = _read_uint(file, size)
+        elif child == DURATION:
+            duration = _read_float(file, size)
+        elif child == TITLE:
+            title = _read_string(file, size)
+    return {
+        "duration": (
+            round(duration * scale / 1e9, 3) if duration is not None else None
+        ),
+        "title": title,
+    }
+
+
+def _read_tracks(file: BinaryIO, end: int) -> list[dict[str, Any]]:
+    tracks = []
+    for child, size in _children(file, end):
+        if child != TRACK_ENTRY:
+            continue
+        track: dict[str, Any] = {"type": None}
+        for field, field_size in _children(file, file.tell() + size):
+            if field == TRACK_TYPE:
+                track["type"] = _read_uint(file, field_size)
+            elif field == CODEC_ID:
+                track["codec"] = _read_string(file, field_size)
+            elif field in (VIDEO, AUDIO):
+                for value, value_size in _children(
+                        file, file.tell() + field_size
+                ):
+                    if value == PIXEL_WIDTH:
+                        track["width"] = _read_uint(file, value_size)
+                    elif value == PIXEL_HEIGHT:
+                        track["height"] = _read_uint(file, value_size)
+                    elif value == SAMPLING_FREQUENCY:
+                        track["sample_rate"] = int(_read_float(file, value_size))
+                    elif value == CHANNELS:
+                        track["channels"] = _read_uint(file, value_size)
+        tracks.append(track)
+    return tracks
+
+
+def _children(file: BinaryIO, end: int | None):
+    """
+    Дочерние элементы EBML до позиции end (None - до конца файла).
+    Отдает (ID, размер) с позицией в начале данных элемента. Данные,
+    которые не прочитал вызывающий, пропускаются через seek. Элемент
+    неизвестного размера (размер None) пропустить нельзя, на нем
+    вызывающий должен остановиться.
+    """
+    while end is None or file.tell() < end:
+        element_id = _read_id(file)
+        if element_id is None:
+            return
+        size = _read_size(file)
+        start = file.tell()
+        yield element_id, size
+        if size is None:
+            raise ValueError("Элемент EBML неизвестного размера")
+        file.seek(start + size)
+
+
+def _read_vint(file: BinaryIO) -> tuple[int, int] | None:
+    """Число переменной длины EBML: (значение с маркером, длина)"""
+    first = file.read(1)
+    if not first:
+        return None
+    length = 9 - first[0].bit_length()
+    if length > 8:
+        raise ValueError("Некорректное число EBML")
+    rest = file.read(length - 1)
+    if len(rest) != length - 1:
+        return None
+    return int.from_bytes(first + rest, "big"), length
+
+
+def _read_id(file: BinaryIO) -> int | None:
+    vint = _read_vint(file)
+    return vint and vint[0]
+
+
+def _read_size(file: BinaryIO) -> int | None:
+    """Размер элемента. None - неизвестный размер (все биты единицы)"""
+    vint = _read_vint(file)
+    if vint is None:
+        raise ValueError("Файл EBML обрезан")
+    value, length = vint
+    size = value & ((1 << (7 * length)) - 1)
+    return None if size == (1 << (7 * length)) - 1 else size
+
+
+def _read_uint(file: BinaryIO, size: int) -> int:
+    return int.from_bytes(file.read(size), "big")
+
+
+def _read_float(file: BinaryIO, size: int) -> float:
+    return struct.unpack(">f" if size == 4 else ">d", file.read(size))[0]
+
+
+def _read_string(file: BinaryIO, size: int) -> str:
+    return file.read(size).rstrip(b"\0").decode("utf-8", "replace")
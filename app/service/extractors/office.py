@@ -0,0 +1,52 @@
+import zipfile
+from typing import Any, BinaryIO
+from xml.etree import ElementTree
+
+# Часть документа со свойствами и максимальный размер ее XML
+CORE_PART = "docProps/core.xml"
+CORE_MAX_SIZE = 1024 * 1024
+# Свойства документа -> теги в docProps/core.xml
+CORE_PROPERTIES = {
+    "title": "{http://purl.org/dc/elements/1.1/}title",
+    "subject": "{http://purl.org/dc/elements/1.1/}subject",
+    "author": "{http://purl.org/dc/elements/1.1/}creator",
+    "keywords": (
+        "{http://schemas.openxmlformats.org/package/2006/metadata/"
+        "core-properties}keywords"
+    ),
+    "last_modified_by": (
+        "{http://schemas.openxmlformats.org/package/2006/metadata/"
+        "core-properties}lastModifiedBy"
+    ),
+    "revision": (
+        "{http://schemas.openxmlformats.org/package/2006/metadata/"
+        "core-properties}revision"
+    ),
+    "created": "{http://purl.org/dc/terms/}created",
+    "modified": "{http://purl.org/dc/terms/}modified",
+}
+
+
+def docx_meta(file: BinaryIO, mime_type: str) -> dict[str, Any]:
+    """
+    Мета DOCX: свойства документа из docProps/core.xml.
+    Из архива читается только оглавление и эта часть, текст документа
+    не разбирается.
+    """
+    with zipfile.ZipFile(file) as archive:
+        try:
+            part = archive.getinfo(CORE_PART)
+        except KeyError:
+            return {"extension": "docs"}
+        if part.file_size > CORE_MAX_SIZE:
+            raise ValueError(f"{CORE_PART} больше {CORE_MAX_SIZE} байт")
+        root = ElementTree.fromstring(archive.read(part))
+    properties = {
+        name: (root.findtext(tag) or "").strip() or None
+        for name, tag in CORE_PROPERTIES.items()
+    }
+    return {
+        "filename": properties["title"],
+        "extension": "docs",
+        "meta": properties,
+    }
@@ -0,0 +1,25 @@
+from typing import Any, BinaryIO
+
+import PyPDF2
+
+
+def pdf_meta(file: BinaryIO, mime_type: str) -> dict[str, Any]:
+    """
+    Мета PDF: кол-во страниц, название и автор.
+    Читаются таблица ссылок, словарь документа и дерево страниц,
+    содержимое страниц не разбирается.
+    """
+    reader = PyPDF2.PdfReader(file)
+    info = reader.metadata
+    title = str(info.title) if info is not None and info.title else None
+    return {
+        "filename": title,
+        "extension": "pdf",
+        "meta": {
+            "pages": len(reader.pages),
+            "title": title,
+            "author": (
+                str(info.author) if info is not None and info.author else None
+            ),
+        },
+    }
@@ -1,21 +1,28 @@
+import asyncio
 import logging
 import os
-import uuid
-from io import BytesIO
-from typing import Union
+from typing import Any, AsyncIterator, Union
 from uuid import UUID
 
-import PyPDF2
-import magic
-import docx
-from PIL import Image
 from fastapi import UploadFile
 
 from app.dtos.dto import FileIn
-from app.repository.exceptions import FileAlreadyExistsDB, PathNotFoundDB
+from app.repository.exceptions import FileNotFoundDB, PathNotFoundDB
 from app.repository.repository import FileRepository
-from app.service.exceptions import FileNotFoundLocal, FileNotFound
+from app.service import codec
+from app.service.blob_cache import blob_cache
+from app.service.derivative_service import derivative_renderer
+from app.service.exceptions import (
+    BlobMissing, ExtractorBusy, FileNotFoundLocal, FileNotFound,
+    MetaExtractionError
+)
+from app.service.local_storage import local_storage
+from app.service.meta_extractor import (
+    extract_meta, extractor_pool, find_extractor, generic_meta, sniff_mime
+)
 from app.settings import settings
+from app.utils.metrics import BYTES_RECEIVED, FILES_STORED, INGEST_STAGE_SECONDS
+from app.utils.uid import uuid7
 
 
 class FileService:
@@ -26,7 +33,7 @@ class FileService:
         self.logger = logging.getLogger(self.__class__.__name__)
 
     async def create_new_file(self, file: UploadFile) -> dict[
-        str, Union[str, UUID, bytes]
+        str, Union[str, UUID]
     ]:
         """
         Метод для создания нового файла и объекта
@@ -35,156 +42,520 @@ class FileService:
             - file(UploadFile): Объект файла
 
         Возвращает:
-            - dict[str, Union[str, UUID, bytes]]:
-                Словарь с названием файла его UID и байт строку
+            - dict[str, Union[str, UUID]]:
+                Словарь с UID файла, ключом и локальным путем
 
         Логика:
+            - Копируем файл во временный файл вне event loop,
+            попутно считая хэш содержимого
             - Получаем всю необходимую информацию
             - Создаем объект для передачи репозиторию
         """
         self.logger.info("Сохранение нового файла")
-        file_uid: UUID = uuid.uuid4()
-        extension_dot_index = file.filename.rfind(".")
-        filename = file.filename[:extension_dot_index]
-        file_extension = file.filename[extension_dot_index + 1:]
-        file_obj = FileIn(
-            uid=str(file_uid),
-            filename=filename,
-            extension=file_extension,
-            size=file.size,
-            local_path=f"./static/{file_uid}.{file_extension}",
-            cloud_path=f"{settings.S3_PUBLIC_URL}/{file_uid}.{file_extension}"
-        )
-        return await self.__save(file_obj, file.file.read())
+        file_obj, tmp_path = await self.__write_upload(file)
+        return (await self.__save([(file_obj, tmp_path)]))[0]
 
-    async def create_new_file_chunk(self, file: bytes) -> dict[
-        str, Union[str, UUID, bytes]
+    async def create_new_files(self, files: list[UploadFile]) -> list[
+        dict[str, Union[str, UUID]]
     ]:
         """
-        Метод для создания нового файла из байт строки
+        Метод для создания нескольких файлов одним пакетом
 
         Аргументы:
-            - file(UploadFile): Объект файла
+            - files(list[UploadFile]): Объекты файлов
 
         Возвращает:
-            - dict[str, Union[str, UUID, bytes]]:
-                Словарь с названием файла его UID и байт строку
+            - list[dict[str, Union[str, UUID]]]:
+                Словари с UID файлов, ключами и локальными путями
+                в порядке переданных файлов
 
         Логика:
-            - Получаем MIME-формат
-            - Передаем байт строку в функцию для получения меты
-            - Формируем объект для передачи репозиторию
-        """
-        byte_io = BytesIO(file)
-        file_type = magic.from_buffer(byte_io.read(), mime=True)
-        file_uid = uuid.uuid4()
-        meta: dict[str, str] = await self.__extract_meta(
-            byte_io, file_type
+            - Пишем файлы на диск параллельно, не больше
+                BULK_UPLOAD_CONCURRENCY одновременно
+            - Метаданные всех файлов сохраняем одной транзакцией
+
+        Ошибки:
+            - При любой ошибке записанные временные файлы удаляются
+        """
+        self.logger.info("Пакетное сохранение %d файлов", len(files))
+        semaphore = asyncio.Semaphore(settings.BULK_UPLOAD_CONCURRENCY)
+
+        async def write(file: UploadFile) -> tuple[FileIn, str]:
+            async with semaphore:
+                return await self.__write_upload(file)
+
+        results = await asyncio.gather(
+            *(write(file) for file in files), return_exceptions=True
         )
-        file_obj = FileIn.model_validate(meta)
-        file_obj.uid = str(file_uid)
-        file_obj.size = byte_io.getbuffer().nbytes
-        file_obj.local_path = f"./static/{file_uid}.{file_obj.extension}"
-        file_obj.cloud_path = (
-            f"{settings.S3_PUBLIC_URL}/{file_uid}.{file_obj.extension}"
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            await asyncio.gather(*(
+                local_storage.remove(r[1])
+                for r in results if not isinstance(r, BaseException)
+            ))
+            raise errors[0]
+        return await self.__save(results)
+
+    async def create_new_file_from_temp(
+            self, tmp_path: str, filename: str, size: int, content_hash: str
+    ) -> dict[str, Union[str, UUID]]:
+        """
+        Метод для создания файла из уже записанного временного файла
+
+        Аргументы:
+            - tmp_path(str): путь до временного файла
+            - filename(str): имя файла от клиента
+            - size(int): размер файла
+            - content_hash(str): SHA-256 содержимого
+
+        Возвращает:
+            - dict[str, Union[str, UUID]]:
+                Словарь с UID файла, ключом и локальным путем
+
+        Логика:
+            - Временный файл становится постоянным без копирования
+                (жесткая ссылка), после сохранения его имя удаляется
+            - Мета читается из заголовков временного файла
+            - При ошибке временный файл остается на месте, сохранение
+                можно повторить
+        """
+        self.logger.info("Сохранение файла %s из %s", filename, tmp_path)
+        file_obj = self.__new_file_obj(filename, size, content_hash)
+        await self.__read_meta(file_obj, tmp_path)
+        return (
+            await self.__save([(file_obj, tmp_path)], keep_on_error=True)
+        )[0]
+
+    async def __write_upload(self, file: UploadFile) -> tuple[FileIn, str]:
+        """
+        Метод записи загруженного файла во временный файл
+
+        Возвращает:
+            - tuple[FileIn, str]: объект с данными файла и временный путь
+        """
+        with INGEST_STAGE_SECONDS.time(stage="write"):
+            tmp_path, size, content_hash = await local_storage.save_fileobj(
+                file.file
+            )
+        BYTES_RECEIVED.inc(size, api="files")
+        file_obj = self.__new_file_obj(file.filename, size, content_hash)
+        try:
+            await self.__read_meta(file_obj, tmp_path)
+        except BaseException:
+            await local_storage.remove(tmp_path)
+            raise
+        return file_obj, tmp_path
+
+    @staticmethod
+    def __new_file_obj(filename: str, size: int, content_hash: str) -> FileIn:
+        """Объект с данными файла по имени от клиента"""
+        extension_dot_index = filename.rfind(".")
+        if extension_dot_index == -1:
+            return FileIn(
+                filename=filename, extension="bin",
+                size=size, content_hash=content_hash,
+            )
+        return FileIn(
+            filename=filename[:extension_dot_index],
+            extension=filename[extension_dot_index + 1:],
+            size=size,
+            content_hash=content_hash,
         )
-        return await self.__save(file_obj, file)
 
-    async def __save(self, file_obj: FileIn, binary_file: bytes) -> dict[
-        str, Union[str, UUID, bytes]
-    ]:
+    async def create_new_file_stream(
+            self, stream: AsyncIterator[bytes]
+    ) -> dict[str, Union[str, UUID]]:
         """
-        Метод сохранения данных о файле в БД и файла в локальное хранилище
+        Метод для создания нового файла из потока байт
 
         Аргументы:
-            - file_obj(FileIn): объект с данными файла
-            - binary_file(bytes): бинарная строка
+            - stream(AsyncIterator[bytes]): Поток чанков файла
 
         Возвращает:
-            - dict[str, Union[str, UUID, bytes]]:
-                Словарь с названием файла его UID и байт строку
+            - dict[str, Union[str, UUID]]:
+                Словарь с UID файла, ключом и локальным путем
 
         Логика:
-            - Запускаем цикл и пробуем сохранить данные в БД.
-            - Если файл с таким UID существует меняем его и пробуем снова.
-            - Сохраняем файл локально.
+            - Пишем чанки во временный файл по мере поступления
+            - Считаем размер и хэш, копим первые байты для определения MIME
+            - Получаем MIME по первым байтам и мету из временного файла.
+                Если мету получить не удалось, файл сохраняется с общей
+                метой по MIME
+            - Переносим файл под постоянное имя и сохраняем данные в БД
+
+        Ошибки:
+            - Любая ошибка удаляет временный файл и пробрасывается дальше
         """
-        while True:
-            try:
-                self.logger.info("Попытка сохранить информацию о файле в БД")
-                await self.file_repository.save_file_data(file_obj)
-                self.logger.info(f"Файл успешно сохранен с UID: {file_obj.uid}")
-                break
-            except FileAlreadyExistsDB as e:
-                self.logger.warning(f"{e} Замена")
-            file_obj.uid = uuid.uuid4()
-            file_obj.local_path = (
-                f"./static/{file_obj.uid}.{file_obj.extension}"
-            )
-            file_obj.cloud_path = (
-                f"{settings.S3_PUBLIC_URL}/{file_obj.uid}.{file_obj.extension}"
+        self.logger.info("Сохранение нового файла из потока")
+        writer = await local_storage.open_writer()
+        head = b""
+        try:
+            with INGEST_STAGE_SECONDS.time(stage="write"):
+                async for chunk in stream:
+                    if len(head) < settings.MIME_SNIFF_BYTES:
+                        head += chunk[:settings.MIME_SNIFF_BYTES - len(head)]
+                    await writer.write(chunk)
+                await writer.close()
+            BYTES_RECEIVED.inc(writer.size, api="stream")
+
+            with INGEST_STAGE_SECONDS.time(stage="meta"):
+                meta = await self.__extract_meta(
+                    writer.path, head, writer.size
+                )
+        except BaseException:
+            await local_storage.remove(writer.path)
+            raise
+
+        file_obj = FileIn.model_validate(meta)
+        file_obj.size = writer.size
+        file_obj.content_hash = writer.digest
+        return (await self.__save([(file_obj, writer.path)]))[0]
+
+    async def __extract_meta(
+            self, path: str, head: bytes, size: int
+    ) -> dict[str, Any]:
+        """
+        Метод получения меты файла
+
+        Логика:
+            - MIME определяется по первым байтам вне event loop
+            - Если для MIME есть получатель меты и файл не больше его
+                лимита, мета читается в пуле воркеров с таймаутом
+                получателя
+            - Иначе, а также если пул занят, истек таймаут или упал
+                воркер, берется общая мета по MIME без пула. Сохранению
+                файла это не мешает
+        """
+        mime_type = await asyncio.to_thread(sniff_mime, head)
+        extractor = find_extractor(mime_type, size)
+        if extractor is None:
+            return generic_meta(mime_type)
+        try:
+            return await extractor_pool.run(
+                extract_meta, path, mime_type, settings.META_HEADER_BYTES,
+                timeout=extractor.timeout,
             )
+        except (ExtractorBusy, MetaExtractionError) as e:
+            self.logger.warning("Мета файла %s не получена: %s", path, e)
+            return generic_meta(mime_type)
 
-        with open(f"{file_obj.local_path}", "wb") as f:
-            f.write(binary_file)
-        self.logger.info(
-            f"Файл успешно сохранен с названием:"
-            f" {file_obj.uid}.{file_obj.extension}."
-        )
-        return {
-            "file_uid": file_obj.uid,
-            "file_key": f"{file_obj.uid}.{file_obj.extension}",
-            "binary_file": binary_file,
-        }
+    async def __read_meta(self, file_obj: FileIn, path: str) -> None:
+        """
+        Метод получения меты из заголовков файла с именем от клиента
+
+        Логика:
+            - Название и расширение остаются от клиента, берется только
+                структурированная мета
+            - Занятый пул или таймаут не мешают сохранению файла,
+                он сохраняется без меты
+        """
+        with INGEST_STAGE_SECONDS.time(stage="meta"):
+            head = await asyncio.to_thread(self.__read_head, path)
+            meta = await self.__extract_meta(path, head, file_obj.size)
+        file_obj.meta = meta.get("meta")
 
     @staticmethod
-    async def __extract_meta(file: BytesIO, mime_type: str) -> dict[str, str]:
+    def __read_head(path: str) -> bytes:
+        """Первые байты файла для определения MIME"""
+        with open(path, "rb") as f:
+            return f.read(settings.MIME_SNIFF_BYTES)
+
+    async def __store_blob(self, file_obj: FileIn, tmp_path: str) -> bool:
         """
-        Метод получения меты
+        Метод переноса временного файла под хэш содержимого
 
         Аргументы:
-            - file(ByteIO): байт строка
-            - mime_type(str): тип файла
+            - file_obj(FileIn): объект с данными файла и хэшем содержимого
+            - tmp_path(str): путь до временного файла
 
         Возвращает:
-            - dict[str, str]: Словарь с названием, расширением
+            - bool: был ли создан новый файл (False - дубль)
 
         Логика:
-            - Проверяем MIME и выбираем подходящую библиотеку.
-            - Получаем нужные данные
+            - Если файл с таким содержимым уже есть в любом формате,
+                объект ссылается на существующий
+            - Иначе файл сжимается кодеком STORAGE_CODEC, если сжимается
+                достаточно хорошо, и хранится с суффиксом кодека
+            - Временный файл остается на месте (новый файл - ссылка на него
+                или сжатая копия), его удаляет вызывающий
+        """
+        blob_key = f"{file_obj.content_hash}.{file_obj.extension}"
+        stored = await asyncio.to_thread(self.__find_blob, blob_key)
+        encoding, blob_path = (
+            (stored, tmp_path) if stored is not None
+            else await self.__encode(file_obj, tmp_path)
+        )
 
-        PS: Для некоторых типов не смог найти подходящую библиотеку
+        if encoding != codec.IDENTITY:
+            blob_key += codec.SUFFIXES[encoding]
+        file_obj.encoding = encoding
+        file_obj.local_path = local_storage.blob_path(blob_key)
+        file_obj.cloud_path = f"{settings.S3_PUBLIC_URL}/{blob_key}"
+        if stored is None:
+            try:
+                with INGEST_STAGE_SECONDS.time(stage="commit"):
+                    if blob_path == tmp_path:
+                        await local_storage.link(tmp_path, file_obj.local_path)
+                    else:
+                        await local_storage.commit(
+                            blob_path, file_obj.local_path
+                        )
+                return True
+            except FileExistsError:
+                pass
+            finally:
+                if blob_path != tmp_path:
+                    await local_storage.remove(blob_path)
+        self.logger.info("Файл %s уже хранится. Дедупликация", blob_key)
+        return False
+
+    @staticmethod
+    def __find_blob(blob_key: str) -> str | None:
+        """Формат, в котором файл уже хранится, или None"""
+        for encoding in (codec.IDENTITY, *codec.SUFFIXES):
+            suffix = codec.SUFFIXES.get(encoding, "")
+            if os.path.exists(local_storage.blob_path(blob_key + suffix)):
+                return encoding
+        return None
+
+    async def __encode(
+            self, file_obj: FileIn, tmp_path: str
+    ) -> tuple[str, str]:
         """
-        if mime_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            doc = docx.Document(file)
-            props = doc.core_properties
-            return {
-                "filename": props.title,
-                "extension": "docs",
-            }
-        elif mime_type.startswith("audio"):
-            return {
-                "filename": "unknown",
-                "extension": mime_type[mime_type.rfind("/") + 1:],
-            }
-        elif mime_type.startswith("video"):
-            return {
-                "filename": "unknown",
-                "extension": mime_type[mime_type.rfind("/") + 1:],
-            }
-        elif mime_type.startswith("image"):
-            image = Image.open(file)
-            return {
-                "filename": image.filename,
-                "extension": image.format.lower(),
+        Метод сжатия временного файла
+
+        Возвращает:
+            - tuple[str, str]: формат хранения и путь до файла в нем
+
+        Логика:
+            - Уже сжатые форматы (медиа, архивы) не сжимаются
+            - Сжатие идет в пуле воркеров по выборке из начала файла.
+                Если пул занят, файл хранится как есть
+            - Сжатый файл пишется рядом, исходный не удаляется
+        """
+        encoding = settings.STORAGE_CODEC
+        if (
+            encoding == "none"
+            or not codec.available(encoding)
+            or not codec.is_compressible(file_obj.extension)
+        ):
+            return codec.IDENTITY, tmp_path
+        try:
+            with INGEST_STAGE_SECONDS.time(stage="encode"):
+                encoded_path = await extractor_pool.run(
+                    codec.encode_file, tmp_path, encoding,
+                    settings.STORAGE_CODEC_LEVEL,
+                    settings.STORAGE_CODEC_MIN_RATIO,
+                    settings.STORAGE_CODEC_SAMPLE,
+                    settings.STORAGE_FSYNC != "none",
+                )
+        except (ExtractorBusy, MetaExtractionError) as e:
+            self.logger.warning("Файл сохранен без сжатия: %s", e)
+            await local_storage.remove(tmp_path + codec.SUFFIXES[encoding])
+            return codec.IDENTITY, tmp_path
+        if encoded_path is None:
+            return codec.IDENTITY, tmp_path
+        return encoding, encoded_path
+
+    async def __save(
+            self, items: list[tuple[FileIn, str]], keep_on_error: bool = False
+    ) -> list[dict[str, Union[str, UUID]]]:
+        """
+        Метод сохранения файлов в локальное хранилище и данных о них в БД
+
+        Аргументы:
+            - items(list[tuple[FileIn, str]]): объекты с данными файлов
+                и пути до временных файлов
+            - keep_on_error(bool): не удалять временные файлы при ошибке
+
+        Возвращает:
+            - list[dict[str, Union[str, UUID]]]:
+                Словари с UID файла, ключом и локальным путем
+
+        Логика:
+            - Файлы хранятся под хэшем содержимого, дубли ссылаются на
+                существующий файл (задача репликации для него уже есть).
+            - Перенос и сжатие файлов идут до транзакции, соединение
+                из пула на это время не занято.
+            - Строки пишутся одной транзакцией под блокировкой хэшей
+                содержимого (ее же берет очистка). В этой транзакции
+                проверяем, что файлы хранилища на месте: если очистка
+                успела удалить найденный дубль, переносим файлы еще раз
+                из временных.
+            - UID упорядочены по времени (UUIDv7), занятые UID репозиторий
+                заменяет сам, без повтора транзакции.
+            - Если запись не удалась, под той же блокировкой удаляем новые
+                файлы, на которые никто не ссылается.
+            - Временные файлы удаляются в конце (при keep_on_error -
+                только после успешного сохранения).
+            - Для новых изображений в фоне создаются превью
+                DERIVATIVE_PRESETS.
+        """
+        file_objs = [file_obj for file_obj, _ in items]
+        created = [False] * len(items)
+        try:
+            for attempt in range(2):
+                stored = await asyncio.gather(
+                    *(self.__store_blob(file_obj, path) for file_obj, path in items),
+                    return_exceptions=True
+                )
+                created = [
+                    was_new or is_new is True
+                    for was_new, is_new in zip(created, stored)
+                ]
+                for result in stored:
+                    if isinstance(result, BaseException):
+                        raise result
+                for file_obj in file_objs:
+                    file_obj.uid = str(uuid7())
+                self.logger.info("Попытка сохранить информацию о файлах в БД")
+                try:
+                    with INGEST_STAGE_SECONDS.time(stage="db"):
+                        await self.file_repository.save_files_data(
+                            file_objs, uuid7,
+                            before_insert=lambda: self.__check_blobs(file_objs)
+                        )
+                    break
+                except BlobMissing as e:
+                    if attempt:
+                        raise
+                    self.logger.warning("%s. Повторный перенос", e)
+        except BaseException:
+            await self.__remove_unreferenced(file_objs, created)
+            if not keep_on_error:
+                for _, path in items:
+                    await local_storage.remove(path)
+            raise
+        for _, path in items:
+            await local_storage.remove(path)
+
+        for file_obj, is_new in zip(file_objs, created):
+            FILES_STORED.inc(result="new" if is_new else "duplicate")
+            self.logger.info(
+                "Файл успешно сохранен с UID %s как %s. Размер: %s",
+                file_obj.uid, file_obj.local_path, file_obj.size
+            )
+            if is_new:
+                derivative_renderer.schedule_presets(
+                    file_obj.local_path, file_obj.extension
+                )
+        return [
+            {
+                "file_uid": file_obj.uid,
+                "file_key": file_obj.local_path[file_obj.local_path.rfind("/") + 1:],
+                "file_path": file_obj.local_path,
             }
-        elif mime_type == "application/pdf":
-            pdf_file = PyPDF2.PdfReader(file)
-            info = pdf_file.metadata
-            return {
-                "filename": info.title,
-                "extension": "pdf",
+            for file_obj in file_objs
+        ]
+
+    @staticmethod
+    async def __check_blobs(file_objs: list[FileIn]) -> None:
+        """
+        Проверка, что файлы хранилища на месте.
+        Вызывается в транзакции под блокировкой хэшей содержимого
+
+        Ошибки:
+            - BlobMissing: файл удален очисткой после переноса
+        """
+        missing = await asyncio.to_thread(
+            lambda: [
+                file_obj.local_path for file_obj in file_objs
+                if not os.path.exists(file_obj.local_path)
+            ]
+        )
+        if missing:
+            raise BlobMissing(missing[0])
+
+    async def __remove_unreferenced(
+            self, file_objs: list[FileIn], created: list[bool]
+    ) -> None:
+        """
+        Метод удаления новых файлов хранилища, на которые нет ссылок
+        после неудачной записи в БД
+        """
+        new = [
+            file_obj for file_obj, is_new in zip(file_objs, created) if is_new
+        ]
+        if not new:
+            return
+        try:
+            async with self.file_repository.lock_unreferenced(
+                    [file_obj.content_hash for file_obj in new]
+            ) as unreferenced:
+                for file_obj in new:
+                    if file_obj.content_hash in unreferenced:
+                        await local_storage.remove(file_obj.local_path)
+        except Exception as e:
+            self.logger.error(
+                "Не удалось удалить новые файлы после ошибки. Детали: %s", e
+            )
+
+    async def get_files_metadata(
+            self, uids: list[UUID]
+    ) -> tuple[list[dict[str, Any]], list[UUID]]:
+        """
+        Метод для получения метаданных нескольких файлов
+
+        Аргументы:
+            - uids(list[UUID]): UID файлов
+
+        Возвращает:
+            - tuple[list[dict[str, Any]], list[UUID]]:
+                метаданные найденных файлов и список ненайденных UID
+
+        Логика:
+            - Получаем все строки одним запросом
+            - Наличие и размер файлов на диске (storedSize, для сжатых
+                файлов меньше size) проверяем одним вызовом в потоке
+        """
+        rows = await self.file_repository.get_files_metadata(uids)
+        stored = await asyncio.to_thread(
+            lambda: [self.__stored_size(row["local_path"]) for row in rows]
+        )
+        found = {row["uid"] for row in rows}
+        files = [
+            {
+                "uid": str(row["uid"]),
+                "filename": row["filename"],
+                "extension": row["extension"],
+                "size": row["size"],
+                "local": stored_size is not None,
+                "storedSize": stored_size,
+                "cloudUrl": row["cloud_path"],
+                "contentHash": row["content_hash"],
+                "encoding": row["encoding"],
+                "meta": row["meta"],
+                "createdAt": row["created_at"].isoformat(),
             }
+            for row, stored_size in zip(rows, stored)
+        ]
+        return files, [uid for uid in uids if uid not in found]
+
+    @staticmethod
+    def __stored_size(path: str) -> int | None:
+        """Размер файла на диске, None - файла нет"""
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return None
+
+    async def get_file_metadata(self, uid: UUID) -> dict[str, Any]:
+        """
+        Метод для получения метаданных файла без чтения самого файла
+
+        Аргументы:
+            - uid(UUID): UID файла
+
+        Возвращает:
+            - dict[str, Any]: метаданные файла
+
+        Ошибки:
+            - FileNotFound: файла нет
+        """
+        files, _ = await self.get_files_metadata([uid])
+        if not files:
+            raise FileNotFound(uid)
+        return files[0]
 
     async def get_file_by_uid_local(self, uid: UUID) -> dict[str, str]:
         """
@@ -198,27 +569,28 @@ class FileService:
 
         Логика:
             - Получаем локальный путь из БД
-            - Проверяем существует ли он, если да, возвращаем название и путь
+            - Проверяем существует ли он (файлы из blob_cache без обращения
+                к диску), если да, возвращаем название и путь
 
         Ошибки:
             - FileNotFoundLocal: Файла нет локально
         """
-        self.logger.info(f"Получение пути сохранения файла с {uid=}")
+        self.logger.info("Получение пути сохранения файла с uid=%s", uid)
         try:
             path = await self.file_repository.get_file_local_path(uid)
         except PathNotFoundDB as e:
             self.logger.error(e)
             raise FileNotFoundLocal(uid)
 
-        if os.path.exists(path):
-            self.logger.info(f"Файл найден по пути: {path}")
-            filename = path[path.rfind("/") + 1:]
+        if path in blob_cache or os.path.exists(path):
+            self.logger.info("Файл найден по пути: %s", path)
+            filename = f"{uid}{os.path.splitext(codec.strip_encoding(path))[1]}"
             return {
                 "path": path,
                 "filename": filename
             }
         else:
-            self.logger.info(f"Файл не найден по пути: {path}")
+            self.logger.info("Файл не найден по пути: %s", path)
             raise FileNotFoundLocal(uid, path)
 
     async def get_file_by_uid_cloud(self, uid: UUID) -> str:
@@ -234,10 +606,29 @@ class FileService:
         Ошибки:
             - FileNotFound: файла нет
         """
-        self.logger.info(f"Получение ссылки для файла с {uid=}")
+        self.logger.info("Получение ссылки для файла с uid=%s", uid)
         try:
             link = await self.file_repository.get_file_cloud_path(uid)
             return link
         except PathNotFoundDB as e:
             self.logger.error(e)
             raise FileNotFound(uid)
+
+    async def get_replication_state(self, uid: UUID) -> dict[str, Any]:
+        """
+        Метод получения состояния репликации файла в облако
+
+        Аргументы:
+            - uid(UUID): UID файла
+
+        Возвращает:
+            - dict[str, Any]: состояние, кол-во попыток и последняя ошибка
+
+        Ошибки:
+            - FileNotFound: файла нет
+        """
+        try:
+            return await self.file_repository.get_replication_state(uid)
+        except FileNotFoundDB as e:
+            self.logger.error(e)
+            raise FileNotFound(uid)
@@ -0,0 +1,68 @@
+import os
+
+from app.service import codec
+
+# Форматы производных и их расширения
+IMAGE_FORMATS = {"jpeg": "jpg", "png": "png", "webp": "webp"}
+# Расширения исходных файлов, из которых делаются производные
+SOURCE_EXTENSIONS = {
+    "jpg", "jpeg", "png", "gif", "webp", "bmp", "tiff", "tif",
+}
+
+
+def render_image(
+        source: str, target: str, width: int | None, height: int | None,
+        image_format: str, quality: int, fsync: bool
+) -> int:
+    """
+    Функция создания уменьшенной копии изображения.
+    Выполняется в пуле воркеров, поэтому синхронная.
+
+    Аргументы:
+        - source(str): путь до исходного файла, возможно сжатого
+        - target(str): путь для сохранения копии
+        - width(int | None): максимальная ширина
+        - height(int | None): максимальная высота
+        - image_format(str): jpeg, png или webp
+        - quality(int): качество для jpeg и webp
+        - fsync(bool): нужно ли делать fsync копии
+
+    Возвращает:
+        - int: размер копии в байтах
+
+    Логика:
+        - Пропорции сохраняются, изображение вписывается в
+            width x height и не увеличивается
+        - JPEG декодируется сразу в уменьшенном масштабе (draft),
+            не распаковывая полное изображение
+        - Поворот из EXIF применяется, остальные метаданные не копируются
+        - PIL импортируется при первом вызове в воркере, а не при
+            запуске приложения
+
+    Ошибки:
+        - OSError: файл не читается как изображение
+        - ValueError: изображение слишком большое (DecompressionBombError)
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        with codec.open_decoded(source) as f, Image.open(f) as image:
+            size = (width or image.width, height or image.height)
+            image.draft("RGB", size)
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(size, Image.Resampling.LANCZOS)
+            if image_format == "jpeg" and image.mode != "RGB":
+                image = image.convert("RGB")
+            elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+                image = image.convert("RGBA")
+            with open(target, "wb") as out:
+                image.save(
+                    out, format=image_format.upper(), quality=quality,
+                    optimize=True,
+                )
+                if fsync:
+                    out.flush()
+                    os.fsync(out.fileno())
+                return out.tell()
+    except Image.DecompressionBombError as e:
+        raise ValueError(str(e))
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+from typing import Any
+
+from app.repository.repository import LayoutRepository
+from app.repository.session import async_session
+from app.service.local_storage import STATIC_DIR, local_storage
+from app.settings import settings
+
+
+class LayoutMigrationService:
+    """
+    Перенос файлов из корня ./static во вложенные папки без остановки сервиса.
+
+    Для каждого файла создается жесткая ссылка по новому пути, затем пути
+    меняются в БД, и только после паузы grace удаляется старый путь. Пока
+    пауза не прошла, запущенный сервис может отдать файл по старому пути
+    из кэша путей или реплицировать его из уже захваченной задачи.
+    Если прервать перенос во время паузы, старые пути останутся на диске
+    и их можно удалить вручную: в БД на них уже никто не ссылается.
+    """
+    def __init__(self):
+        """Инициализация"""
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def run(self, batch_size: int, grace: float) -> dict[str, int]:
+        """
+        Метод запуска переноса
+
+        Аргументы:
+            - batch_size(int): размер пачки строк
+            - grace(float): через сколько секунд удалять старые пути
+
+        Возвращает:
+            - dict[str, int]: кол-во перенесенных строк, файлов
+                и файлов, которых не было на диске
+
+        Логика:
+            - Берем пачку строк с путями в корне ./static по порядку
+                (created_at, id), следующая пачка начинается после нее
+            - Создаем новые пути, меняем пути в БД одной транзакцией
+            - Старые пути удаляем, когда для них прошла пауза grace
+        """
+        if settings.STORAGE_SHARD_LEVELS <= 0:
+            self.logger.info("Вложенные папки отключены, переносить нечего")
+            return {"rows": 0, "files": 0, "missing": 0}
+
+        stats = {"rows": 0, "files": 0, "missing": 0}
+        repository = LayoutRepository(async_session)
+        after = None
+        pending: list[tuple[float, list[str]]] = []
+        while True:
+            rows = await repository.get_flat_batch(
+                STATIC_DIR, after, batch_size
+            )
+            if not rows:
+                break
+            after = (rows[-1]["created_at"], rows[-1]["id"])
+            moves = self.__group(rows)
+            for move in moves:
+                if not await self.__link(move):
+                    stats["missing"] += 1
+            await repository.move_paths(moves)
+
+            pending.append(
+                (time.monotonic() + grace, [move["src"] for move in moves])
+            )
+            pending = await self.__remove_expired(pending)
+            stats["rows"] += len(rows)
+            stats["files"] += len(moves)
+            self.logger.info(
+                "Перенесено строк: %d, файлов: %d",
+                stats["rows"], stats["files"]
+            )
+
+        if pending:
+            self.logger.info(
+                "Ожидание %s сек. перед удалением старых путей", grace
+            )
+            await asyncio.sleep(max(0.0, pending[-1][0] - time.monotonic()))
+            await self.__remove_expired(pending)
+        self.logger.info("Перенос завершен: %s", stats)
+        return stats
+
+    @staticmethod
+    def __group(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Группировка строк пачки по файлу
+
+        Аргументы:
+            - rows(list[dict[str, Any]]): строки пачки
+
+        Возвращает:
+            - list[dict[str, Any]]: старый и новый путь, хэш и UID строк
+        """
+        moves: dict[str, dict[str, Any]] = {}
+        for row in rows:
+            src = row["local_path"]
+            move = moves.setdefault(src, {
+                "src": src,
+                "dst": local_storage.blob_path(src[src.rfind("/") + 1:]),
+                "content_hash": row["content_hash"],
+                "uids": [],
+            })
+            move["uids"].append(row["uid"])
+        return list(moves.values())
+
+    async def __link(self, move: dict[str, Any]) -> bool:
+        """
+        Создание нового пути файла
+
+        Аргументы:
+            - move(dict[str, Any]): старый и новый путь
+
+        Возвращает:
+            - bool: был ли файл на диске
+
+        Логика:
+            - Имя файла - хэш содержимого или UID, поэтому существующий
+                новый путь значит тот же файл (например, загруженный дубль)
+            - Отсутствующий файл не мешает переносу: путь в БД меняется,
+                файл отдается из облака как и раньше
+        """
+        try:
+            await local_storage.link(move["src"], move["dst"])
+        except FileExistsError:
+            pass
+        except FileNotFoundError:
+            self.logger.warning("Файл %s не найден на диске", move["src"])
+            return False
+        return True
+
+    @staticmethod
+    async def __remove_expired(
+            pending: list[tuple[float, list[str]]]
+    ) -> list[tuple[float, list[str]]]:
+        """
+        Удаление старых путей, для которых прошла пауза
+
+        Аргументы:
+            - pending(list[tuple[float, list[str]]]): время удаления
+                и старые пути по пачкам
+
+        Возвращает:
+            - list[tuple[float, list[str]]]: пачки, для которых пауза
+                еще не прошла
+        """
+        now = time.monotonic()
+        for deadline, paths in pending:
+            if deadline <= now:
+                await asyncio.gather(
+                    *(local_storage.remove(path) for path in paths)
+                )
+        return [item for item in pending if item[0] > now]
@@ -0,0 +1,366 @@
+import asyncio
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import AsyncIterator, BinaryIO
+
+from app.settings import settings
+
+# Корневая папка файлов
+STATIC_DIR = "./static"
+
+
+class BlobWriter:
+    """Запись файла во временный файл вне event loop с подсчетом SHA-256"""
+    def __init__(self, path: str, fsync: bool):
+        """
+        Инициализация
+
+        Аргументы:
+            - path(str): путь временного файла
+            - fsync(bool): нужно ли делать fsync при закрытии
+        """
+        self.path = path
+        self.fsync = fsync
+        self.size = 0
+        self.digest: str | None = None
+        self.__hash = hashlib.sha256()
+        self.__buffer = bytearray()
+        self.__file: BinaryIO | None = None
+
+    async def open(self) -> None:
+        """Открытие временного файла"""
+        self.__file = await asyncio.to_thread(open, self.path, "wb")
+
+    async def write(self, chunk: bytes) -> None:
+        """
+        Запись чанка
+
+        Логика:
+            - Чанки копятся в буфере и сбрасываются на диск в потоке,
+                когда буфер больше STORAGE_WRITE_BUFFER
+        """
+        self.__buffer += chunk
+        self.size += len(chunk)
+        if len(self.__buffer) >= settings.STORAGE_WRITE_BUFFER:
+            await self.__flush()
+
+    async def close(self) -> None:
+        """Сброс буфера, fsync по политике и закрытие файла"""
+        await self.__flush()
+        await asyncio.to_thread(self.__close)
+        self.digest = self.__hash.hexdigest()
+
+    async def __flush(self) -> None:
+        if self.__buffer:
+            data, self.__buffer = bytes(self.__buffer), bytearray()
+            await asyncio.to_thread(self.__write, data)
+
+    def __write(self, data: bytes) -> None:
+        self.__file.write(data)
+        self.__hash.update(data)
+
+    def __close(self) -> None:
+        if self.fsync:
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+        self.__file.close()
+
+
+class LocalStorage:
+    """
+    Хранилище файлов на диске
+
+    Файлы сначала пишутся во временный файл, затем атомарно переносятся
+    под постоянное имя. Долговечность задается STORAGE_FSYNC:
+        - none: без fsync
+        - file: fsync файла перед переносом
+        - dir: fsync файла и папки после переноса
+    """
+    def __init__(self):
+        """Инициализация"""
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @property
+    def fsync_file(self) -> bool:
+        return settings.STORAGE_FSYNC in ("file", "dir")
+
+    @property
+    def fsync_dir(self) -> bool:
+        return settings.STORAGE_FSYNC == "dir"
+
+    @staticmethod
+    def blob_path(name: str) -> str:
+        """
+        Постоянный путь файла
+
+        Аргументы:
+            - name(str): имя файла
+
+        Возвращает:
+            - str: путь во вложенных папках по началу имени,
+                например ./static/ab/cd/abcd....pdf
+
+        Логика:
+            - STORAGE_SHARD_LEVELS уровней по STORAGE_SHARD_WIDTH символов,
+                чтобы в одной папке не было миллионов файлов
+        """
+        width = settings.STORAGE_SHARD_WIDTH
+        shards = [
+            name[level * width:(level + 1) * width]
+            for level in range(settings.STORAGE_SHARD_LEVELS)
+        ]
+        return "/".join([STATIC_DIR, *shards, name])
+
+    @staticmethod
+    def temp_path() -> str:
+        """Новый путь для временного файла"""
+        return f"{settings.UPLOAD_TMP_DIR}/{uuid.uuid4()}.part"
+
+    async def open_writer(self) -> BlobWriter:
+        """
+        Метод создания записи во временный файл
+
+        Возвращает:
+            - BlobWriter: объект для записи чанков
+        """
+        writer = BlobWriter(self.temp_path(), self.fsync_file)
+        await writer.open()
+        return writer
+
+    async def save_fileobj(self, file: BinaryIO) -> tuple[str, int, str]:
+        """
+        Метод копирования файлового объекта во временный файл
+
+        Аргументы:
+            - file(BinaryIO): файловый объект
+
+        Возвращает:
+            - tuple[str, int, str]: путь временного файла, размер и SHA-256
+        """
+        path = self.temp_path()
+        size, digest = await asyncio.to_thread(self.__copy, file, path)
+        return path, size, digest
+
+    def __copy(self, file: BinaryIO, path: str) -> tuple[int, str]:
+        content_hash = hashlib.sha256()
+        with open(path, "wb") as f:
+            while chunk := file.read(settings.STORAGE_WRITE_BUFFER):
+                f.write(chunk)
+                content_hash.update(chunk)
+            size = f.tell()
+            if self.fsync_file:
+                f.flush()
+                os.fsync(f.fileno())
+        return size, content_hash.hexdigest()
+
+    async def hash_file(self, path: str) -> str:
+        """
+        Метод подсчета SHA-256 файла вне event loop
+
+        Аргументы:
+            - path(str): путь файла
+
+        Возвращает:
+            - str: SHA-256
+        """
+        return await asyncio.to_thread(self.__hash_file, path)
+
+    @staticmethod
+    def __hash_file(path: str) -> str:
+        content_hash = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(settings.STORAGE_WRITE_BUFFER):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
+
+    async def allocate(self, path: str, size: int) -> None:
+        """
+        Метод создания файла заданного размера для записи частей
+
+        Аргументы:
+            - path(str): путь файла
+            - size(int): размер файла
+        """
+        await asyncio.to_thread(self.__allocate, path, size)
+
+    @staticmethod
+    def __allocate(path: str, size: int) -> None:
+        with open(path, "wb") as f:
+            f.truncate(size)
+
+    async def write_at(
+            self, path: str, offset: int, stream: AsyncIterator[bytes],
+            limit: int, deadline: float | None = None
+    ) -> int:
+        """
+        Метод записи потока в существующий файл с заданного смещения
+
+        Аргументы:
+            - path(str): путь файла
+            - offset(int): смещение
+            - stream(AsyncIterator[bytes]): поток чанков
+            - limit(int): максимум байт
+            - deadline(float | None): time.monotonic(), после которого
+                запись прерывается
+
+        Возвращает:
+            - int: кол-во записанных байт
+
+        Логика:
+            - Чанки копятся в буфере и пишутся pwrite в потоке, поэтому
+                несколько частей пишутся в один файл параллельно
+            - fsync по политике STORAGE_FSYNC
+
+        Ошибки:
+            - ValueError: в потоке больше limit байт
+            - TimeoutError: запись не уложилась в deadline
+        """
+        fd = await asyncio.to_thread(os.open, path, os.O_WRONLY)
+        written = 0
+        buffer = bytearray()
+        try:
+            async for chunk in stream:
+                if written + len(buffer) + len(chunk) > limit:
+                    raise ValueError(f"Получено больше {limit} байт")
+                buffer += chunk
+                if len(buffer) >= settings.STORAGE_WRITE_BUFFER:
+                    await self.__write_chunk(
+                        fd, bytes(buffer), offset + written, deadline
+                    )
+                    written += len(buffer)
+                    buffer = bytearray()
+            if buffer:
+                await self.__write_chunk(
+                    fd, bytes(buffer), offset + written, deadline
+                )
+                written += len(buffer)
+            if self.fsync_file:
+                await asyncio.to_thread(os.fsync, fd)
+        finally:
+            await asyncio.to_thread(os.close, fd)
+        return written
+
+    async def __write_chunk(
+            self, fd: int, data: bytes, offset: int, deadline: float | None
+    ) -> None:
+        """
+        Запись чанка в потоке, если deadline не прошел. Поток не
+        прерывается, поэтому при отмене запроса дожидаемся конца записи:
+        после выхода из write_at файл больше не меняется
+        """
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("Время записи вышло")
+        write = asyncio.ensure_future(
+            asyncio.to_thread(self.__pwrite, fd, data, offset)
+        )
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            await asyncio.wait([write])
+            raise
+
+    @staticmethod
+    def __pwrite(fd: int, data: bytes, offset: int) -> None:
+        view = memoryview(data)
+        while view:
+            count = os.pwrite(fd, view, offset)
+            view = view[count:]
+            offset += count
+
+    async def commit(self, src: str, dst: str) -> None:
+        """
+        Метод атомарного переноса файла под постоянное имя
+
+        Аргументы:
+            - src(str): текущий путь файла
+            - dst(str): постоянный путь файла
+
+        Ошибки:
+            - FileExistsError: по пути dst уже есть файл
+        """
+        await asyncio.to_thread(self.__commit, src, dst)
+
+    def __commit(self, src: str, dst: str) -> None:
+        self.__link(src, dst)
+        os.unlink(src)
+
+    async def link(self, src: str, dst: str) -> None:
+        """
+        Метод создания второго пути к файлу без удаления первого
+
+        Аргументы:
+            - src(str): текущий путь файла
+            - dst(str): новый путь файла
+
+        Ошибки:
+            - FileExistsError: по пути dst уже есть файл
+        """
+        await asyncio.to_thread(self.__link, src, dst)
+
+    def __link(self, src: str, dst: str) -> None:
+        parent = os.path.dirname(dst) or "."
+        parents = self.__makedirs(parent)
+        try:
+            # link не перезаписывает существующий файл, в отличие от replace
+            os.link(src, dst)
+        except FileExistsError:
+            raise
+        except OSError as e:
+            if e.errno not in (errno.EPERM, errno.ENOTSUP, errno.EXDEV):
+                raise
+            if os.path.exists(dst):
+                raise FileExistsError(errno.EEXIST, "Файл существует", dst)
+            tmp_path = self.temp_path()
+            shutil.copyfile(src, tmp_path)
+            os.replace(tmp_path, dst)
+        if self.fsync_dir:
+            for path in [parent, *parents]:
+                self.__fsync_dir(path)
+
+    @staticmethod
+    def __makedirs(path: str) -> list[str]:
+        """
+        Создание папки со всеми родительскими
+
+        Возвращает:
+            - list[str]: папки, в которых появились новые записи
+                (родители созданных папок), их тоже нужно fsync
+        """
+        parents = []
+        current = path
+        while current and not os.path.isdir(current):
+            current = os.path.dirname(current)
+            parents.append(current or ".")
+        os.makedirs(path, exist_ok=True)
+        return parents
+
+    @staticmethod
+    def __fsync_dir(path: str) -> None:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    async def remove(self, path: str) -> None:
+        """
+        Метод удаления файла, если он существует
+
+        Аргументы:
+            - path(str): путь файла
+        """
+        try:
+            await asyncio.to_thread(os.remove, path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.error("Не удалось удалить файл %s. Детали: %s", path, e)
+
+
+# Общее локальное хранилище приложения
+local_storage = LocalStorage()
@@ -0,0 +1,433 @@
+import asyncio
+import importlib
+import logging
+import mimetypes
+import multiprocessing
+import threading
+import time
+from concurrent.futures import (
+    Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+)
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, BinaryIO, Callable
+
+from app.service.exceptions import ExtractorBusy, MetaExtractionError
+from app.settings import settings
+
+logger = logging.getLogger("MetaExtractor")
+
+
+class Extractor:
+    """
+    Получатель меты файлов одного типа.
+
+    Функция задается строкой "модуль:функция" и импортируется при первом
+    вызове в том процессе, где вызвана, поэтому тяжелые библиотеки
+    не загружаются, пока не пришел файл нужного типа.
+    """
+    def __init__(
+            self, target: str, max_size: int | None = None,
+            timeout: float | None = None
+    ):
+        """
+        Инициализация
+
+        Аргументы:
+            - target(str): функция (file, mime_type) -> dict
+                в виде "модуль:функция"
+            - max_size(int | None): файлы больше этого размера получают
+                общую мету, None - без ограничения
+            - timeout(float | None): таймаут в секундах,
+                по умолчанию META_TIMEOUT
+        """
+        self.target = target
+        self.max_size = max_size
+        self.timeout = timeout
+        self.__func: Callable[[BinaryIO, str], dict[str, Any]] | None = None
+
+    def __call__(self, file: BinaryIO, mime_type: str) -> dict[str, Any]:
+        if self.__func is None:
+            module, _, name = self.target.partition(":")
+            self.__func = getattr(importlib.import_module(module), name)
+        return self.__func(file, mime_type)
+
+
+class HeaderReader:
+    """
+    Файл только для чтения с ограничением прочитанных байт.
+
+    Получатели меты читают заголовки и служебные блоки, перемещаясь
+    по файлу через seek. Перемещения бесплатны, а чтение сверх limit
+    байт прерывается ошибкой, поэтому большой файл не читается целиком.
+    """
+    def __init__(self, file: BinaryIO, limit: int):
+        """
+        Инициализация
+
+        Аргументы:
+            - file(BinaryIO): открытый файл
+            - limit(int): сколько байт можно прочитать всего
+        """
+        self.file = file
+        self.name = getattr(file, "name", "")
+        self.left = limit
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self.left:
+            # Чтение до конца или с запасом: считаем, сколько байт осталось
+            position = self.file.tell()
+            remaining = self.file.seek(0, 2) - position
+            self.file.seek(position)
+            if size is None or size < 0 or size > remaining:
+                size = remaining
+            if size > self.left:
+                raise MetaExtractionError(
+                    f"Заголовок {self.name} больше лимита чтения"
+                )
+        data = self.file.read(size)
+        self.left -= len(data)
+        return data
+
+    def readinto(self, buffer: bytearray) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self.file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def seekable(self) -> bool:
+        return True
+
+    def readable(self) -> bool:
+        return True
+
+
+# MIME или префикс вида "audio/*" -> получатель меты
+EXTRACTORS: dict[str, Extractor] = {}
+
+
+def register(
+        mime_type: str, target: str, max_size: int | None = None,
+        timeout: float | None = None
+) -> None:
+    """
+    Функция регистрации получателя меты
+
+    Аргументы:
+        - mime_type(str): MIME или префикс вида "image/*"
+        - target(str): функция в виде "модуль:функция"
+        - max_size(int | None): максимальный размер файла
+        - timeout(float | None): таймаут в секундах
+
+    Логика:
+        - Регистрировать нужно при импорте этого модуля: воркеры пула
+            запускаются через spawn и видят только такие регистрации
+    """
+    EXTRACTORS[mime_type] = Extractor(target, max_size, timeout)
+
+
+# Встроенные получатели читают только заголовки файла, не больше
+# META_HEADER_BYTES, поэтому ограничений по размеру файла у них нет
+register(
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "app.service.extractors.office:docx_meta", timeout=10,
+)
+register("application/pdf", "app.service.extractors.pdf:pdf_meta", timeout=15)
+register("image/*", "app.service.extractors.image:image_meta", timeout=5)
+register("audio/*", "app.service.extractors.media:media_meta", timeout=10)
+register("video/*", "app.service.extractors.media:media_meta", timeout=10)
+register("video/x-matroska", "app.service.extractors.media:matroska_meta", timeout=10)
+register("audio/x-matroska", "app.service.extractors.media:matroska_meta", timeout=10)
+register("video/webm", "app.service.extractors.media:matroska_meta", timeout=10)
+register("audio/webm", "app.service.extractors.media:matroska_meta", timeout=10)
+
+
+def find_extractor(mime_type: str, size: int | None = None) -> Extractor | None:
+    """
+    Функция выбора получателя меты
+
+    Аргументы:
+        - mime_type(str): MIME файла
+        - size(int | None): размер файла
+
+    Возвращает:
+        - Extractor | None: получатель по MIME, иначе по префиксу.
+            None - подходит только общая мета
+    """
+    extractor = (
+        EXTRACTORS.get(mime_type)
+        or EXTRACTORS.get(mime_type.split("/", 1)[0] + "/*")
+    )
+    if extractor is None or (
+        extractor.max_size is not None and (size or 0) > extractor.max_size
+    ):
+        return None
+    return extractor
+
+
+def generic_meta(mime_type: str) -> dict[str, Any]:
+    """
+    Общая мета любого файла: расширение по MIME, без названия
+
+    Логика:
+        - Расширение из mimetypes, иначе подтип MIME, иначе bin
+    """
+    extension = mimetypes.guess_extension(mime_type)
+    if extension is None:
+        subtype = mime_type.rpartition("/")[2]
+        extension = subtype if subtype.isalnum() else "bin"
+    return {"filename": None, "extension": extension.lstrip(".")}
+
+
+def sniff_mime(head: bytes) -> str:
+    """
+    Функция определения MIME по первым байтам файла.
+    libmagic загружается при первом вызове.
+    """
+    import magic
+    return magic.from_buffer(head, mime=True)
+
+
+def extract_meta(path: str, mime_type: str, limit: int) -> dict[str, Any]:
+    """
+    Функция получения меты.
+    Выполняется в пуле воркеров, поэтому синхронная.
+
+    Аргументы:
+        - path(str): путь до файла на диске
+        - mime_type(str): MIME файла
+        - limit(int): сколько байт файла можно прочитать
+
+    Возвращает:
+        - dict[str, Any]: Словарь с названием, расширением
+
+    Логика:
+        - Общая мета дополняется значениями получателя, найденного
+            по MIME. Пустые значения получателя пропускаются
+        - Получатель читает файл через HeaderReader не больше limit байт
+        - Если получатель упал на поврежденном файле или превысил лимит,
+            остается общая мета
+    """
+    meta = generic_meta(mime_type)
+    extractor = find_extractor(mime_type)
+    if extractor is None:
+        return meta
+    try:
+        with open(path, "rb") as f:
+            found = extractor(HeaderReader(f, limit), mime_type)
+    except Exception as e:
+        logger.warning(
+            "Мета %s не получена через %s: %r", path, extractor.target, e
+        )
+        return meta
+    meta.update(compact(found))
+    return meta
+
+
+def compact(meta: dict[str, Any]) -> dict[str, Any]:
+    """Мета без пустых значений, в том числе во вложенных словарях"""
+    result = {}
+    for key, value in meta.items():
+        if isinstance(value, dict):
+            value = compact(value)
+        if value is not None and value != {}:
+            result[key] = value
+    return result
+
+
+class ExtractorPool:
+    """Пул воркеров для тяжелых синхронных задач (MIME, мета)"""
+    def __init__(self):
+        """Инициализация. Сам пул создается при первой задаче"""
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.executor: Executor | None = None
+        # Задачи в работе и очереди. Уменьшается, когда задача
+        # действительно закончилась, а не когда ее перестали ждать
+        self.pending = 0
+        # Номер пула (растет при каждом пересоздании) и срок каждой
+        # задачи в работе: по ним пул, замененный после таймаута,
+        # дожидается своих остальных задач. Сам пул здесь не хранится:
+        # последняя ссылка на него не должна пропасть в done-callback
+        self.generation = 0
+        self.__running: dict[Future, tuple[int, float]] = {}
+        # Замененные пулы, которые еще не остановлены
+        self.__retiring: set[Executor] = set()
+        self.__lock = threading.Lock()
+
+    def __get_executor(self) -> Executor:
+        """
+        Метод получения пула
+
+        Логика:
+            - META_EXECUTOR=process: ProcessPoolExecutor (spawn, чтобы
+                не копировать потоки и соединения родителя)
+            - META_EXECUTOR=thread: ThreadPoolExecutor
+        """
+        if self.executor is None:
+            self.generation += 1
+            self.logger.info(
+                "Создание пула %s на %d воркеров",
+                settings.META_EXECUTOR, settings.META_WORKERS
+            )
+            if settings.META_EXECUTOR == "thread":
+                self.executor = ThreadPoolExecutor(
+                    max_workers=settings.META_WORKERS,
+                    thread_name_prefix="meta",
+                )
+            else:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=settings.META_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+        return self.executor
+
+    async def run(
+            self, func: Callable[..., Any], *args: Any,
+            timeout: float | None = None
+    ) -> Any:
+        """
+        Метод выполнения задачи в пуле
+
+        Аргументы:
+            - func(Callable): синхронная функция уровня модуля
+            - args: ее аргументы
+            - timeout(float | None): таймаут в секундах,
+                по умолчанию META_TIMEOUT
+
+        Возвращает:
+            - Any: результат функции
+
+        Логика:
+            - В работе и очереди не больше META_WORKERS + META_MAX_PENDING
+                задач, остальные сразу отклоняются
+            - Задача ограничена timeout или META_TIMEOUT секундами
+            - Счетчик задач уменьшается в done-callback задачи: задача
+                после таймаута еще занимает воркер
+            - По таймауту новые задачи идут в новый пул, а старый
+                останавливается, когда закончатся (или выйдут их сроки)
+                остальные его задачи. Процессы старого пула при этом
+                завершаются вместе с зависшей задачей. Потоки завершить
+                нельзя, поэтому зависшая задача пула thread занимает место
+                в очереди, пока не закончится
+
+        Ошибки:
+            - ExtractorBusy: очередь заполнена
+            - MetaExtractionError: таймаут или падение воркера
+        """
+        with self.__lock:
+            if self.pending >= (
+                    settings.META_WORKERS + settings.META_MAX_PENDING
+            ):
+                self.logger.warning(
+                    "Очередь пула заполнена: %d", self.pending
+                )
+                raise ExtractorBusy()
+            self.pending += 1
+
+        timeout = timeout or settings.META_TIMEOUT
+        executor = self.__get_executor()
+        generation = self.generation
+        future = None
+        try:
+            future = executor.submit(func, *args)
+            with self.__lock:
+                self.__running[future] = (
+                    generation, time.monotonic() + timeout
+                )
+            future.add_done_callback(self.__release)
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout=timeout
+            )
+        except TimeoutError:
+            self.logger.error("Таймаут задачи %s", func.__name__)
+            self.__reset(executor, generation, future)
+            raise MetaExtractionError(
+                f"Задача {func.__name__} не уложилась в {timeout} сек."
+            )
+        except BrokenProcessPool:
+            self.logger.error("Воркер пула упал. Пул будет пересоздан")
+            self.__reset(executor, generation, future)
+            raise MetaExtractionError(f"Воркер упал при {func.__name__}")
+        finally:
+            if future is None:
+                # Задача не поставлена в пул
+                self.__release()
+
+    def __release(self, future: Future | None = None) -> None:
+        """Задача закончилась (вызывается из потока пула)"""
+        with self.__lock:
+            self.pending -= 1
+            self.__running.pop(future, None)
+
+    def __reset(
+            self, executor: Executor, generation: int, stuck: Future | None
+    ) -> None:
+        """
+        Метод замены пула, чтобы следующая задача создала новый
+
+        Аргументы:
+            - executor(Executor): пул с зависшей или упавшей задачей
+            - generation(int): номер этого пула
+            - stuck(Future | None): эта задача
+
+        Логика:
+            - Остальные задачи пула не прерываются: пул останавливается
+                в фоновом потоке, когда они закончатся или выйдут
+                их сроки
+            - Пул уже заменен другой задачей - ничего не делаем
+        """
+        if self.executor is not executor:
+            return
+        self.executor = None
+        with self.__lock:
+            others = {
+                future: deadline
+                for future, (owner, deadline) in self.__running.items()
+                if owner == generation and future is not stuck
+            }
+            self.__retiring.add(executor)
+        threading.Thread(
+            target=self.__retire, args=(executor, others),
+            name="meta-retire", daemon=True,
+        ).start()
+
+    def __retire(
+            self, executor: Executor, others: dict[Future, float]
+    ) -> None:
+        """Остановка замененного пула после его остальных задач"""
+        for future, deadline in others.items():
+            wait([future], timeout=max(0.0, deadline - time.monotonic()))
+        self.__terminate(executor)
+        with self.__lock:
+            self.__retiring.discard(executor)
+
+    @staticmethod
+    def __terminate(executor: Executor) -> None:
+        """
+        Остановка пула без ожидания задач. Процессы пула process
+        завершаются сразу, задачи в них падают с BrokenProcessPool
+        """
+        # Публичного способа завершить процессы до Python 3.14 нет
+        processes = getattr(executor, "_processes", None) or {}
+        for process in list(processes.values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        """Остановка пула и замененных пулов без ожидания текущих задач"""
+        with self.__lock:
+            retiring = list(self.__retiring)
+            self.__retiring.clear()
+        for executor in retiring:
+            self.__terminate(executor)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+# Общий пул воркеров приложения
+extractor_pool = ExtractorPool()
@@ -0,0 +1,200 @@
+import logging
+import math
+import mimetypes
+import os
+from typing import Any
+from uuid import UUID
+
+from app.dtos.dto import FileIn, PresignedCompleteIn, PresignedUploadIn
+from app.repository.exceptions import PathNotFoundDB
+from app.repository.repository import FileRepository
+from app.service import codec
+from app.service.cloud_service import CloudService
+from app.service.exceptions import FileNotFound, UploadRejected
+from app.service.local_storage import local_storage
+from app.settings import settings
+from app.utils.uid import uuid7
+
+# Ограничения S3: один PUT до 5 ГБ, не больше 10000 частей
+S3_MAX_PUT_SIZE = 5 * 1024 ** 3
+S3_MAX_PARTS = 10000
+
+
+class PresignService:
+    """
+    Сервис загрузки и скачивания файлов напрямую из облака
+    по подписанным ссылкам, минуя приложение
+    """
+    def __init__(
+            self, file_repository: FileRepository, cloud_service: CloudService
+    ):
+        """Инициализация"""
+        self.file_repository = file_repository
+        self.cloud_service = cloud_service
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def create_upload(self, upload: PresignedUploadIn) -> dict[str, Any]:
+        """
+        Метод выдачи ссылок для загрузки файла в облако
+
+        Аргументы:
+            - upload(PresignedUploadIn): имя, размер, тип и способ загрузки
+
+        Возвращает:
+            - dict[str, Any]: UID, ключ объекта и ссылки: url для put,
+                url и поля формы для post, ID загрузки и ссылки на части
+                для multipart
+
+        Логика:
+            - UID выдается сразу и входит в ключ объекта {uid}.{ext},
+                по нему загрузка завершается
+            - Для multipart размер части не меньше S3_PART_SIZE и такой,
+                чтобы частей было не больше 10000
+
+        Ошибки:
+            - UploadRejected: файл слишком большой для put/post
+            - CloudUnavailable: облако не настроено
+        """
+        uid = uuid7()
+        key = f"{uid}.{self.__extension(upload.filename, upload.content_type)}"
+        expires = settings.S3_PRESIGN_EXPIRES
+        result: dict[str, Any] = {
+            "file_uid": str(uid),
+            "key": key,
+            "method": upload.method,
+            "expires_in": expires,
+        }
+        if upload.method != "multipart" and upload.size > S3_MAX_PUT_SIZE:
+            raise UploadRejected(
+                "Файлы больше 5 ГБ загружаются способом multipart"
+            )
+
+        if upload.method == "put":
+            result["url"] = await self.cloud_service.presign_put(
+                key, upload.content_type, expires
+            )
+        elif upload.method == "post":
+            form = await self.cloud_service.presign_post(
+                key, upload.size, upload.content_type, expires
+            )
+            result["url"] = form["url"]
+            result["fields"] = form["fields"]
+        else:
+            part_size = max(
+                settings.S3_PART_SIZE, math.ceil(upload.size / S3_MAX_PARTS)
+            )
+            upload_id, urls = await self.cloud_service.presign_multipart(
+                key, math.ceil(upload.size / part_size),
+                upload.content_type, expires
+            )
+            result["upload_id"] = upload_id
+            result["part_size"] = part_size
+            result["parts"] = [
+                {"part_number": number, "url": url}
+                for number, url in enumerate(urls, start=1)
+            ]
+        self.logger.info(
+            "Выдана ссылка %s для %s, размер %s",
+            upload.method, key, upload.size
+        )
+        return result
+
+    async def complete_upload(
+            self, upload: PresignedCompleteIn
+    ) -> dict[str, Any]:
+        """
+        Метод регистрации файла, загруженного клиентом в облако
+
+        Аргументы:
+            - upload(PresignedCompleteIn): UID, ключ, имя файла
+                и части multipart загрузки
+
+        Возвращает:
+            - dict[str, Any]: UID, ключ и размер файла
+
+        Логика:
+            - Завершаем multipart загрузку, если она была
+            - Размер и метаданные берем из облака, а не от клиента
+            - Локальный путь указывает туда, где файл лежал бы на диске:
+                локально его нет, поэтому он отдается из облака, а очистка
+                удаляет его из облака по тому же ключу
+
+        Ошибки:
+            - UploadRejected: ключ не соответствует UID, нет частей
+            - CloudObjectNotFound: объекта нет в облаке
+            - CloudUnavailable: облако не настроено
+        """
+        key = upload.key
+        if "/" in key or not key.startswith(f"{upload.uid}."):
+            raise UploadRejected(f"Ключ {key} не соответствует UID")
+        if upload.upload_id is not None:
+            if not upload.parts:
+                raise UploadRejected("Не переданы части multipart загрузки")
+            await self.cloud_service.complete_multipart(
+                key, upload.upload_id,
+                [
+                    {"PartNumber": part.part_number, "ETag": part.etag}
+                    for part in upload.parts
+                ]
+            )
+
+        head = await self.cloud_service.head_file(key)
+        file_obj = FileIn(
+            uid=str(upload.uid),
+            filename=upload.filename or head["metadata"].get("filename"),
+            extension=key[key.find(".") + 1:],
+            size=head["size"],
+            local_path=local_storage.blob_path(key),
+            cloud_path=f"{settings.S3_PUBLIC_URL}/{key}",
+        )
+        if await self.file_repository.save_cloud_file_data(file_obj):
+            self.logger.info(
+                "Файл %s загружен в облако напрямую. Размер: %s",
+                key, file_obj.size
+            )
+        return {
+            "file_uid": file_obj.uid,
+            "key": key,
+            "size": file_obj.size,
+        }
+
+    async def get_download_url(
+            self, uid: UUID, download: bool = False
+    ) -> str:
+        """
+        Метод получения подписанной ссылки на файл в облаке
+
+        Аргументы:
+            - uid(UUID): UID файла
+            - download(bool): нужно ли скачивать файл
+
+        Возвращает:
+            - str: ссылка, живет S3_PRESIGN_EXPIRES секунд
+
+        Ошибки:
+            - FileNotFound: файла нет
+            - CloudUnavailable: облако не настроено
+        """
+        try:
+            path = await self.file_repository.get_file_cloud_path(uid)
+        except PathNotFoundDB as e:
+            self.logger.error(e)
+            raise FileNotFound(uid)
+        key = path[path.rfind("/") + 1:]
+        return await self.cloud_service.presign_get(
+            key, settings.S3_PRESIGN_EXPIRES,
+            filename=(
+                f"{uid}{os.path.splitext(codec.strip_encoding(key))[1]}"
+                if download else None
+            ),
+        )
+
+    @staticmethod
+    def __extension(filename: str, content_type: str | None) -> str:
+        """Расширение ключа объекта по имени или типу файла"""
+        extension = os.path.splitext(filename)[1].lstrip(".").lower()
+        if not extension.isalnum() and content_type:
+            extension = (
+                mimetypes.guess_extension(content_type) or ""
+            ).lstrip(".")
+        return extension if extension.isalnum() else "bin"
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+
+from aiobotocore.client import AioBaseClient
+
+from app.repository.repository import ReplicationRepository
+from app.repository.session import async_session
+from app.service.cloud_service import CloudService
+from app.settings import settings
+from app.utils.metrics import REPLICATION_SECONDS
+
+
+class ReplicationService:
+    """Пул воркеров, разбирающих очередь репликации файлов в облако"""
+    def __init__(self, client: AioBaseClient | None):
+        """
+        Инициализация
+
+        Аргументы:
+            - client(AioBaseClient | None): общий клиент S3 приложения
+        """
+        self.cloud_service = CloudService(client)
+        self.repository = ReplicationRepository(async_session)
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.workers: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Запуск REPLICATION_WORKERS воркеров"""
+        self.logger.info(
+            "Запуск %d воркеров репликации", settings.REPLICATION_WORKERS
+        )
+        self.workers = [
+            asyncio.create_task(self.__worker(number))
+            for number in range(settings.REPLICATION_WORKERS)
+        ]
+
+    async def stop(self) -> None:
+        """
+        Остановка воркеров
+
+        Незавершенные задачи останутся в очереди и будут взяты после
+        истечения аренды.
+        """
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        self.logger.info("Воркеры репликации остановлены")
+
+    async def __worker(self, number: int) -> None:
+        """
+        Цикл воркера
+
+        Аргументы:
+            - number(int): номер воркера
+
+        Логика:
+            - Захватываем задачу, если очередь пуста спим
+                REPLICATION_POLL_INTERVAL секунд
+            - Загружаем файл в облако и отмечаем результат
+            - Ошибки БД не останавливают воркер
+        """
+        while True:
+            try:
+                if not await self.__process_next():
+                    await asyncio.sleep(settings.REPLICATION_POLL_INTERVAL)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error("Ошибка воркера репликации %d: %s", number, e)
+                await asyncio.sleep(settings.REPLICATION_POLL_INTERVAL)
+
+    async def __process_next(self) -> bool:
+        """
+        Обработка одной задачи
+
+        Возвращает:
+            - bool: была ли задача в очереди
+        """
+        task = await self.repository.claim_task(settings.REPLICATION_LEASE)
+        if task is None:
+            return False
+        task_id, key, local_path = task["id"], task["key"], task["local_path"]
+
+        started = time.perf_counter()
+        try:
+            await self.cloud_service.save_file(
+                file_path=local_path,
+                key=key,
+                mock=settings.DEBUG
+            )
+        except Exception as e:
+            REPLICATION_SECONDS.observe(
+                time.perf_counter() - started, result="failed"
+            )
+            await self.repository.mark_failed(
+                task_id, str(e),
+                max_attempts=settings.REPLICATION_MAX_ATTEMPTS,
+                backoff_base=settings.REPLICATION_BACKOFF_BASE,
+                backoff_max=settings.REPLICATION_BACKOFF_MAX,
+            )
+            return True
+
+        REPLICATION_SECONDS.observe(
+            time.perf_counter() - started, result="done"
+        )
+        await self.repository.mark_done(task_id)
+        self.logger.info("Файл %s реплицирован в облако", key)
+        return True
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import timedelta
+
+from aiobotocore.client import AioBaseClient
+
+from app.repository.models import create_table
+from app.repository.repository import (
+    DerivativeRepository, RetentionRepository, UploadRepository
+)
+from app.repository.session import async_session
+from app.service.cloud_service import CloudService
+from app.service.local_storage import local_storage
+from app.settings import settings
+from app.utils.uid import utc_now
+
+
+class RetentionService:
+    """
+    Удаление файлов старше срока хранения.
+
+    Работает по БД, а не по обходу папки: стоимость зависит от числа
+    устаревших файлов, а не от общего. Каждая пачка сначала удаляет файлы
+    (на диске и в облаке), потом строки, поэтому прерванный запуск
+    безопасно продолжается следующим: файлы удаляются повторно без ошибок,
+    строки выбираются заново. Хэши файлов пачки заблокированы до удаления
+    строк, поэтому загрузка дубля не сошлется на удаляемый файл.
+    """
+    def __init__(self, client: AioBaseClient | None):
+        """
+        Инициализация
+
+        Аргументы:
+            - client(AioBaseClient | None): клиент S3
+        """
+        self.cloud_service = CloudService(client)
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def run(
+            self, days: int, batch_size: int, rate: float
+    ) -> dict[str, int]:
+        """
+        Метод запуска очистки
+
+        Аргументы:
+            - days(int): срок хранения в днях
+            - batch_size(int): размер пачки строк
+            - rate(float): максимум удаляемых строк в секунду, 0 - без лимита
+
+        Возвращает:
+            - dict[str, int]: кол-во удаленных строк, файлов, секций
+                и сессий загрузки
+
+        Логика:
+            - Создаем будущие секции files, если их еще нет
+            - Берем пачку самых старых устаревших строк по индексу created_at
+            - Блокируем хэши пачки (pg_advisory_xact_lock), как FileService
+                при сохранении: ссылки проверяются и файлы удаляются, пока
+                новые строки с этими хэшами не могут появиться
+            - Файлы, на которые не ссылаются актуальные строки, удаляем
+                с диска и из облака вместе с задачами репликации
+                и производными изображениями
+            - Удаляем строки пачки и выдерживаем лимит скорости
+            - В конце удаляем опустевшие секции старше срока хранения
+                и истекшие сессии загрузки по частям с их временными файлами
+        """
+        cutoff = utc_now() - timedelta(days=days)
+        self.logger.info("Очистка файлов старше %s", cutoff)
+        await create_table()
+        stats = {"rows": 0, "files": 0, "partitions": 0}
+
+        while True:
+            started = time.monotonic()
+            async with async_session() as session:
+                repository = RetentionRepository(session)
+                rows = await repository.get_expired_batch(cutoff, batch_size)
+                if not rows:
+                    break
+                hashes = list({
+                    row["content_hash"] for row in rows if row["content_hash"]
+                })
+                await repository.lock_hashes(hashes)
+                live = await repository.get_live_hashes(hashes, cutoff)
+                paths = sorted({
+                    row["local_path"] for row in rows
+                    if row["content_hash"] not in live
+                })
+                derivatives = await DerivativeRepository(
+                    async_session
+                ).delete_by_sources(sorted({
+                    os.path.basename(path).split(".", 1)[0] for path in paths
+                }))
+                await self.__delete_files(paths + derivatives)
+                await repository.delete_rows(rows, paths)
+
+            stats["rows"] += len(rows)
+            stats["files"] += len(paths)
+            self.logger.info(
+                "Удалено строк: %d, файлов: %d", stats["rows"], stats["files"]
+            )
+            if rate > 0:
+                await asyncio.sleep(
+                    max(0.0, len(rows) / rate - (time.monotonic() - started))
+                )
+
+        async with async_session() as session:
+            dropped = await RetentionRepository(
+                session
+            ).drop_expired_partitions(cutoff)
+        stats["partitions"] = len(dropped)
+        stats["uploads"] = await self.__delete_expired_uploads(batch_size)
+        self.logger.info("Очистка завершена: %s. Секции: %s", stats, dropped)
+        return stats
+
+    async def __delete_expired_uploads(self, batch_size: int) -> int:
+        """
+        Удаление истекших сессий загрузки по частям
+
+        Аргументы:
+            - batch_size(int): размер пачки сессий
+
+        Возвращает:
+            - int: кол-во удаленных сессий
+        """
+        count = 0
+        while True:
+            paths = await UploadRepository(
+                async_session
+            ).delete_expired_sessions(batch_size)
+            await asyncio.gather(*(local_storage.remove(p) for p in paths))
+            count += len(paths)
+            if len(paths) < batch_size:
+                return count
+
+    async def __delete_files(self, paths: list[str]) -> None:
+        """
+        Удаление файлов с диска и из облака
+
+        Аргументы:
+            - paths(list[str]): локальные пути файлов
+        """
+        await asyncio.gather(*(local_storage.remove(path) for path in paths))
+        if not paths or not settings.RETENTION_DELETE_CLOUD:
+            return
+        keys = [path[path.rfind("/") + 1:] for path in paths]
+        for start in range(0, len(keys), 1000):
+            await self.cloud_service.delete_files(
+                keys=keys[start:start + 1000],
+                mock=settings.DEBUG
+            )
@@ -0,0 +1,308 @@
+import logging
+import math
+import time
+from typing import Any, AsyncIterator, Union
+from uuid import UUID, uuid4
+
+from app.dtos.dto import UploadSessionIn
+from app.repository.exceptions import UploadNotFoundDB
+from app.repository.models import UploadState
+from app.repository.repository import UploadRepository
+from app.service.exceptions import (
+    UploadConflict, UploadNotFound, UploadRejected
+)
+from app.service.file_service import FileService
+from app.service.local_storage import local_storage
+from app.settings import settings
+from app.utils.metrics import BYTES_RECEIVED, INGEST_STAGE_SECONDS
+
+# Ограничение кол-ва частей, как у multipart загрузки S3
+MAX_PARTS = 10000
+
+
+class UploadService:
+    """
+    Сервис загрузки файлов по частям с возобновлением.
+
+    Размер файла известен заранее, поэтому временный файл сессии создается
+    сразу нужного размера, и каждая часть пишется на свое место. Части
+    принимаются в любом порядке и параллельно, повторная часть
+    перезаписывает прежнюю. При завершении файл не собирается и не
+    копируется, а сам становится постоянным файлом в FileService.
+    """
+    def __init__(
+            self, upload_repository: UploadRepository,
+            file_service: FileService
+    ):
+        """Инициализация"""
+        self.upload_repository = upload_repository
+        self.file_service = file_service
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def create_upload(self, upload: UploadSessionIn) -> dict[str, Any]:
+        """
+        Метод создания сессии загрузки
+
+        Аргументы:
+            - upload(UploadSessionIn): имя, размер файла и размер части
+
+        Возвращает:
+            - dict[str, Any]: состояние сессии
+
+        Ошибки:
+            - UploadRejected: частей получается больше 10000
+        """
+        part_size = upload.part_size or settings.UPLOAD_PART_SIZE
+        if math.ceil(upload.size / part_size) > MAX_PARTS:
+            raise UploadRejected(
+                f"Частей больше {MAX_PARTS}, увеличьте размер части"
+            )
+        tmp_path = f"{settings.UPLOAD_TMP_DIR}/{uuid4()}.upload"
+        await local_storage.allocate(tmp_path, upload.size)
+        try:
+            session = await self.upload_repository.create_session(
+                upload.filename, upload.size, part_size, tmp_path,
+                settings.UPLOAD_SESSION_TTL
+            )
+        except BaseException:
+            await local_storage.remove(tmp_path)
+            raise
+        self.logger.info(
+            "Создана сессия загрузки %s для %s, размер %d",
+            session["id"], upload.filename, upload.size
+        )
+        session["parts"] = {}
+        return self.__describe(session)
+
+    async def get_upload(self, upload_id: UUID) -> dict[str, Any]:
+        """
+        Метод получения состояния сессии
+
+        Аргументы:
+            - upload_id(UUID): ID сессии
+
+        Возвращает:
+            - dict[str, Any]: состояние сессии с полученными частями
+                и диапазонами байт
+
+        Ошибки:
+            - UploadNotFound: сессии нет
+        """
+        return self.__describe(await self.__get_session(upload_id))
+
+    async def write_part(
+            self, upload_id: UUID, part_number: int,
+            stream: AsyncIterator[bytes]
+    ) -> dict[str, int]:
+        """
+        Метод записи части
+
+        Аргументы:
+            - upload_id(UUID): ID сессии
+            - part_number(int): номер части с 1
+            - stream(AsyncIterator[bytes]): поток чанков части
+
+        Возвращает:
+            - dict[str, int]: номер и размер части
+
+        Логика:
+            - Часть пишется в файл сессии по смещению своего номера,
+                соединение с БД на время записи не держится
+            - Начало и конец записи - короткие транзакции со счетчиком
+                пишущихся частей: завершение ждет, пока начатые части
+                запишутся, а новые части после начала завершения
+                отклоняются
+            - Часть пишется не дольше UPLOAD_PART_TIMEOUT, после этого
+                завершение не ждет ее, даже если процесс упал
+            - В начале записи отметка о части снимается, и ставится снова,
+                только если часть пришла целиком. Так оборванная повторная
+                часть не считается полученной
+
+        Ошибки:
+            - UploadNotFound: сессии нет или ее отменили во время записи
+            - UploadConflict: сессия уже завершается или завершена
+            - UploadRejected: неверный номер или размер части
+        """
+        session = await self.__get_session(upload_id)
+        if session["state"] != UploadState.OPEN:
+            raise UploadConflict(f"Сессия {upload_id} уже завершена")
+        parts_count = math.ceil(session["size"] / session["part_size"])
+        if not 1 <= part_number <= parts_count:
+            raise UploadRejected(
+                f"Номер части {part_number} вне диапазона 1-{parts_count}"
+            )
+        offset = (part_number - 1) * session["part_size"]
+        expected = min(session["part_size"], session["size"] - offset)
+        deadline = time.monotonic() + settings.UPLOAD_PART_TIMEOUT
+        if not await self.upload_repository.begin_part(
+                upload_id, part_number, settings.UPLOAD_PART_TIMEOUT
+        ):
+            raise UploadConflict(f"Сессия {upload_id} уже завершена")
+        received = None
+        try:
+            with INGEST_STAGE_SECONDS.time(stage="write"):
+                size = await local_storage.write_at(
+                    session["tmp_path"], offset, stream, expected, deadline
+                )
+            BYTES_RECEIVED.inc(size, api="uploads")
+            if size != expected:
+                raise UploadRejected(
+                    f"Часть {part_number}: получено {size} байт из {expected}"
+                )
+            received = size
+        except (ValueError, TimeoutError) as e:
+            raise UploadRejected(f"Часть {part_number}: {e}")
+        except FileNotFoundError:
+            raise UploadNotFound(upload_id)
+        finally:
+            found = await self.upload_repository.end_part(
+                upload_id, part_number, received
+            )
+        if not found:
+            raise UploadNotFound(upload_id)
+        return {"part_number": part_number, "size": received}
+
+    async def complete_upload(
+            self, upload_id: UUID
+    ) -> dict[str, Union[str, UUID]]:
+        """
+        Метод завершения загрузки
+
+        Аргументы:
+            - upload_id(UUID): ID сессии
+
+        Возвращает:
+            - dict[str, Union[str, UUID]]: UID сохраненного файла
+
+        Логика:
+            - Повторное завершение возвращает тот же UID
+            - Проверяем, что получены все части, и переводим сессию
+                в completing, чтобы ее не завершили дважды. Пока пишутся
+                начатые части, состояние не меняется
+            - После смены состояния части проверяются еще раз: повторная
+                часть могла оборваться
+            - В состоянии completing части не пишутся, поэтому файл сессии
+                больше не меняется: считаем его хэш и передаем
+                в FileService сам файл, он сохраняется на месте без
+                копирования
+            - При любой ошибке сессия возвращается в open: файл сессии
+                остается на месте, и завершение можно повторить. Сессия
+                удаляется только по истечении срока
+
+        Ошибки:
+            - UploadNotFound: сессии нет
+            - UploadConflict: не все части получены или сессия
+                уже завершается
+        """
+        session = await self.__get_session(upload_id)
+        if session["state"] == UploadState.COMPLETED:
+            return {"file_uid": str(session["file_uid"])}
+        self.__check_parts(session)
+        if not await self.upload_repository.set_state(
+                upload_id, UploadState.COMPLETING, expected=UploadState.OPEN,
+                idle=True
+        ):
+            raise UploadConflict(
+                f"Сессия {upload_id} уже завершается или в нее пишутся части"
+            )
+
+        try:
+            session = await self.__get_session(upload_id)
+            self.__check_parts(session)
+            with INGEST_STAGE_SECONDS.time(stage="hash"):
+                content_hash = await local_storage.hash_file(
+                    session["tmp_path"]
+                )
+            result = await self.file_service.create_new_file_from_temp(
+                session["tmp_path"], session["filename"], session["size"],
+                content_hash
+            )
+        except BaseException:
+            await self.upload_repository.set_state(upload_id, UploadState.OPEN)
+            raise
+        await self.upload_repository.set_state(
+            upload_id, UploadState.COMPLETED, file_uid=result["file_uid"]
+        )
+        self.logger.info(
+            "Сессия загрузки %s завершена файлом %s",
+            upload_id, result["file_uid"]
+        )
+        return result
+
+    async def abort_upload(self, upload_id: UUID) -> None:
+        """
+        Метод отмены загрузки
+
+        Аргументы:
+            - upload_id(UUID): ID сессии
+
+        Ошибки:
+            - UploadNotFound: сессии нет
+            - UploadConflict: сессия уже завершается или завершена
+        """
+        session = await self.__get_session(upload_id)
+        if session["state"] != UploadState.OPEN:
+            raise UploadConflict(f"Сессия {upload_id} уже завершена")
+        await self.upload_repository.delete_session(upload_id)
+        await local_storage.remove(session["tmp_path"])
+        self.logger.info("Сессия загрузки %s отменена", upload_id)
+
+    async def __get_session(self, upload_id: UUID) -> dict[str, Any]:
+        try:
+            return await self.upload_repository.get_session(upload_id)
+        except UploadNotFoundDB as e:
+            self.logger.warning(e)
+            raise UploadNotFound(upload_id)
+
+    @staticmethod
+    def __check_parts(session: dict[str, Any]) -> None:
+        """
+        Проверка, что получены все части сессии
+
+        Ошибки:
+            - UploadConflict: не все части получены
+        """
+        parts_count = math.ceil(session["size"] / session["part_size"])
+        missing = [
+            number for number in range(1, parts_count + 1)
+            if number not in session["parts"]
+        ]
+        if missing:
+            raise UploadConflict(
+                f"Не получены части: {missing[:20]}"
+                + ("..." if len(missing) > 20 else "")
+            )
+
+    @staticmethod
+    def __describe(session: dict[str, Any]) -> dict[str, Any]:
+        """
+        Состояние сессии для клиента
+
+        Логика:
+            - Соседние полученные части объединяются в диапазоны байт
+                [начало, конец), по ним клиент возобновляет загрузку
+        """
+        part_size = session["part_size"]
+        ranges: list[list[int]] = []
+        for number in sorted(session["parts"]):
+            start = (number - 1) * part_size
+            end = start + session["parts"][number]
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+        return {
+            "upload_id": str(session["id"]),
+            "filename": session["filename"],
+            "size": session["size"],
+            "part_size": part_size,
+            "parts_count": math.ceil(session["size"] / part_size),
+            "state": session["state"],
+            "file_uid": (
+                str(session["file_uid"]) if session["file_uid"] else None
+            ),
+            "received_parts": sorted(session["parts"]),
+            "received_ranges": ranges,
+            "received_bytes": sum(session["parts"].values()),
+            "expires_at": session["expires_at"].isoformat(),
+        }
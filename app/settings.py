@@ -1,5 +1,5 @@
 import os
-from typing import Union
+from typing import Literal, Union
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -21,6 +21,60 @@ class Settings(BaseSettings):
     S3_BUCKET: str | None = None  # Название бакета
     S3_URL: str | None = None  # URL хранилища
     S3_PUBLIC_URL: str | None = "https://test.s3.ru/"  # URL публичного доступа
+    S3_MAX_POOL_CONNECTIONS: int = 50  # Размер пула соединений клиента S3
+    S3_KEEPALIVE_TIMEOUT: int = 60  # Keep-alive соединений с S3 в секундах
+    S3_PART_SIZE: int = 8 * 1024 * 1024  # Размер части multipart загрузки
+    S3_UPLOAD_CONCURRENCY: int = 4  # Кол-во частей, загружаемых одновременно
+    S3_PART_RETRIES: int = 3  # Кол-во попыток загрузки одной части
+    S3_PRESIGN_EXPIRES: int = 3600  # Время жизни подписанных ссылок в секундах
+    S3_PRESIGN_MAX_SIZE: int = 50 * 1024 ** 3  # Максимальный размер файла при загрузке напрямую в облако
+    S3_PRESIGN_DOWNLOADS: bool = False  # Отдавать файлы из облака по подписанным ссылкам вместо S3_PUBLIC_URL
+    REPLICATION_WORKERS: int = 4  # Кол-во воркеров репликации в облако
+    REPLICATION_POLL_INTERVAL: float = 1.0  # Пауза при пустой очереди в секундах
+    REPLICATION_LEASE: int = 900  # Аренда задачи воркером в секундах
+    REPLICATION_MAX_ATTEMPTS: int = 10  # Кол-во попыток репликации файла
+    REPLICATION_BACKOFF_BASE: float = 2.0  # Базовая задержка повтора в секундах
+    REPLICATION_BACKOFF_MAX: float = 600.0  # Максимальная задержка повтора в секундах
+    META_EXECUTOR: str = "process"  # Пул для получения меты: process или thread
+    META_WORKERS: int = 2  # Кол-во воркеров пула меты
+    META_MAX_PENDING: int = 32  # Размер очереди пула меты
+    META_TIMEOUT: float = 30.0  # Таймаут получения меты одного файла в секундах, если у получателя меты нет своего
+    STORAGE_FSYNC: Literal["none", "file", "dir"] = "file"  # Политика fsync при записи файлов
+    STORAGE_WRITE_BUFFER: int = 1024 * 1024  # Размер буфера записи файлов на диск
+    PATH_CACHE_SIZE: int = 100_000  # Кол-во UID в кэше путей
+    PATH_CACHE_TTL: float = 300.0  # Время жизни пути в кэше в секундах
+    PATH_CACHE_NEGATIVE_TTL: float = 10.0  # Время жизни отсутствующего UID в кэше
+    BLOB_CACHE_BYTES: int = 64 * 1024 * 1024  # Бюджет кэша содержимого файлов в памяти, 0 - выключен
+    BLOB_CACHE_MAX_FILE_SIZE: int = 1024 * 1024  # Максимальный размер файла в кэше
+    BLOB_CACHE_ADMIT_HITS: int = 2  # После скольких запросов файл попадает в кэш
+    BLOB_CACHE_CANDIDATES: int = 100_000  # Сколько файлов-кандидатов в кэш отслеживать
+    BATCH_MAX_UIDS: int = 1000  # Максимум UID в пакетном запросе метаданных
+    BULK_UPLOAD_CONCURRENCY: int = 8  # Кол-во файлов пакета, записываемых одновременно
+    FILES_PARTITION_MONTHS_AHEAD: int = 12  # На сколько месяцев вперед создавать секции files
+    RETENTION_DAYS: int = 30  # Срок хранения файлов в днях
+    RETENTION_BATCH_SIZE: int = 500  # Размер пачки строк при очистке
+    RETENTION_RATE: float = 1000.0  # Максимум удаляемых строк в секунду, 0 - без лимита
+    RETENTION_DELETE_CLOUD: bool = True  # Удалять ли файлы из облака при очистке
+    STORAGE_SHARD_LEVELS: int = 2  # Кол-во уровней вложенных папок для файлов, 0 - плоская папка
+    STORAGE_SHARD_WIDTH: int = 2  # Кол-во символов имени файла на один уровень папок
+    LAYOUT_MIGRATION_BATCH_SIZE: int = 500  # Размер пачки строк при переносе файлов по папкам
+    STORAGE_CODEC: Literal["none", "gzip", "zstd"] = "none"  # Кодек сжатия файлов при сохранении
+    STORAGE_CODEC_LEVEL: int = 6  # Уровень сжатия
+    STORAGE_CODEC_MIN_RATIO: float = 0.9  # Сжимать, если файл сжимается хотя бы до этой доли размера
+    STORAGE_CODEC_SAMPLE: int = 1024 * 1024  # Размер выборки для оценки сжатия
+    DERIVATIVE_MAX_SIZE: int = 4096  # Максимальная ширина и высота производных изображений
+    DERIVATIVE_QUALITY: int = 80  # Качество производных jpeg и webp по умолчанию
+    DERIVATIVE_PRESETS: str = ""  # Размеры превью, создаваемых при загрузке, через запятую: 200x200,800x0
+    LOG_QUEUE: bool = True  # Писать логи через очередь в отдельном потоке
+    LOG_RATE_LIMIT: float = 0  # Кол-во одинаковых INFO сообщений в секунду, 0 - без ограничения
+    LOG_RATE_BURST: int = 20  # Кол-во одинаковых INFO сообщений подряд без ограничения
+    UPLOAD_PART_SIZE: int = 8 * 1024 * 1024  # Размер части при загрузке по частям по умолчанию
+    UPLOAD_MAX_SIZE: int = 50 * 1024 ** 3  # Максимальный размер файла при загрузке по частям
+    UPLOAD_SESSION_TTL: int = 86400  # Время жизни сессии загрузки по частям в секундах
+    UPLOAD_PART_TIMEOUT: int = 600  # Максимальное время записи одной части в секундах
+    UPLOAD_TMP_DIR: str = "./tmp/uploads"  # Папка для временных файлов загрузки (вне ./static)
+    MIME_SNIFF_BYTES: int = 16384  # Кол-во первых байт для определения MIME
+    META_HEADER_BYTES: int = 8 * 1024 * 1024  # Сколько байт файла можно прочитать при получении меты
 
     model_config = SettingsConfigDict(env_file=".env")
 
@@ -54,14 +108,18 @@ class Settings(BaseSettings):
             f"{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
         )
 
-    @staticmethod
-    def setup_logging() -> None:
+    def setup_logging(self) -> None:
         """Настройка логирования"""
         import yaml
         import logging.config
+        from app.utils.log import start_logging, stop_logging
+        stop_logging()
         with open("logging.yaml", "r") as f:
             config = yaml.safe_load(f.read())
             logging.config.dictConfig(config)
+        start_logging(
+            self.LOG_QUEUE, self.LOG_RATE_LIMIT, self.LOG_RATE_BURST
+        )
 
     @staticmethod
     def setup_architecture():
@@ -78,8 +136,15 @@ class Settings(BaseSettings):
 
         if not os.path.exists(f"{current_dir}/static"):
             print("Создание папки для хранения файлов")
+            os.makedirs(f"{current_dir}/static")
         else:
             print("Папка для файлов создана")
 
+        if not os.path.exists(settings.UPLOAD_TMP_DIR):
+            print("Создание папки для временных файлов")
+            os.makedirs(settings.UPLOAD_TMP_DIR)
+        else:
+            print("Папка для временных файлов создана")
+
 
 settings = Settings()
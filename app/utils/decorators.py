@@ -18,8 +18,8 @@ def mock(mock_func):
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            if kwargs.get("mock", False):
-                logger.info(f"Mocking {func.__name__}")
+            if kwargs.pop("mock", False):
+                logger.info("Mocking %s", func.__name__)
                 try:
                     return await mock_func(*args, **kwargs)
                 except Exception as e:
@@ -0,0 +1,133 @@
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+_listener: QueueListener | None = None
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Обработчик, который только кладет запись в очередь.
+
+    Стандартный QueueHandler форматирует сообщение в вызывающем потоке.
+    Здесь запись уходит в очередь как есть, а форматирование и запись
+    в файлы выполняет поток QueueListener. Очередь внутри процесса,
+    поэтому аргументы и traceback передаются без копирования.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Ограничение частоты одинаковых сообщений.
+
+    Одинаковыми считаются сообщения одного логгера с одним шаблоном
+    (record.msg до подстановки аргументов). На каждый шаблон выдается
+    burst сообщений и дальше rate сообщений в секунду. Предупреждения
+    и ошибки не ограничиваются. Решение сохраняется в записи, поэтому
+    один фильтр можно поставить на несколько обработчиков.
+    """
+    def __init__(self, rate: float, burst: int):
+        """
+        Инициализация
+
+        Аргументы:
+            - rate(float): сообщений в секунду на шаблон
+            - burst(int): сообщений подряд без ограничения
+        """
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.dropped = 0
+        self.__lock = threading.Lock()
+        # (логгер, шаблон) -> [токены, время пополнения, отброшено]
+        self.__buckets: dict[tuple[str, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        passed = getattr(record, "rate_limit_passed", None)
+        if passed is None:
+            passed = record.rate_limit_passed = self.__take(record)
+        return passed
+
+    def __take(self, record: logging.LogRecord) -> bool:
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self.__lock:
+            bucket = self.__buckets.get(key)
+            if bucket is None:
+                bucket = self.__buckets[key] = [float(self.burst), now, 0]
+            bucket[0] = min(
+                float(self.burst), bucket[0] + (now - bucket[1]) * self.rate
+            )
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                self.dropped += 1
+                return False
+            bucket[0] -= 1
+            dropped, bucket[2] = bucket[2], 0
+        if dropped:
+            record.msg = f"{record.getMessage()} (пропущено похожих: {dropped})"
+            record.args = ()
+        return True
+
+
+def start_logging(use_queue: bool, rate: float = 0, burst: int = 20) -> None:
+    """
+    Функция перевода настроенного логирования в асинхронный режим
+
+    Аргументы:
+        - use_queue(bool): писать логи через очередь и отдельный поток
+        - rate(float): ограничение INFO и DEBUG сообщений в секунду
+            на шаблон, 0 - без ограничения
+        - burst(int): сообщений подряд без ограничения
+
+    Логика:
+        - Вызывается после stop_logging и dictConfig
+        - Обработчики root переносятся в QueueListener, на root остается
+            только DeferredQueueHandler: вызов логгера не ждет диск
+        - Ограничение частоты ставится на обработчик root, поэтому
+            лишние сообщения отбрасываются до постановки в очередь
+    """
+    global _listener
+    root = logging.getLogger()
+    if use_queue:
+        handlers = list(root.handlers)
+        for handler in handlers:
+            root.removeHandler(handler)
+        _listener = QueueListener(
+            queue.SimpleQueue(), *handlers, respect_handler_level=True
+        )
+        root.addHandler(DeferredQueueHandler(_listener.queue))
+        _listener.start()
+    if rate > 0:
+        limit = RateLimitFilter(rate, burst)
+        for handler in root.handlers:
+            handler.addFilter(limit)
+
+
+def stop_logging() -> None:
+    """
+    Функция остановки потока логирования
+
+    Логика:
+        - Поток дописывает все сообщения из очереди
+        - Обработчики возвращаются на root, чтобы логи после остановки
+            приложения писались напрямую
+    """
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, DeferredQueueHandler):
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        root.addHandler(handler)
@@ -0,0 +1,218 @@
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+# Границы корзин гистограмм задержек в секундах
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+    30.0, 60.0,
+)
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    """Метки в формате Prometheus: {name="value",...}"""
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Базовая метрика с метками.
+    Используется из одного event loop, поэтому без блокировок.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        """
+        Инициализация
+
+        Аргументы:
+            - name(str): имя метрики
+            - documentation(str): описание для HELP
+            - labels(tuple[str, ...]): имена меток
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """Метрика в текстовом формате Prometheus"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Монотонный счетчик"""
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self.__values[key] = self.__values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for key, value in sorted(self.__values.items()):
+            yield f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+
+
+class Gauge(Metric):
+    """Текущее значение, выставляется при сборе метрик"""
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        self.__values[self._key(labels)] = value
+
+    def samples(self) -> Iterator[str]:
+        for key, value in sorted(self.__values.items()):
+            yield f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+
+
+class Histogram(Metric):
+    """Гистограмма с накопительными корзинами, суммой и кол-вом"""
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # Метки -> (кол-во по корзинам без накопления, сумма, кол-во)
+        self.__values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        item = self.__values.get(key)
+        if item is None:
+            item = self.__values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        item[0][bisect.bisect_left(self.buckets, value)] += 1
+        item[1] += value
+        item[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Замер времени блока кода, в том числе завершенного ошибкой"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[str]:
+        names = (*self.labels, "le")
+        for key, (counts, total, count) in sorted(self.__values.items()):
+            cumulative = 0
+            for bound, bucket in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket
+                yield (
+                    f"{self.name}_bucket"
+                    f"{_labels(names, (*key, _number(bound)))} {cumulative}"
+                )
+            yield f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {count}"
+
+
+class MetricsRegistry:
+    """Реестр метрик приложения"""
+    def __init__(self, prefix: str):
+        """
+        Инициализация
+
+        Аргументы:
+            - prefix(str): префикс имен метрик
+        """
+        self.prefix = prefix
+        self.__metrics: list[Metric] = []
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.__register(Counter(self.prefix + name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self.__register(Gauge(self.prefix + name, documentation, labels))
+
+    def histogram(
+            self, name: str, documentation: str, labels: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.__register(
+            Histogram(self.prefix + name, documentation, labels, buckets=buckets)
+        )
+
+    def __register(self, metric):
+        self.__metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        return "\n".join(metric.render() for metric in self.__metrics) + "\n"
+
+
+# Реестр метрик приложения
+metrics = MetricsRegistry(prefix="files_")
+
+INGEST_STAGE_SECONDS = metrics.histogram(
+    "ingest_stage_seconds", "Время этапа сохранения файла", ("stage",)
+)
+DOWNLOAD_SECONDS = metrics.histogram(
+    "download_seconds", "Время подготовки ответа на скачивание", ("path",)
+)
+DERIVATIVE_RENDER_SECONDS = metrics.histogram(
+    "derivative_render_seconds", "Время создания производной изображения"
+)
+REPLICATION_SECONDS = metrics.histogram(
+    "replication_seconds", "Время загрузки файла в облако", ("result",)
+)
+DB_POOL_WAIT_SECONDS = metrics.histogram(
+    "db_pool_wait_seconds", "Время получения соединения из пула БД",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+BYTES_RECEIVED = metrics.counter(
+    "bytes_received_total", "Принято байт файлов", ("api",)
+)
+BYTES_SENT = metrics.counter(
+    "bytes_sent_total", "Отдано байт файлов", ("source",)
+)
+FILES_STORED = metrics.counter(
+    "files_stored_total", "Сохранено файлов", ("result",)
+)
+DB_POOL = metrics.gauge(
+    "db_pool_connections", "Соединения пула БД", ("state",)
+)
+DB_POOL_UTILIZATION = metrics.gauge(
+    "db_pool_utilization", "Доля занятых соединений от максимума пула"
+)
+BACKLOG = metrics.gauge(
+    "backlog", "Задачи в очередях", ("queue",)
+)
+CACHE = metrics.gauge(
+    "cache", "Статистика кэшей", ("cache", "stat")
+)
@@ -6,12 +6,10 @@ logger = logging.getLogger("Mocks")
 
 
 async def upload_to_cloud_mock(*args, **kwargs):
-    logger.info(f"Загрузка файла с uid={kwargs.get("key", None)}")
+    logger.info("Загрузка файла с uid=%s", kwargs.get("key"))
     await asyncio.sleep(3)
-    logger.info(f"Загрузка файла с uid={kwargs.get("key", None)} завершена")
+    logger.info("Загрузка файла с uid=%s завершена", kwargs.get("key"))
 
 
-async def s3_session_mock(*args, **kwargs):
-    logger.info("Создание сессии для S3")
-    await asyncio.sleep(2)
-    logger.info("Сессия создана")
+async def delete_from_cloud_mock(*args, **kwargs):
+    logger.info("Удаление из облака %d файлов", len(kwargs.get("keys", [])))
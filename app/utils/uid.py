@@ -0,0 +1,60 @@
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+
+def uuid7() -> uuid.UUID:
+    """
+    Генерация UUID версии 7 (RFC 9562)
+
+    Логика:
+        - Старшие 48 бит: unix время в миллисекундах
+        - Далее версия, 12 случайных бит, вариант и 62 случайных бита
+        - UID, созданные позже, больше по значению, поэтому вставки
+            идут в конец индекса
+    """
+    ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10))
+    rand_a = rand >> 68
+    rand_b = rand & 0x3FFF_FFFF_FFFF_FFFF
+    return uuid.UUID(
+        int=(ms & 0xFFFF_FFFF_FFFF) << 80 | 0x7 << 76 | rand_a << 64
+        | 0x2 << 62 | rand_b
+    )
+
+
+def uuid7_datetime(uid: uuid.UUID | str) -> datetime | None:
+    """
+    Получение времени создания из UUID версии 7
+
+    Аргументы:
+        - uid(UUID | str): UID
+
+    Возвращает:
+        - datetime | None: время UTC без часового пояса с точностью
+            до миллисекунды, None если UID не версии 7
+    """
+    if not isinstance(uid, uuid.UUID):
+        uid = uuid.UUID(str(uid))
+    if uid.version != 7:
+        return None
+    ms = uid.int >> 80
+    return naive_utc(
+        datetime.fromtimestamp(ms // 1000, tz=timezone.utc)
+        + timedelta(milliseconds=ms % 1000)
+    )
+
+
+def utc_now() -> datetime:
+    """Текущее время UTC без часового пояса, как хранится files.created_at"""
+    return naive_utc(datetime.now(timezone.utc))
+
+
+def naive_utc(moment: datetime) -> datetime:
+    """
+    Перевод времени в UTC без часового пояса.
+    Единственное место, где у времени files.created_at убирается пояс:
+    значение не зависит от TZ и перехода на летнее время.
+    """
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
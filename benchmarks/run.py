@@ -0,0 +1,456 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable
+
+import httpx
+
+from app.settings import settings
+
+# Единицы размеров файлов в --mix
+SIZE_UNITS = {"B": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3}
+SCENARIOS = ("upload", "stream", "download_local", "download_redirect")
+
+
+def parse_size(value: str) -> int:
+    """Размер вида 256KiB или 4MiB в байтах"""
+    for unit, multiplier in sorted(
+            SIZE_UNITS.items(), key=lambda item: -len(item[0])
+    ):
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * multiplier)
+    return int(value)
+
+
+def parse_mix(value: str) -> list[tuple[int, int]]:
+    """Смесь размеров вида 4KiB:50,1MiB:40,16MiB:10 - размер и вес"""
+    mix = []
+    for item in value.split(","):
+        size, _, weight = item.strip().partition(":")
+        mix.append((parse_size(size), int(weight or 1)))
+    return mix
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Перцентиль по методу ближайшего ранга на отсортированном списке"""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(len(values) * q / 100))
+    return values[rank - 1]
+
+
+class Payloads:
+    """
+    Воспроизводимые тела файлов.
+
+    Размеры и содержимое определяются seed, поэтому прогоны с одними
+    параметрами отправляют одни и те же байты. Первые 16 байт у каждого
+    файла свои, чтобы сервис не дедуплицировал файлы по хэшу.
+    """
+    def __init__(self, mix: list[tuple[int, int]], seed: int):
+        self.rng = random.Random(seed)
+        self.mix = mix
+        self.__bodies = {
+            size: self.rng.randbytes(size) for size, _ in mix
+        }
+
+    def sizes(self, count: int) -> list[int]:
+        """Размеры count файлов по весам смеси"""
+        sizes, weights = zip(*self.mix)
+        return self.rng.choices(sizes, weights=weights, k=count)
+
+    def body(self, size: int, number: int) -> bytes:
+        """Тело файла размера size с уникальным началом"""
+        prefix = number.to_bytes(8, "big") + self.rng.randbytes(8)
+        return (prefix + self.__bodies[size][16:])[:size]
+
+
+async def run_requests(
+        count: int, concurrency: int,
+        request: Callable[[int], Awaitable[tuple[int, int]]]
+) -> dict[str, Any]:
+    """
+    Выполнение count запросов не больше concurrency одновременно
+
+    Аргументы:
+        - count(int): кол-во запросов
+        - concurrency(int): кол-во одновременных запросов
+        - request: корутина по номеру запроса, возвращает статус
+            и кол-во переданных байт
+
+    Возвращает:
+        - dict[str, Any]: перцентили задержек, req/s, MB/s, статусы
+    """
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    transferred = 0
+    numbers = iter(range(count))
+
+    async def worker() -> None:
+        nonlocal transferred
+        for number in numbers:
+            started = time.perf_counter()
+            try:
+                status, size = await request(number)
+            except httpx.HTTPError as e:
+                status, size = type(e).__name__, 0
+            latencies.append(time.perf_counter() - started)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            transferred += size
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": count,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 4),
+        "req_per_s": round(count / elapsed, 2) if elapsed else 0.0,
+        "mb_per_s": round(transferred / 1024 ** 2 / elapsed, 2) if elapsed else 0.0,
+        "bytes": transferred,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p95": round(percentile(latencies, 95) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        "statuses": statuses,
+    }
+
+
+class Benchmark:
+    """Сценарии нагрузки на загрузку и скачивание файлов"""
+    def __init__(
+            self, client: httpx.AsyncClient, payloads: Payloads,
+            requests: int, concurrency: int
+    ):
+        self.client = client
+        self.payloads = payloads
+        self.requests = requests
+        self.concurrency = concurrency
+        self.uploaded: list[str] = []
+
+    async def upload(self) -> dict[str, Any]:
+        """POST /files/ с multipart формой"""
+        sizes = self.payloads.sizes(self.requests)
+
+        async def request(number: int) -> tuple[int, int]:
+            body = self.payloads.body(sizes[number], number)
+            response = await self.client.post(
+                "/files/", files={"file": (f"bench-{number}.bin", body)}
+            )
+            if response.status_code == 201:
+                self.uploaded.append(response.json()["fileUID"])
+            return response.status_code, len(body)
+        return await run_requests(self.requests, self.concurrency, request)
+
+    async def stream(self) -> dict[str, Any]:
+        """POST /files/stream с телом файла"""
+        sizes = self.payloads.sizes(self.requests)
+
+        async def request(number: int) -> tuple[int, int]:
+            body = self.payloads.body(sizes[number], self.requests + number)
+            response = await self.client.post("/files/stream", content=body)
+            return response.status_code, len(body)
+        return await run_requests(self.requests, self.concurrency, request)
+
+    async def download_local(self) -> dict[str, Any]:
+        """GET /files/{uid} файлов с диска"""
+        if not self.uploaded:
+            return {"skipped": "нет загруженных файлов, нужен сценарий upload"}
+        uids = sorted(self.uploaded)
+
+        async def request(number: int) -> tuple[int, int]:
+            size = 0
+            async with self.client.stream(
+                    "GET", f"/files/{uids[number % len(uids)]}"
+            ) as response:
+                async for chunk in response.aiter_raw():
+                    size += len(chunk)
+            return response.status_code, size
+        return await run_requests(self.requests, self.concurrency, request)
+
+    async def download_redirect(self) -> dict[str, Any]:
+        """
+        GET /files/{uid} файлов, которых нет на диске: редирект в облако.
+        Файлы загружаются в облако напрямую по подписанным ссылкам
+        """
+        uids = []
+        async with httpx.AsyncClient(timeout=60) as cloud:
+            for number in range(min(self.requests, 20)):
+                body = self.payloads.body(
+                    self.payloads.mix[0][0], 2 * self.requests + number
+                )
+                response = await self.client.post("/files/presigned", json={
+                    "filename": f"bench-cloud-{number}.bin",
+                    "size": len(body),
+                    "method": "put",
+                })
+                if response.status_code != 201:
+                    return {"skipped": f"облако недоступно: {response.text}"}
+                upload = response.json()
+                (await cloud.put(upload["url"], content=body)).raise_for_status()
+                response = await self.client.post(
+                    "/files/presigned/complete",
+                    json={"uid": upload["fileUID"], "key": upload["key"]},
+                )
+                response.raise_for_status()
+                uids.append(upload["fileUID"])
+
+        async def request(number: int) -> tuple[int, int]:
+            response = await self.client.get(f"/files/{uids[number % len(uids)]}")
+            return response.status_code, 0
+        return await run_requests(self.requests, self.concurrency, request)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_peak_rss(pid: int) -> int:
+    """Пиковый RSS процесса и его дочерних процессов в байтах (Linux)"""
+    total = 0
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    total += int(line.split()[1]) * 1024
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        return total
+    return total + sum(process_peak_rss(child) for child in children)
+
+
+async def start_uvicorn(stack: AsyncExitStack, workers: int) -> tuple[str, int]:
+    """Запуск сервиса в отдельном процессе uvicorn"""
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning",
+    ])
+
+    def stop() -> None:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    stack.callback(stop)
+
+    url = f"http://127.0.0.1:{port}"
+    async with httpx.AsyncClient(base_url=url) as client:
+        for _ in range(300):
+            if process.poll() is not None:
+                raise RuntimeError("uvicorn завершился при запуске")
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return url, process.pid
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("uvicorn не запустился за 30 секунд")
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    """Прогон выбранных сценариев и сбор результатов"""
+    payloads = Payloads(parse_mix(args.mix), args.seed)
+    server_pid = None
+    async with AsyncExitStack() as stack:
+        if args.target == "asgi":
+            from app.main import app
+            # ASGITransport не запускает lifespan: запускаем его сами,
+            # чтобы работали клиент S3 и воркеры репликации
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            transport = httpx.ASGITransport(app)
+            base_url = "http://bench"
+        else:
+            transport = None
+            if args.target == "uvicorn":
+                base_url, server_pid = await start_uvicorn(stack, args.workers)
+            else:
+                base_url = args.target
+        client = await stack.enter_async_context(httpx.AsyncClient(
+            transport=transport, base_url=base_url, timeout=args.timeout,
+            limits=httpx.Limits(max_connections=args.concurrency),
+        ))
+
+        benchmark = Benchmark(client, payloads, args.requests, args.concurrency)
+        results: dict[str, Any] = {}
+        for name in args.scenarios.split(","):
+            if args.warmup:
+                warmup = Benchmark(client, payloads, args.warmup, args.concurrency)
+                await getattr(warmup, name)()
+                benchmark.uploaded.extend(warmup.uploaded)
+            print(f"Сценарий {name}...", file=sys.stderr)
+            results[name] = await getattr(benchmark, name)()
+
+        if server_pid is not None:
+            server_rss = process_peak_rss(server_pid)
+        elif args.target == "asgi":
+            # Сервис в этом процессе, пул воркеров - в дочерних
+            server_rss = (
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            ) * 1024
+        else:
+            server_rss = None
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "target": args.target if args.target in ("asgi", "uvicorn") else "url",
+            "workers": args.workers,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mix": args.mix,
+            "seed": args.seed,
+            "cloud": "mock" if settings.DEBUG else settings.S3_URL,
+            "storage_fsync": settings.STORAGE_FSYNC,
+            "storage_codec": settings.STORAGE_CODEC,
+        },
+        "peak_rss_bytes": {
+            "client": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "server": server_rss,
+        },
+        "scenarios": results,
+    }
+
+
+def compare(
+        result: dict[str, Any], baseline: dict[str, Any], tolerance: float
+) -> list[str]:
+    """
+    Сравнение с прошлым прогоном
+
+    Возвращает:
+        - list[str]: регрессии: p95 выросла или req/s упали
+            больше чем на tolerance
+    """
+    regressions = []
+    for name, current in result["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous or "skipped" in current or "skipped" in previous:
+            continue
+        p95, base_p95 = current["latency_ms"]["p95"], previous["latency_ms"]["p95"]
+        if base_p95 and p95 > base_p95 * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base_p95} -> {p95} мс")
+        rps, base_rps = current["req_per_s"], previous["req_per_s"]
+        if base_rps and rps < base_rps * (1 - tolerance):
+            regressions.append(f"{name}: req/s {base_rps} -> {rps}")
+    return regressions
+
+
+def main() -> None:
+    """
+    Точка входа нагрузочного теста.
+    Запускается из корневой директории с теми же переменными окружения,
+    что и сервис:
+        python -m benchmarks.run --target uvicorn --concurrency 16
+    """
+    parser = argparse.ArgumentParser(
+        description="Нагрузочный тест загрузки и скачивания файлов"
+    )
+    parser.add_argument(
+        "--target", default="asgi",
+        help="asgi - приложение в этом процессе, uvicorn - отдельный "
+             "процесс, или URL запущенного сервиса"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Кол-во воркеров uvicorn"
+    )
+    parser.add_argument(
+        "--scenarios", default=",".join(SCENARIOS),
+        help=f"Сценарии через запятую: {', '.join(SCENARIOS)}"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=200, help="Кол-во запросов на сценарий"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8,
+        help="Кол-во одновременных запросов"
+    )
+    parser.add_argument(
+        "--mix", default="4KiB:50,256KiB:35,4MiB:15",
+        help="Смесь размеров файлов с весами"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=10,
+        help="Кол-во запросов прогрева перед сценарием"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed размеров и содержимого"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=120.0, help="Таймаут запроса"
+    )
+    parser.add_argument(
+        "--output", help="Файл для результатов в JSON, по умолчанию stdout"
+    )
+    parser.add_argument(
+        "--baseline", help="JSON прошлого прогона для поиска регрессий"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2,
+        help="Допустимое ухудшение p95 и req/s относительно baseline"
+    )
+    args = parser.parse_args()
+    for name in args.scenarios.split(","):
+        if name not in SCENARIOS:
+            parser.error(f"Неизвестный сценарий {name}")
+    if settings.DEBUG:
+        print(
+            "DEBUG=true: облако замокано, для сценария с облаком "
+            "укажите DEBUG=false и S3_URL локальной замены S3",
+            file=sys.stderr,
+        )
+
+    result = asyncio.run(run(args))
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Регрессия: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,11 @@ import asyncio
 
 import pytest
 import pytest_asyncio
+from aiobotocore.session import get_session
 from httpx import AsyncClient, ASGITransport
 
 from app.main import app
+from app.settings import settings
 
 
 @pytest.fixture(scope='session')
@@ -21,3 +23,23 @@ async def client(event_loop):
         base_url='http://test',
     ) as client:
         yield client
+
+
+@pytest_asyncio.fixture(scope='function')
+async def s3(event_loop):
+    """
+    Клиент S3 приложения для тестов загрузки напрямую в облако.
+    Нужен S3 или его локальная замена (например, moto_server) по S3_URL.
+    """
+    if not settings.S3_URL:
+        pytest.skip("S3_URL не задан")
+    session = get_session()
+    async with session.create_client(
+        "s3", region_name=settings.S3_REGION_NAME,
+        endpoint_url=settings.S3_URL,
+        aws_access_key_id=settings.S3_KEY_ID,
+        aws_secret_access_key=settings.S3_ACCESS_KEY,
+    ) as client:
+        app.state.s3_client = client
+        yield client
+        del app.state.s3_client
@@ -1,4 +1,10 @@
+import asyncio
+import logging
+import os
+import uuid
+
 import aiofiles
+import httpx
 import pytest
 
 # Список загруженных файлов
@@ -65,6 +71,24 @@ async def test_upload_jpg(client):
     UPLOADED_FILES_UID.append(response["fileUID"])
 
 
+@pytest.mark.asyncio
+async def test_upload_bulk(client):
+    """Тест пакетной отправки файлов"""
+    response = await client.post(
+        "/files/bulk", files=[
+            ("files", open("./tests/test_files/sample2.docx", "rb")),
+            ("files", open("./tests/test_files/sample3.pdf", "rb")),
+            ("files", open("./tests/test_files/sample3.pdf", "rb")),
+        ]
+    )
+    assert response.status_code == 201
+    response = response.json()
+    assert response["success"] is True
+    assert len(response["files"]) == 3
+    assert len({file["fileUID"] for file in response["files"]}) == 3
+    UPLOADED_FILES_UID.extend(file["fileUID"] for file in response["files"])
+
+
 @pytest.mark.asyncio
 async def test_upload_stream_docx(client):
     """Тест отправки потоком DOCX"""
@@ -107,6 +131,41 @@ async def test_upload_stream_mkv(client):
     UPLOADED_FILES_UID.append(response["fileUID"])
 
 
+@pytest.mark.asyncio
+async def test_upload_stream_unknown_type(client):
+    """Тест отправки потоком файлов без отдельного получателя меты"""
+    for content, extension in (
+        (os.urandom(4096), "bin"),
+        (b"plain text line\n" * 100, "txt"),
+    ):
+        response = await client.post("/files/stream", content=content)
+        assert response.status_code == 201
+        uid = response.json()["fileUID"]
+        response = await client.post("/files/batch", json={"uids": [uid]})
+        assert response.json()["files"][0]["extension"] == extension
+
+
+@pytest.mark.asyncio
+async def test_upload_stream_meta_failure(client, monkeypatch):
+    """Тест отправки потоком, когда мету получить не удалось"""
+    from app.service.exceptions import MetaExtractionError
+    from app.service.meta_extractor import extractor_pool
+
+    async def failing_run(*args, **kwargs):
+        raise MetaExtractionError("Таймаут")
+
+    monkeypatch.setattr(extractor_pool, "run", failing_run)
+    with open("./tests/test_files/sample3.pdf", "rb") as f:
+        content = f.read()
+    response = await client.post("/files/stream", content=content)
+    assert response.status_code == 201
+    uid = response.json()["fileUID"]
+    response = await client.post("/files/batch", json={"uids": [uid]})
+    assert response.json()["files"][0]["extension"] == "pdf"
+    response = await client.get(f"/files/{uid}")
+    assert response.content == content
+
+
 @pytest.mark.asyncio
 async def test_upload_stream_png(client):
     """Тест отправки потоком PNG"""
@@ -143,3 +202,657 @@ async def test_upload_get_files(client):
             f"/files/{uid}"
         )
         assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_replication_state(client):
+    """Тест наличия задачи репликации для всех файлов"""
+    for uid in UPLOADED_FILES_UID:
+        response = await client.get(
+            f"/files/{uid}/replication"
+        )
+        assert response.status_code == 200
+        assert response.json()["state"] in (
+            "pending", "in_progress", "done", "failed"
+        )
+    response = await client.get(f"/files/{uuid.uuid4()}/replication")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_upload_duplicate(client):
+    """Тест дедупликации одинаковых файлов"""
+    uids = []
+    for _ in range(2):
+        response = await client.post(
+            "/files/", files={"file": open("./tests/test_files/sample3.pdf", "rb")}
+        )
+        assert response.status_code == 201
+        uids.append(response.json()["fileUID"])
+    assert uids[0] != uids[1]
+
+    contents = []
+    for uid in uids:
+        response = await client.get(f"/files/{uid}")
+        assert response.status_code == 200
+        contents.append(response.content)
+    assert contents[0] == contents[1]
+    assert len(contents[0]) == os.path.getsize("./tests/test_files/sample3.pdf")
+
+
+@pytest.mark.asyncio
+async def test_get_unknown_file(client):
+    """Тест несуществующего UID и статистики кэша путей"""
+    uid = uuid.uuid4()
+    for _ in range(2):
+        response = await client.get(f"/files/{uid}")
+        assert response.status_code == 404
+    response = await client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["path_cache"]["hits"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_get_files_batch(client):
+    """Тест пакетного получения метаданных"""
+    unknown = str(uuid.uuid4())
+    response = await client.post(
+        "/files/batch", json={"uids": UPLOADED_FILES_UID + [unknown]}
+    )
+    assert response.status_code == 200
+    response = response.json()
+    assert {file["uid"] for file in response["files"]} == set(UPLOADED_FILES_UID)
+    assert all(file["local"] for file in response["files"])
+    assert response["notFound"] == [unknown]
+
+
+@pytest.mark.asyncio
+async def test_files_meta(client):
+    """Тест меты из заголовков файлов"""
+    response = await client.post(
+        "/files/batch", json={"uids": UPLOADED_FILES_UID}
+    )
+    metas = [file["meta"] for file in response.json()["files"]]
+    assert {
+        "duration": 13.346,
+        "video": {"codec": "V_MPEG4/ISO/AVC", "width": 960, "height": 540},
+    } in metas
+    assert {"width": 1280, "height": 853} in metas
+    assert any(meta and meta.get("pages") == 20 for meta in metas)
+    assert any(meta and meta.get("author") == "train11" for meta in metas)
+
+
+@pytest.mark.asyncio
+async def test_head_file(client):
+    """Тест HEAD запроса к файлу"""
+    for uid in UPLOADED_FILES_UID:
+        response = await client.head(f"/files/{uid}")
+        assert response.status_code == 200
+        assert int(response.headers["content-length"]) > 0
+        assert response.headers["x-file-location"] == "local"
+    response = await client.head(f"/files/{uuid.uuid4()}")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_get_file_range(client):
+    """Тест частичной загрузки файла"""
+    uid = UPLOADED_FILES_UID[0]
+    full = await client.get(f"/files/{uid}")
+    size = len(full.content)
+
+    response = await client.get(f"/files/{uid}", headers={"range": "bytes=0-99"})
+    assert response.status_code == 206
+    assert response.content == full.content[:100]
+    assert response.headers["content-range"] == f"bytes 0-99/{size}"
+
+    response = await client.get(f"/files/{uid}", headers={"range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.content == full.content[-10:]
+
+    response = await client.get(
+        f"/files/{uid}", headers={"range": f"bytes={size}-"}
+    )
+    assert response.status_code == 416
+
+
+@pytest.mark.asyncio
+async def test_get_file_not_modified(client):
+    """Тест условного запроса файла по ETag"""
+    uid = UPLOADED_FILES_UID[0]
+    response = await client.get(f"/files/{uid}")
+    etag = response.headers["etag"]
+    assert "immutable" in response.headers["cache-control"]
+
+    response = await client.get(f"/files/{uid}", headers={"if-none-match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = await client.head(f"/files/{uid}")
+    assert response.headers["etag"] == etag
+
+
+@pytest.mark.asyncio
+async def test_blob_cache(client):
+    """Тест отдачи популярного файла из кэша в памяти"""
+    uid = UPLOADED_FILES_UID[0]
+    contents = []
+    for _ in range(3):
+        response = await client.get(f"/files/{uid}")
+        assert response.status_code == 200
+        contents.append(response.content)
+    assert contents[0] == contents[1] == contents[2]
+
+    response = await client.get(f"/files/{uid}", headers={"range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.content == contents[0][:10]
+
+    stats = (await client.get("/health")).json()["blob_cache"]
+    assert stats["size"] >= 1
+    assert stats["hits"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_compressed_storage(client, monkeypatch):
+    """Тест хранения сжатого файла и выбора Content-Encoding"""
+    from app.settings import settings
+    monkeypatch.setattr(settings, "STORAGE_CODEC", "gzip")
+    content = b"compressible line of text\n" * 10000 + uuid.uuid4().bytes
+    response = await client.post(
+        "/files/", files={"file": ("notes.txt", content, "text/plain")}
+    )
+    assert response.status_code == 201
+    uid = response.json()["fileUID"]
+
+    response = await client.post("/files/batch", json={"uids": [uid]})
+    assert response.json()["files"][0]["encoding"] == "gzip"
+
+    response = await client.get(
+        f"/files/{uid}", headers={"accept-encoding": "gzip"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < len(content)
+    assert response.content == content
+
+    response = await client.get(
+        f"/files/{uid}", headers={"accept-encoding": "identity"}
+    )
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-type"].startswith("text/plain")
+    assert response.content == content
+
+    response = await client.head(
+        f"/files/{uid}", headers={"accept-encoding": "gzip"}
+    )
+    get_response = await client.get(
+        f"/files/{uid}", headers={"accept-encoding": "gzip"}
+    )
+    for header in ("etag", "vary", "content-encoding", "content-length"):
+        assert response.headers[header] == get_response.headers[header]
+    response = await client.head(
+        f"/files/{uid}", headers={"accept-encoding": "identity"}
+    )
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "accept-encoding"
+    assert response.headers["etag"] != get_response.headers["etag"]
+    assert int(response.headers["content-length"]) == len(content)
+
+
+@pytest.mark.asyncio
+async def test_image_derivative(client):
+    """Тест уменьшенной копии изображения"""
+    from io import BytesIO
+    from PIL import Image
+    response = await client.post(
+        "/files/", files={"file": open("./tests/test_files/sample_1920×1280.jpg", "rb")}
+    )
+    uid = response.json()["fileUID"]
+
+    url = f"/files/{uid}/derivative?width=200&format=webp"
+    responses = await asyncio.gather(*(client.get(url) for _ in range(3)))
+    for response in responses:
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/webp"
+    image = Image.open(BytesIO(responses[0].content))
+    assert image.size == (200, 133)
+    assert responses[0].content == responses[2].content
+
+    response = await client.get(url, headers={"if-none-match": responses[0].headers["etag"]})
+    assert response.status_code == 304
+
+    response = await client.get(f"/files/{UPLOADED_FILES_UID[0]}/derivative?width=200")
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_metrics(client):
+    """Тест метрик в формате Prometheus"""
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'files_ingest_stage_seconds_count{stage="db"}' in text
+    assert 'files_download_seconds_bucket{path="local",le="+Inf"}' in text
+    assert 'files_bytes_received_total{api="files"}' in text
+    assert "files_db_pool_wait_seconds_count" in text
+    assert 'files_backlog{queue="replication_pending"}' in text
+
+
+def test_log_rate_limit():
+    """Тест ограничения частоты одинаковых сообщений лога"""
+    from app.utils.log import RateLimitFilter
+    limit = RateLimitFilter(rate=0.001, burst=2)
+
+    def record(msg, level=logging.INFO):
+        return logging.LogRecord("test", level, __file__, 0, msg, (1,), None)
+
+    assert [limit.filter(record("Файл %s")) for _ in range(4)] == [
+        True, True, False, False
+    ]
+    assert limit.filter(record("Другой файл %s"))
+    assert limit.filter(record("Файл %s", logging.ERROR))
+    assert limit.dropped == 2
+
+
+@pytest.mark.asyncio
+async def test_presigned_without_cloud(client):
+    """Тест загрузки напрямую в облако без настроенного облака"""
+    response = await client.post(
+        "/files/presigned", json={"filename": "a.pdf", "size": 10}
+    )
+    assert response.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_presigned_upload(client, s3):
+    """Тест загрузки файла напрямую в облако по подписанной ссылке"""
+    with open("./tests/test_files/sample3.pdf", "rb") as f:
+        content = f.read()
+    response = await client.post(
+        "/files/presigned",
+        json={"filename": "sample3.pdf", "size": len(content)}
+    )
+    assert response.status_code == 201
+    upload = response.json()
+    assert upload["key"] == f"{upload['fileUID']}.pdf"
+
+    async with httpx.AsyncClient() as s3_client:
+        response = await s3_client.put(upload["url"], content=content)
+        assert response.status_code == 200
+
+    response = await client.post("/files/presigned/complete", json={
+        "uid": upload["fileUID"], "key": upload["key"],
+    })
+    assert response.status_code == 201
+    assert response.json()["size"] == len(content)
+
+    response = await client.get(f"/files/{upload['fileUID']}/replication")
+    assert response.status_code == 200
+    assert response.json()["state"] == "done"
+
+    response = await client.get(f"/files/{upload['fileUID']}/url")
+    assert response.status_code == 200
+    async with httpx.AsyncClient() as s3_client:
+        response = await s3_client.get(response.json()["url"])
+        assert response.content == content
+
+    response = await client.post("/files/presigned/complete", json={
+        "uid": str(uuid.uuid4()), "key": upload["key"],
+    })
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_presigned_multipart_upload(client, s3):
+    """Тест multipart загрузки файла напрямую в облако"""
+    with open("./tests/test_files/sample2.docx", "rb") as f:
+        content = f.read()
+    response = await client.post("/files/presigned", json={
+        "filename": "sample2.docx", "size": len(content),
+        "method": "multipart",
+    })
+    assert response.status_code == 201
+    upload = response.json()
+
+    parts = []
+    async with httpx.AsyncClient() as s3_client:
+        for part in upload["parts"]:
+            start = (part["partNumber"] - 1) * upload["partSize"]
+            response = await s3_client.put(
+                part["url"], content=content[start:start + upload["partSize"]]
+            )
+            assert response.status_code == 200
+            parts.append({
+                "part_number": part["partNumber"],
+                "etag": response.headers["etag"],
+            })
+
+    response = await client.post("/files/presigned/complete", json={
+        "uid": upload["fileUID"], "key": upload["key"],
+        "upload_id": upload["uploadId"], "parts": parts,
+    })
+    assert response.status_code == 201
+    assert response.json()["size"] == len(content)
+
+    response = await client.head(f"/files/{upload['fileUID']}")
+    assert response.headers["x-file-location"] == "cloud"
+
+
+@pytest.mark.asyncio
+async def test_upload_by_parts(client):
+    """Тест загрузки файла по частям в обратном порядке"""
+    with open("./tests/test_files/sample_1280×853.png", "rb") as f:
+        content = f.read()
+    part_size = 64 * 1024
+    response = await client.post("/uploads/", json={
+        "filename": "sample.png", "size": len(content), "part_size": part_size,
+    })
+    assert response.status_code == 201
+    upload = response.json()
+    assert upload["partsCount"] > 1
+
+    response = await client.post(f"/uploads/{upload['uploadId']}/complete")
+    assert response.status_code == 409
+
+    for number in reversed(range(1, upload["partsCount"] + 1)):
+        start = (number - 1) * part_size
+        response = await client.put(
+            f"/uploads/{upload['uploadId']}/parts/{number}",
+            content=content[start:start + part_size]
+        )
+        assert response.status_code == 200
+        if number == 2:
+            state = (await client.get(f"/uploads/{upload['uploadId']}")).json()
+            assert state["receivedRanges"] == [[part_size, len(content)]]
+
+    response = await client.put(
+        f"/uploads/{upload['uploadId']}/parts/1", content=content[:10]
+    )
+    assert response.status_code == 400
+    response = await client.post(f"/uploads/{upload['uploadId']}/complete")
+    assert response.status_code == 409
+    response = await client.put(
+        f"/uploads/{upload['uploadId']}/parts/1", content=content[:part_size]
+    )
+    assert response.status_code == 200
+
+    response = await client.post(f"/uploads/{upload['uploadId']}/complete")
+    assert response.status_code == 201
+    uid = response.json()["fileUID"]
+    response = await client.post(f"/uploads/{upload['uploadId']}/complete")
+    assert response.json()["fileUID"] == uid
+
+    response = await client.get(f"/files/{uid}")
+    assert response.status_code == 200
+    assert response.content == content
+
+
+@pytest.mark.asyncio
+async def test_upload_abort_during_part(client):
+    """Тест отмены и завершения загрузки во время записи части"""
+    part_size = 64 * 1024
+    content = os.urandom(2 * part_size)
+    response = await client.post("/uploads/", json={
+        "filename": "race.bin", "size": len(content), "part_size": part_size,
+    })
+    upload_id = response.json()["uploadId"]
+    response = await client.put(
+        f"/uploads/{upload_id}/parts/2", content=content[part_size:]
+    )
+    assert response.status_code == 200
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def slow_part():
+        yield content[:1000]
+        started.set()
+        await release.wait()
+        yield content[1000:part_size]
+
+    write = asyncio.create_task(
+        client.put(f"/uploads/{upload_id}/parts/1", content=slow_part())
+    )
+    await started.wait()
+    response = await client.post(f"/uploads/{upload_id}/complete")
+    assert response.status_code == 409
+    response = await client.delete(f"/uploads/{upload_id}")
+    assert response.status_code == 204
+    release.set()
+    assert (await write).status_code == 404
+
+    response = await client.put(
+        f"/uploads/{upload_id}/parts/2", content=content[part_size:]
+    )
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_upload_parallel_parts(client):
+    """Тест параллельной загрузки частей"""
+    part_size = 64 * 1024
+    content = os.urandom(50 * part_size)
+    response = await client.post("/uploads/", json={
+        "filename": "parallel.bin", "size": len(content),
+        "part_size": part_size,
+    })
+    upload_id = response.json()["uploadId"]
+    responses = await asyncio.gather(*(
+        client.put(
+            f"/uploads/{upload_id}/parts/{number + 1}",
+            content=content[number * part_size:(number + 1) * part_size]
+        )
+        for number in range(50)
+    ))
+    assert {response.status_code for response in responses} == {200}
+
+    response = await client.post(f"/uploads/{upload_id}/complete")
+    assert response.status_code == 201
+    response = await client.get(f"/files/{response.json()['fileUID']}")
+    assert response.content == content
+
+
+@pytest.mark.asyncio
+async def test_upload_complete_retry(client, monkeypatch):
+    """Тест повторного завершения загрузки после ошибки сохранения"""
+    from app.service.file_service import FileService
+
+    content = os.urandom(1000)
+    response = await client.post("/uploads/", json={
+        "filename": "retry.bin", "size": len(content),
+    })
+    upload_id = response.json()["uploadId"]
+    response = await client.put(f"/uploads/{upload_id}/parts/1", content=content)
+    assert response.status_code == 200
+
+    async def failing_save(*args, **kwargs):
+        raise OSError("Нет места на диске")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(FileService, "create_new_file_from_temp", failing_save)
+        response = await client.post(f"/uploads/{upload_id}/complete")
+        assert response.status_code == 500
+    assert (await client.get(f"/uploads/{upload_id}")).json()["state"] == "open"
+
+    response = await client.post(f"/uploads/{upload_id}/complete")
+    assert response.status_code == 201
+    response = await client.get(f"/files/{response.json()['fileUID']}")
+    assert response.content == content
+
+
+@pytest.mark.asyncio
+async def test_static_hidden_files(client):
+    """Тест запрета отдачи скрытых файлов из ./static"""
+    os.makedirs("./static/.hidden", exist_ok=True)
+    with open("./static/.hidden/secret.txt", "w") as f:
+        f.write("secret")
+    try:
+        response = await client.get("/static/.hidden/secret.txt")
+        assert response.status_code == 404
+    finally:
+        os.remove("./static/.hidden/secret.txt")
+
+
+@pytest.mark.asyncio
+async def test_extractor_pool_timeout(monkeypatch):
+    """Тест счетчика задач пула после таймаута"""
+    import time
+
+    from app.service.exceptions import MetaExtractionError
+    from app.service.meta_extractor import ExtractorPool
+    from app.settings import settings
+
+    monkeypatch.setattr(settings, "META_EXECUTOR", "thread")
+    pool = ExtractorPool()
+    try:
+        with pytest.raises(MetaExtractionError):
+            await pool.run(time.sleep, 0.5, timeout=0.1)
+        # Поток еще занят задачей, место в очереди не освободилось
+        assert pool.pending == 1
+        await asyncio.sleep(0.6)
+        assert pool.pending == 0
+        assert await pool.run(sum, [1, 2]) == 3
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_extractor_pool_timeout_keeps_other_jobs(monkeypatch):
+    """Тест таймаута задачи пула process во время другой задачи"""
+    import time
+
+    from app.service.exceptions import MetaExtractionError
+    from app.service.meta_extractor import ExtractorPool
+    from app.settings import settings
+
+    monkeypatch.setattr(settings, "META_EXECUTOR", "process")
+    monkeypatch.setattr(settings, "META_WORKERS", 2)
+    pool = ExtractorPool()
+    try:
+        other = asyncio.create_task(pool.run(time.sleep, 3, timeout=20))
+        with pytest.raises(MetaExtractionError):
+            await pool.run(time.sleep, 60, timeout=2)
+        # Новые задачи идут в новый пул, начатая завершается в старом
+        assert await pool.run(sum, [1, 2]) == 3
+        assert await other is None
+        # Старый пул остановлен вместе с зависшей задачей
+        for _ in range(50):
+            if pool.pending == 0:
+                break
+            await asyncio.sleep(0.1)
+        assert pool.pending == 0
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_retention(client):
+    """Тест очистки устаревших файлов"""
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import text
+
+    from app.repository.models import month_start
+    from app.repository.repository import (
+        DerivativeRepository, FileRepository
+    )
+    from app.repository.session import async_session
+    from app.service.local_storage import local_storage
+    from app.service.retention_service import RetentionService
+    from app.utils.uid import utc_now
+
+    shared, single = os.urandom(4096), os.urandom(4096)
+    uids = []
+    for content in (shared, shared, single):
+        response = await client.post(
+            "/files/", files={"file": ("old.bin", content)}
+        )
+        assert response.status_code == 201
+        uids.append(uuid.UUID(response.json()["fileUID"]))
+    repository = FileRepository(async_session)
+    rows = {
+        row["uid"]: row for row in await repository.get_files_metadata(uids)
+    }
+    shared_path = rows[uids[0]]["local_path"]
+    single_path = rows[uids[2]]["local_path"]
+    single_hash = rows[uids[2]]["content_hash"]
+    derivative_path = local_storage.blob_path(f"{single_hash}_64x64.webp")
+    with open(derivative_path, "wb") as f:
+        f.write(b"preview")
+    await DerivativeRepository(async_session).save_derivative(
+        single_hash, f"{single_hash}_64x64.webp", derivative_path, 7
+    )
+
+    # Переносим строки дубля и единственной копии на 100 дней назад
+    old = month_start((utc_now() - timedelta(days=100)).date())
+    created_at = datetime.combine(old, datetime.min.time()) + timedelta(days=1)
+    async with async_session() as session:
+        await session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS files_p{old:%Y%m} PARTITION OF files "
+            f"FOR VALUES FROM ('{old}') TO ('{month_start(old, 1)}')"
+        ))
+        await session.execute(
+            text("UPDATE files SET created_at = :created_at WHERE uid = :uid"),
+            [{"created_at": created_at, "uid": uid} for uid in (uids[0], uids[2])]
+        )
+        await session.commit()
+
+    stats = await RetentionService(None).run(30, 100, 0)
+    assert stats["rows"] == 2
+    assert stats["files"] == 1
+    assert stats["partitions"] >= 1
+    # Содержимое дубля еще нужно свежей строке
+    assert os.path.exists(shared_path)
+    assert not os.path.exists(single_path)
+    assert not os.path.exists(derivative_path)
+    found = {
+        row["uid"] for row in await repository.get_files_metadata(uids)
+    }
+    assert found == {uids[1]}
+    response = await client.get(f"/files/{uids[1]}")
+    assert response.content == shared
+
+    stats = await RetentionService(None).run(30, 100, 0)
+    assert stats == {"rows": 0, "files": 0, "partitions": 0, "uploads": 0}
+    assert os.path.exists(shared_path)
+
+
+@pytest.mark.asyncio
+async def test_layout_migration(client):
+    """Тест переноса файла из корня ./static во вложенные папки"""
+    from sqlalchemy import text
+
+    from app.repository.repository import FileRepository
+    from app.repository.session import async_session
+    from app.service.layout_service import LayoutMigrationService
+    from app.service.local_storage import STATIC_DIR
+
+    content = os.urandom(4096)
+    response = await client.post("/files/", files={"file": ("flat.bin", content)})
+    assert response.status_code == 201
+    uid = uuid.UUID(response.json()["fileUID"])
+    repository = FileRepository(async_session)
+    sharded_path = (await repository.get_files_metadata([uid]))[0]["local_path"]
+    flat_path = f"{STATIC_DIR}/{os.path.basename(sharded_path)}"
+    assert sharded_path != flat_path
+
+    # Файл и строка как до вложенных папок
+    os.rename(sharded_path, flat_path)
+    async with async_session() as session:
+        await session.execute(
+            text("UPDATE files SET local_path = :path WHERE uid = :uid"),
+            {"path": flat_path, "uid": uid}
+        )
+        await session.commit()
+
+    stats = await LayoutMigrationService().run(100, 0)
+    assert stats == {"rows": 1, "files": 1, "missing": 0}
+    row = (await repository.get_files_metadata([uid]))[0]
+    assert row["local_path"] == sharded_path
+    assert os.path.exists(sharded_path)
+    assert not os.path.exists(flat_path)
+    response = await client.get(f"/files/{uid}")
+    assert response.content == content
+
+    stats = await LayoutMigrationService().run(100, 0)
+    assert stats == {"rows": 0, "files": 0, "missing": 0}